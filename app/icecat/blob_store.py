@@ -0,0 +1,224 @@
+from threading import Lock
+import abc
+import asyncio
+import mmap
+import os
+import shutil
+from dotenv import load_dotenv
+import gcsfs
+
+load_dotenv()
+
+'''
+Blob storage for the reference lists, product XMLs and mixin schemas: Google Cloud Storage or a local directory
+'''
+
+
+class BlobStore(abc.ABC):
+    """
+    open / exists / list / write on gs://bucket/name paths.
+    Callers keep building gs:// paths, the store decides where they live.
+    """
+
+    @abc.abstractmethod
+    def open(self, path, mode='rb'):
+        pass
+
+    @abc.abstractmethod
+    def exists(self, path):
+        pass
+
+    @abc.abstractmethod
+    def list(self, path, detail=False):
+        """
+        Returns the paths under `path`, with detail { name, type, size, mtime } dicts instead.
+        Raises FileNotFoundError when `path` does not exist.
+        """
+
+    @abc.abstractmethod
+    def write(self, path, data):
+        pass
+
+    @abc.abstractmethod
+    def rm(self, path):
+        pass
+
+    @abc.abstractmethod
+    def version(self, path):
+        """
+        Returns a string that changes whenever the object at `path` is replaced, e.g. its GCS generation.
+        Raises FileNotFoundError when `path` does not exist.
+        """
+
+    def invalidate_cache(self, path=None):
+        pass
+
+    async def write_async(self, path, data, executor=None):
+        """
+        write() from a coroutine, in `executor` unless the store has a native async client
+        """
+        await asyncio.get_running_loop().run_in_executor(executor, self.write, path, data)
+
+    async def aclose(self):
+        """
+        Release what write_async() opened for the running event loop
+        """
+        pass
+
+
+class GCSBlobStore(BlobStore):
+    """
+    Google Cloud Storage through one gcsfs.GCSFileSystem per process, so its authorized session and
+    connection pool are reused by every caller instead of being set up again for each parse.
+    :param project: Google Cloud project
+    """
+
+    def __init__(self, project="icecat-demo"):
+        self.project = project
+        self.lock = Lock()
+        self._file_system = None
+        self._pid = None
+        self._async_file_systems = {}
+
+    @property
+    def file_system(self):
+        # the gcsfs session does not survive a fork, a child process gets its own
+        if self._file_system is None or self._pid != os.getpid():
+            with self.lock:
+                if self._file_system is None or self._pid != os.getpid():
+                    self._file_system = gcsfs.GCSFileSystem(project=self.project)
+                    self._pid = os.getpid()
+        return self._file_system
+
+    def open(self, path, mode='rb'):
+        return self.file_system.open(path, mode)
+
+    def exists(self, path):
+        return self.file_system.exists(path)
+
+    def list(self, path, detail=False):
+        return self.file_system.ls(path, detail=detail, refresh=True)
+
+    def write(self, path, data):
+        self.file_system.pipe_file(path, data)
+
+    def rm(self, path):
+        self.file_system.rm(path)
+
+    def version(self, path):
+        self.file_system.invalidate_cache(path)
+        info = self.file_system.info(path)
+        return str(info.get('generation') or info.get('etag') or info.get('md5Hash'))
+
+    def invalidate_cache(self, path=None):
+        self.file_system.invalidate_cache(path)
+
+    def _async_file_system(self):
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            file_system = self._async_file_systems.get(loop)
+            if file_system is None:
+                file_system = gcsfs.GCSFileSystem(project=self.project, asynchronous=True, skip_instance_cache=True)
+                self._async_file_systems[loop] = file_system
+        return file_system
+
+    async def write_async(self, path, data, executor=None):
+        await self._async_file_system()._pipe_file(path, data)
+
+    async def aclose(self):
+        with self.lock:
+            file_system = self._async_file_systems.pop(asyncio.get_running_loop(), None)
+        session = getattr(file_system, "_session", None)
+        if session is not None and not session.closed:
+            await session.close()
+
+
+class LocalBlobStore(BlobStore):
+    """
+    A local directory standing in for the buckets: gs://<bucket>/<name> is <root>/<bucket>/<name>,
+    other paths are used as they are. Large files opened for reading are memory mapped, small ones
+    (a product XML) are read through a plain buffered file, mapping them costs more than it saves.
+    :param root: directory holding one sub directory per bucket
+    :param mmap_min_size: size in bytes from which files are memory mapped, None to never map them
+    """
+
+    def __init__(self, root=None, mmap_min_size=1 << 20):
+        self.root = root or os.environ.get("BLOB_STORE_PATH", "_data/blobs")
+        self.mmap_min_size = mmap_min_size
+
+    def local_path(self, path):
+        if path.startswith("gs://"):
+            return os.path.join(self.root, path[len("gs://"):])
+        return path
+
+    def open(self, path, mode='rb'):
+        local_path = self.local_path(path)
+        if 'r' in mode:
+            if self.mmap_min_size is not None and 'b' in mode and '+' not in mode:
+                with open(local_path, 'rb') as f:
+                    size = os.fstat(f.fileno()).st_size
+                    if size and size >= self.mmap_min_size:
+                        # mmap objects read, seek and close like a file
+                        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            return open(local_path, mode)
+        os.makedirs(os.path.dirname(local_path) or ".", exist_ok=True)
+        return open(local_path, mode)
+
+    def exists(self, path):
+        return os.path.exists(self.local_path(path))
+
+    def list(self, path, detail=False):
+        path = path.rstrip("/")
+        local_path = self.local_path(path)
+        names = sorted(os.listdir(local_path))
+        if not detail:
+            return [path + "/" + name for name in names]
+        infos = []
+        for name in names:
+            stat = os.stat(os.path.join(local_path, name))
+            infos.append({
+                'name' : path + "/" + name,
+                'type' : 'directory' if os.path.isdir(os.path.join(local_path, name)) else 'file',
+                'size' : stat.st_size,
+                'mtime' : stat.st_mtime,
+            })
+        return infos
+
+    def write(self, path, data):
+        local_path = self.local_path(path)
+        os.makedirs(os.path.dirname(local_path) or ".", exist_ok=True)
+        # write then rename, a reader never sees half a file
+        temp_path = local_path + ".part"
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, local_path)
+
+    def rm(self, path):
+        local_path = self.local_path(path)
+        if os.path.isdir(local_path):
+            shutil.rmtree(local_path)
+        else:
+            os.remove(local_path)
+
+    def version(self, path):
+        stat = os.stat(self.local_path(path))
+        return "{}-{}".format(stat.st_mtime_ns, stat.st_size)
+
+
+_store = None
+_store_lock = Lock()
+
+
+def get_blob_store():
+    """
+    Return the process wide blob store selected by the BLOB_STORE env variable (gcs or local)
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if os.environ.get("BLOB_STORE", "gcs") == "local":
+                    _store = LocalBlobStore()
+                else:
+                    _store = GCSBlobStore()
+    return _store
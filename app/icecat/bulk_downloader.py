@@ -1,33 +1,54 @@
+import aiohttp
+import asyncio
+import calendar
+import collections
+import concurrent.futures
+import gzip
 import logging
 import os
 import queue
+import random
 import sys
 import time
-from threading import Thread
-from time import time
+from datetime import datetime
+from threading import Lock, Thread
+from time import sleep, time
+from email.utils import formatdate
 from dotenv import load_dotenv
 import progressbar
 import requests
 from google.cloud import storage
-import gcsfs
+from app.icecat import blob_store
 
 load_dotenv()
 
+# seconds, upper bound of the jittered retry delay
+MAX_BACKOFF = 30
+# gzip, or none to save the product XMLs as they are downloaded
+PRODUCT_XML_COMPRESSION = os.environ.get("PRODUCT_XML_COMPRESSION", "gzip")
+
 class FetchURLs(object):
     """
     Download and save a list of URLs
     using parallel connections.  A separate session is maintained for each
-    download thread.     If throttling is detected (broken connections)
-    the thread is terminated in order to reduce the load on the web serve.
-    If a local file already exists for a given URL, that URL is skipped.
-    There is no check currently if remote document is     newer than the
-    local file.     If the URL does not end with a file name fetchURLs
+    download thread.     If throttling is detected (broken connections, 429 or 5xx)
+    the thread backs off with a jittered delay and the URL is queued again, up to `retries` times.
+    If a file already exists in the bucket for a given URL, that URL is skipped
+    unless `updated` says the product changed after the file was saved.
+    If the URL does not end with a file name fetchURLs
     will generate a default filename in the format <website>.index.html
     :param urls: A list of absolute URLs to fetch
     :param data_dir:  Directory to save files in
     :param connections: Number of simultanious download threads
     :param auth: Username and password touple, if needed for website authentication
     :param log: An optional logging.getLogger() instance
+    :param manifest: Optional local ProductXMLManifest file, defaults to the PRODUCT_XML_MANIFEST env variable
+    :param retries: Extra attempts for a throttled URL before it is reported in failed_urls
+    :param updated: Optional dict file name -> catalog Updated (YYYYMMDDhhmmss), cached files saved before it are fetched again
+    :param store: Optional blob_store.BlobStore the files are saved to, defaults to get_blob_store()
+    :param compression: gzip to save <name>.gz files, none to save them as they are, defaults to PRODUCT_XML_COMPRESSION
+    :param on_result: Optional callable(url, data) called from the download threads with the body of every fetched URL
+                      once it is saved, and with None for a URL whose file was already in the bucket
     This class is usually called from IceCat
     """
 
@@ -40,21 +61,48 @@ class FetchURLs(object):
                  ],
                  data_dir='_data/product_xml/',
                  auth=('goober@aol.com', 'password'),
-                 connections=5):
-
-        self.urls = queue.Queue()
-
-        for i in urls:
-            self.urls.put(i)
+                 connections=5,
+                 manifest=None,
+                 retries=6,
+                 updated=None,
+                 store=None,
+                 compression=None,
+                 on_result=None):
 
         self.data_dir = data_dir
         self.connections = connections
+        self.retries = retries
+        self.attempts = {}
+        self.failed_urls = []
         self.auth = auth
         self.log = log
-        self.gcs_file_system = gcsfs.GCSFileSystem(project="icecat-demo")
+        self.compression = PRODUCT_XML_COMPRESSION if compression is None else compression
+        self.on_result = on_result
+        self.gcs_file_system = store or blob_store.get_blob_store()
         if not log:
             self.log = logging.getLogger()
 
+        # one listing of the bucket instead of an exists() round trip per URL
+        self.manifest = ProductXMLManifest(self.gcs_file_system, "gs://" + os.environ.get("GOOGLE_PRODUCT_BUCKET"),
+                                           manifest or os.environ.get("PRODUCT_XML_MANIFEST"), log=self.log)
+        self.urls = queue.Queue()
+        self.skipped_count = 0
+        self.stale_count = 0
+        updated = updated or {}
+        for i in urls:
+            name = os.path.basename(i) or '.index.html'
+            stored_name = product_xml_name(name, self.compression)
+            if self.manifest.is_fresh(stored_name, updated.get(name)):
+                self.skipped_count += 1
+                if self.on_result:
+                    self.on_result(i, None)
+            else:
+                if stored_name in self.manifest:
+                    self.stale_count += 1
+                self.urls.put(i)
+        if self.stale_count:
+            self.log.info("{} cached product files are older than their catalog Updated and are fetched again".format(self.stale_count))
+
         logging.getLogger("requests").setLevel(logging.WARNING)
         # self.log.setLevel(logging.WARNING)
 
@@ -68,47 +116,56 @@ class FetchURLs(object):
 
         while True:
             url = self.urls.get()
-            self.bar.update(self.success_count)
-            bn = os.path.basename(url)
-            if not bn:
-                gcs_file_path = "gs://" + os.environ.get("GOOGLE_PRODUCT_BUCKET")+ "/" + '.index.html'
-            else:            
-                gcs_file_path = "gs://" + os.environ.get("GOOGLE_PRODUCT_BUCKET")+ "/"+ bn
-                
-            if self.gcs_file_system.exists(gcs_file_path): 
-                self.urls.task_done()
-             
-                self.success_count += 1
-                continue
-
             try:
-                res = s.get(url)
-            except:
-                self.log.warning("Bad request {} for url: {}".format(sys.exc_info(), url))
-                # put item back into queue
-                self.urls.put(url)
+                self._fetch(s, url)
+            except Exception as ex:
+                # a worker that dies would leave the URL unfinished and urls.join() waiting forever
+                self.log.error("Could not save url: {}: {}".format(url, repr(ex)))
+                self.failed_urls.append(url)
+            finally:
                 self.urls.task_done()
-                # this could be due to throttling, exit thread
-                break
 
-            if 200 <= res.status_code < 299:
-                self.success_count += 1
-                self.log.debug("Fetched {}".format(url))
+    def _fetch(self, s, url):
+        self.bar.update(self.success_count)
+        bn = product_xml_name(os.path.basename(url) or '.index.html', self.compression)
+        gcs_file_path = "gs://" + os.environ.get("GOOGLE_PRODUCT_BUCKET")+ "/"+ bn
+
+        try:
+            res = s.get(url)
+            status_code = res.status_code
+        except:
+            self.log.warning("Bad request {} for url: {}".format(sys.exc_info(), url))
+            status_code = None
+
+        if status_code is None or status_code == 429 or status_code >= 500:
+            # this could be due to throttling: keep the thread, back off and put the item back into the queue
+            attempt = self.attempts.get(url, 0)
+            if attempt < self.retries:
+                self.attempts[url] = attempt + 1
+                sleep(random.uniform(0, min(MAX_BACKOFF, 2 ** attempt)))
+                self.urls.put(url)
             else:
-                self.log.warning("Bad status code: {} for url: {}".format(res.status_code, url))
-                self.urls.task_done()
-                continue
+                self.log.warning("Giving up on url: {} after {} attempts".format(url, attempt + 1))
+                self.failed_urls.append(url)
+            return
 
-            with self.gcs_file_system.open(gcs_file_path, 'wb') as f:
-               
-                for chunk in res.iter_content(chunk_size=1024 * 1024):
-                    if chunk:
-                        f.write(chunk)
+        if not 200 <= status_code < 299:
+            self.log.warning("Bad status code: {} for url: {}".format(status_code, url))
+            self.failed_urls.append(url)
+            return
 
-            self.urls.task_done()
+        data = res.content
+        if self.compression == "gzip":
+            data = gzip.compress(data, compresslevel=6)
+        self.gcs_file_system.write(gcs_file_path, data)
+        self.manifest.add(os.path.basename(gcs_file_path))
+        if self.on_result:
+            self.on_result(url, res.content)
+        self.success_count += 1
+        self.log.debug("Fetched {}".format(url))
 
     def _download(self):
-        self.success_count = 0
+        self.success_count = self.skipped_count
 
         start = time()
         for i in range(self.connections):
@@ -116,6 +173,7 @@ class FetchURLs(object):
             t.daemon = True
             t.start()
         self.urls.join()
+        self.manifest.close()
         self.log.info('fetched {} URLs in %0.3fs'.format(self.success_count) % (time() - start))
 
     def get_count(self):
@@ -123,3 +181,440 @@ class FetchURLs(object):
         Returns the number of successfully fetched urls
         """
         return self.success_count
+
+
+class ProductXMLManifest(object):
+    """
+    Names and save times of the files already in a download target, so the downloaders can drop the cached
+    URLs up front instead of checking every file with exists(). The target is listed once per run;
+    with a manifest file the names are read from that file instead and every newly saved name is appended to it.
+    :param file_system: blob_store.BlobStore of the target
+    :param target_dir: gs://bucket or local directory
+    :param manifest: Optional local file with one "name<TAB>saved epoch seconds" line per file, created from a listing when missing
+    :param log: An optional logging.getLogger() instance
+    """
+
+    def __init__(self, file_system, target_dir, manifest=None, log=None):
+        self.log = log or logging.getLogger()
+        self.lock = Lock()
+        self.manifest_file = None
+        start = time()
+        if manifest and os.path.exists(manifest):
+            self.names = {}
+            with open(manifest) as f:
+                for line in f:
+                    name, _, saved = line.strip().partition("\t")
+                    if name:
+                        self.names[name] = float(saved) if saved else None
+            source = manifest
+        else:
+            self.names = self._list(file_system, target_dir)
+            source = target_dir
+            if manifest:
+                with open(manifest, 'w') as f:
+                    f.writelines(self._line(name, saved) for name, saved in sorted(self.names.items()))
+        if manifest:
+            self.manifest_file = open(manifest, 'a')
+        self.log.info("{} cached files listed from {} in %0.3fs".format(len(self.names), source) % (time() - start))
+
+    @staticmethod
+    def _line(name, saved):
+        return name + ("\t%d" % saved if saved is not None else "") + "\n"
+
+    @staticmethod
+    def _list(file_system, target_dir):
+        try:
+            infos = file_system.list(target_dir, detail=True)
+        except FileNotFoundError:
+            return {}
+        return { os.path.basename(info['name']) : _saved_time(info) for info in infos if info.get('type', 'file') == 'file' }
+
+    def __contains__(self, name):
+        return name in self.names
+
+    def __len__(self):
+        return len(self.names)
+
+    def saved_time(self, name):
+        """
+        Returns when the file was saved, in epoch seconds, None when unknown
+        """
+        return self.names.get(name)
+
+    def is_fresh(self, name, updated=None):
+        """
+        True when the file is in the target and was saved after the product was last updated.
+        :param updated: the catalog row's Updated (YYYYMMDDhhmmss), None or "" to only check presence
+        A file with an unknown save time counts as fresh.
+        """
+        if name not in self.names:
+            return False
+        saved = self.names[name]
+        if not updated or saved is None:
+            return True
+        updated = icecat_timestamp(updated)
+        return updated is None or saved >= updated
+
+    def add(self, name, saved=None):
+        saved = time() if saved is None else saved
+        with self.lock:
+            self.names[name] = saved
+            if self.manifest_file:
+                self.manifest_file.write(self._line(name, saved))
+                self.manifest_file.flush()
+
+    def close(self):
+        if self.manifest_file:
+            self.manifest_file.close()
+            self.manifest_file = None
+
+
+def product_xml_name(name, compression=None):
+    """
+    Name the downloaded file `name` (e.g. 123.xml) is saved under in the product bucket
+    :param compression: gzip or none, defaults to PRODUCT_XML_COMPRESSION
+    """
+    compression = PRODUCT_XML_COMPRESSION if compression is None else compression
+    return name + ".gz" if compression == "gzip" else name
+
+
+def icecat_timestamp(updated):
+    """
+    Icecat Updated value (YYYYMMDDhhmmss, UTC) to epoch seconds, None when it is not in that format
+    """
+    try:
+        return calendar.timegm(datetime.strptime(updated[:14], "%Y%m%d%H%M%S").timetuple())
+    except ValueError:
+        return None
+
+
+def _saved_time(info):
+    # local file systems report mtime in epoch seconds, gcsfs a datetime mtime and / or the GCS `updated` string
+    mtime = info.get('mtime')
+    if isinstance(mtime, (int, float)):
+        return float(mtime)
+    if isinstance(mtime, datetime):
+        return mtime.timestamp()
+    updated = info.get('updated')
+    if updated:
+        return datetime.fromisoformat(updated.replace("Z", "+00:00")).timestamp()
+    return None
+
+
+class AIMDLimiter(object):
+    """
+    Additive increase / multiplicative decrease limit on the downloads in flight, for AsyncFetchURLs.
+    Until the first throttled request the limit grows by one per success (slow start), after that by about
+    one per round of `limit` requests. A 429 cuts it by `decrease`; 5xx answers and broken connections do
+    when they are more than `error_threshold` of the recent requests, so a few random server errors do not
+    pin the limit down. Cuts happen at most once per smoothed round trip, a burst counts once.
+    While the latency stays above `latency_tolerance` times the fastest recent one, the limit holds.
+    Create it inside the running event loop.
+    :param start: initial limit
+    :param minimum: lowest limit
+    :param maximum: highest limit
+    :param decrease: factor applied to the limit on throttling
+    :param latency_tolerance: latency / baseline ratio up to which the limit keeps growing
+    :param error_threshold: share of errors among the recent requests that counts as throttling
+    """
+
+    def __init__(self, start, minimum=1, maximum=100, decrease=0.7, latency_tolerance=2.0, error_threshold=0.1):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = float(min(max(start, minimum), maximum))
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        self.error_threshold = error_threshold
+        self.recent = collections.deque(maxlen=50)
+        self.in_flight = 0
+        self.baseline = None
+        self.latency = None
+        self.slow_start = True
+        self.last_decrease = 0
+        self.peak = self.limit
+        self.decreases = 0
+        self.condition = asyncio.Condition()
+
+    async def acquire(self):
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self):
+        async with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    def on_success(self, latency):
+        # the baseline follows the fastest responses and drifts up slowly, so it adapts to a slower server
+        self.baseline = latency if self.baseline is None else min(latency, self.baseline * 1.01)
+        self.latency = latency if self.latency is None else self.latency * 0.9 + latency * 0.1
+        self.recent.append(False)
+        if latency <= self.baseline * self.latency_tolerance:
+            self.limit = min(self.maximum, self.limit + (1.0 if self.slow_start else 1.0 / self.limit))
+            self.peak = max(self.peak, self.limit)
+
+    def on_throttle(self, explicit=True):
+        """
+        :param explicit: True for a 429, False for a 5xx answer or a broken connection
+        """
+        self.recent.append(True)
+        if not explicit and sum(self.recent) <= self.error_threshold * len(self.recent):
+            return
+        self.slow_start = False
+        now = asyncio.get_running_loop().time()
+        if now - self.last_decrease >= (self.latency or 0):
+            self.limit = max(self.minimum, self.limit * self.decrease)
+            self.last_decrease = now
+            self.decreases += 1
+
+
+class AsyncFetchURLs(object):
+    """
+    Download and save a list of URLs on one asyncio event loop instead of one thread per connection.
+    The downloads in flight follow an AIMDLimiter between min_connections and `connections`, writes to the
+    target are bounded by an `uploads` semaphore. Throttled URLs (429, 5xx, broken connections) are retried
+    with a jittered exponential delay; a URL that still fails is listed in failed_urls, none is dropped.
+    As with FetchURLs, a URL whose file is already in the target is skipped.
+    :param urls: A list of absolute URLs to fetch
+    :param target_dir: gs://bucket or local directory the files are saved in, defaults to gs://$GOOGLE_PRODUCT_BUCKET
+    :param connections: Maximum number of simultaneous downloads
+    :param min_connections: Lowest number of simultaneous downloads the limiter backs off to
+    :param uploads: Number of simultaneous writes, defaults to connections
+    :param auth: Username and password touple, if needed for website authentication
+    :param retries: Extra attempts for a throttled URL
+    :param on_progress: Optional callable(metrics) called after every URL with the get_metrics() dict
+    :param manifest: Optional local ProductXMLManifest file, defaults to the PRODUCT_XML_MANIFEST env variable
+    :param updated: Optional dict file name -> catalog Updated (YYYYMMDDhhmmss), cached files saved before it are fetched again
+    :param revalidate: Also re-request cached files without an Updated value, with If-Modified-Since set to
+                       their save time, so only the changed ones (200 instead of 304) are transferred and written
+    :param store: Optional blob_store.BlobStore the files are saved to, defaults to get_blob_store() for a gs:// target
+                  and a LocalBlobStore for a local directory
+    :param compression: gzip to save <name>.gz files, none to save them as they are, defaults to PRODUCT_XML_COMPRESSION
+    :param on_result: Optional callable(url, data) called on the event loop with the body of every fetched URL once it is
+                      saved, and with None for a URL whose file was already current in the target; keep it short
+    :param log: An optional logging.getLogger() instance
+    """
+
+    def __init__(self,
+                 log=None,
+                 urls=[],
+                 target_dir=None,
+                 auth=None,
+                 connections=100,
+                 min_connections=1,
+                 uploads=None,
+                 retries=6,
+                 on_progress=None,
+                 manifest=None,
+                 updated=None,
+                 revalidate=False,
+                 store=None,
+                 compression=None,
+                 on_result=None):
+
+        self.urls = list(urls)
+        self.target_dir = (target_dir or "gs://" + os.environ.get("GOOGLE_PRODUCT_BUCKET")).rstrip("/")
+        self.connections = connections
+        self.min_connections = min_connections
+        self.uploads = uploads or connections
+        self.auth = auth
+        self.retries = retries
+        self.on_progress = on_progress
+        self.updated = updated or {}
+        self.revalidate = revalidate
+        self.compression = PRODUCT_XML_COMPRESSION if compression is None else compression
+        self.on_result = on_result
+        self.log = log or logging.getLogger()
+        self.success_count = 0
+        self.skipped_count = 0
+        self.stale_count = 0
+        self.not_modified_count = 0
+        self.failed_count = 0
+        self.failed_urls = []
+        self.retried_count = 0
+        self.bytes_count = 0
+        self.stored_bytes_count = 0
+        self.per_second = []
+        self.limiter = None
+        self.elapsed = 0
+
+        logging.getLogger("requests").setLevel(logging.WARNING)
+
+        if store is None:
+            store = blob_store.get_blob_store() if self.target_dir.startswith("gs://") else blob_store.LocalBlobStore()
+        self.store = store
+        self.manifest = ProductXMLManifest(self.store, self.target_dir, manifest or os.environ.get("PRODUCT_XML_MANIFEST"), log=self.log)
+
+        print("Downloading product:")
+        with progressbar.ProgressBar(max_value=len(self.urls)) as self.bar:
+            try:
+                _run_coroutine(self._download())
+            finally:
+                self.manifest.close()
+
+    def _target_path(self, url):
+        bn = os.path.basename(url)
+        return self.target_dir + "/" + product_xml_name(bn or '.index.html', self.compression)
+
+    async def _fetch(self, session, url):
+        path = self._target_path(url)
+        name = os.path.basename(path)
+        updated = self.updated.get(os.path.basename(url))
+        headers = {}
+        if name in self.manifest:
+            if self.manifest.is_fresh(name, updated) and not (self.revalidate and not updated):
+                self.skipped_count += 1
+                self.success_count += 1
+                if self.on_result:
+                    self.on_result(url, None)
+                return
+            if updated:
+                self.stale_count += 1
+            saved = self.manifest.saved_time(name)
+            if saved is not None:
+                headers["If-Modified-Since"] = formatdate(saved, usegmt=True)
+
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.retries + 1):
+            status = None
+            retry_after = None
+            await self.limiter.acquire()
+            started = loop.time()
+            try:
+                async with session.get(url, headers=headers) as res:
+                    status = res.status
+                    if 200 <= status < 299:
+                        data = await res.read()
+                    else:
+                        retry_after = res.headers.get("Retry-After")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as ex:
+                self.log.warning("Bad request {} for url: {}".format(repr(ex), url))
+                status = None
+            finally:
+                await self.limiter.release()
+
+            if status is not None and 200 <= status < 299:
+                self.limiter.on_success(loop.time() - started)
+                break
+            if status == 304:
+                # the cached file is still current
+                self.limiter.on_success(loop.time() - started)
+                self.not_modified_count += 1
+                self.skipped_count += 1
+                self.success_count += 1
+                if self.on_result:
+                    self.on_result(url, None)
+                return
+            if status is not None and status != 429 and status < 500:
+                self.log.warning("Bad status code: {} for url: {}".format(status, url))
+                self._failed(url)
+                return
+
+            self.limiter.on_throttle(explicit = status == 429)
+            if attempt == self.retries:
+                self.log.warning("Giving up on url: {} after {} attempts".format(url, attempt + 1))
+                self._failed(url)
+                return
+            self.retried_count += 1
+            delay = random.uniform(0, min(MAX_BACKOFF, 2 ** attempt))
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, float(retry_after))
+            await asyncio.sleep(delay)
+
+        async with self.upload_slots:
+            stored = data
+            if self.compression == "gzip":
+                stored = await loop.run_in_executor(self.executor, gzip.compress, data, 6)
+            await self.store.write_async(path, stored, self.executor)
+        self.manifest.add(os.path.basename(path))
+        self.success_count += 1
+        self.bytes_count += len(data)
+        self.stored_bytes_count += len(stored)
+        if self.on_result:
+            self.on_result(url, data)
+        self._count_second()
+        self.log.debug("Fetched {}".format(url))
+
+    def _failed(self, url):
+        self.failed_count += 1
+        self.failed_urls.append(url)
+
+    def _count_second(self):
+        second = int(time() - self.start)
+        while len(self.per_second) <= second:
+            self.per_second.append(0)
+        self.per_second[second] += 1
+
+    async def _tracked_fetch(self, session, url):
+        try:
+            await self._fetch(session, url)
+        except Exception as ex:
+            self.log.error("Could not save {}: {}".format(url, repr(ex)))
+            self._failed(url)
+        done = self.success_count + self.failed_count
+        self.bar.update(done)
+        if self.on_progress:
+            self.on_progress(self.get_metrics())
+
+    async def _download(self):
+        self.start = time()
+        self.limiter = AIMDLimiter(max(self.min_connections, self.connections // 4), self.min_connections, self.connections)
+        self.upload_slots = asyncio.Semaphore(self.uploads)
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=min(self.uploads, 32))
+
+        auth = aiohttp.BasicAuth(*self.auth) if self.auth else None
+        connector = aiohttp.TCPConnector(limit=self.connections)
+        timeout = aiohttp.ClientTimeout(total=120)
+        try:
+            async with aiohttp.ClientSession(auth=auth, connector=connector, timeout=timeout) as session:
+                await asyncio.gather(*(self._tracked_fetch(session, url) for url in self.urls))
+        finally:
+            self.executor.shutdown(wait=False)
+            await self.store.aclose()
+        self.elapsed = time() - self.start
+        self.log.info('fetched {} URLs in %0.3fs'.format(self.success_count) % self.elapsed)
+        self.log.info("download report: {}".format(self.get_metrics()))
+
+    def get_count(self):
+        """
+        Returns the number of successfully fetched or already present urls
+        """
+        return self.success_count
+
+    def get_metrics(self):
+        return {
+            "total" : len(self.urls),
+            "done" : self.success_count + self.failed_count,
+            "fetched" : self.success_count - self.skipped_count,
+            "skipped" : self.skipped_count,
+            "stale" : self.stale_count,
+            "not_modified" : self.not_modified_count,
+            "failed" : self.failed_count,
+            "retries" : self.retried_count,
+            "bytes" : self.bytes_count,
+            "stored_bytes" : self.stored_bytes_count,
+            "urls_per_s" : round((self.success_count - self.skipped_count) / self.elapsed, 1) if self.elapsed else None,
+            "peak_urls_per_s" : max(self.per_second) if self.per_second else 0,
+            "connections" : int(self.limiter.limit) if self.limiter else None,
+            "peak_connections" : int(self.limiter.peak) if self.limiter else None,
+            "backoffs" : self.limiter.decreases if self.limiter else 0,
+        }
+
+    def get_throughput(self):
+        """
+        Returns the number of URLs fetched in every second of the run
+        """
+        return list(self.per_second)
+
+
+def _run_coroutine(coroutine):
+    """
+    asyncio.run(), also from a thread that already runs an event loop (e.g. an async FastAPI handler)
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coroutine).result()
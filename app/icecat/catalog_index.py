@@ -0,0 +1,273 @@
+from threading import Thread
+import itertools
+import queue
+import sys
+import xml.etree.cElementTree as ET
+
+'''
+Streaming helpers for the Icecat files.index.xml / daily.index.xml catalog index
+'''
+
+NAMESPACES = {
+    'Product_ID': 'product_id',
+    'Updated': 'updated',
+    'Quality': 'quality',
+    'Supplier_id': 'supplier_id',
+    'Prod_ID': 'prod_id',
+    'Catid': 'catid',
+    'On_Market': 'on_market',
+    'Model_Name': 'model_name',
+    'Product_View': 'product_view',
+    'HighPic': 'highpic',
+    'HighPicSize': 'highpicsize',
+    'HighPicWidth': 'highpicwidth',
+    'HighPicHeight': 'highpicheight',
+    'Date_Added': 'date_added',
+}
+
+CATALOG_FIELDS = (
+    'path', 'limited', 'highpic', 'highpicsize', 'highpicwidth', 'highpicheight', 'product_id', 'updated',
+    'quality', 'prod_id', 'supplier_id', 'catid', 'on_market', 'model_name', 'product_view', 'date_added',
+    'country_markets',
+)
+
+
+# low cardinality columns, shared between rows through sys.intern
+INTERNED_FIELDS = ('limited', 'highpicwidth', 'highpicheight', 'quality', 'supplier_id', 'catid', 'on_market', 'date_added')
+
+_FIELD_SET = frozenset(CATALOG_FIELDS)
+_country_markets = {}
+
+
+class CatalogRow(object):
+    """
+    Compact, dict-like catalog row used by IceCatCatalog for the selected products.
+    The 17 catalog columns live in __slots__ with interned low cardinality values and a shared
+    country_markets tuple; keys added later (product details, mixins, medias) go to a small extra dict.
+    About 0.7 KB per row instead of ~1.5 KB for the equivalent dict (python -m bench.catalog_rows).
+    :param values: mapping with the catalog columns, e.g. a BigQuery row or a catalog index row
+    """
+    __slots__ = CATALOG_FIELDS + ('extra',)
+
+    def __init__(self, values):
+        for field in CATALOG_FIELDS:
+            setattr(self, field, values.get(field, ""))
+        for field in INTERNED_FIELDS:
+            setattr(self, field, sys.intern(getattr(self, field) or ""))
+        self.country_markets = self._country_markets(self.country_markets)
+        self.extra = None
+
+    @staticmethod
+    def _country_markets(value):
+        # same shape as the former row['country_markets'].split(",")
+        key = value if isinstance(value, str) else ",".join(value or ())
+        markets = _country_markets.get(key)
+        if markets is None:
+            markets = _country_markets.setdefault(key, tuple(key.split(",")))
+        return markets
+
+    def __getitem__(self, key):
+        if key in _FIELD_SET:
+            return getattr(self, key)
+        if self.extra is not None and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in _FIELD_SET:
+            setattr(self, key, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __contains__(self, key):
+        return key in _FIELD_SET or (self.extra is not None and key in self.extra)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(CATALOG_FIELDS) + (len(self.extra) if self.extra else 0)
+
+    def __repr__(self):
+        return "CatalogRow({!r})".format(self.to_dict())
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def update(self, values=(), **kwargs):
+        items = values.items() if hasattr(values, 'items') else values
+        for key, value in itertools.chain(items, kwargs.items()):
+            self[key] = value
+
+    def keys(self):
+        return list(CATALOG_FIELDS) + (list(self.extra) if self.extra else [])
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def to_dict(self):
+        return dict(self.items())
+
+
+def iter_catalog_index(file_name, namespaces=NAMESPACES, on_row=None):
+    """
+    Walk the <file> elements of a catalog index with a flat iterparse loop and yield one
+    normalized catalog row per product. Each element is cleared and detached from its parent
+    as soon as it is consumed, so memory stays flat regardless of the catalog size.
+    :param file_name: path or file object of files.index.xml / daily.index.xml
+    :param namespaces: attribute name -> column name mapping, other attributes are lower cased
+    :param on_row: optional callback called once per parsed <file> element (progress bars)
+    """
+    context = ET.iterparse(file_name, events=("start", "end"))
+    parents = []
+    country_markets = []
+
+    for action, elem in context:
+        if action == "start":
+            parents.append(elem)
+            continue
+
+        parents.pop()
+        tag = elem.tag
+        if tag == "Country_Market":
+            value = elem.attrib.get('Value')
+            if value is not None:
+                country_markets.append(value)
+        elif tag == "file":
+            row = make_catalog_row(elem.attrib, country_markets, namespaces)
+            country_markets = []
+            elem.clear()
+            if parents:
+                del parents[-1][:]
+            if on_row:
+                on_row()
+            if row['path']:
+                yield row
+    del context
+
+
+def catalog_row_from_dict(catalog):
+    """
+    Build the catalog table row from a dict produced by the recursive IceCatDatabase.pt() parser
+    """
+    row = {field : catalog[field] if field in catalog else "" for field in CATALOG_FIELDS}
+    row['country_markets'] = ','.join(catalog['country_markets'] if 'country_markets' in catalog else "")
+    return row
+
+
+def make_catalog_row(attrib, country_markets, namespaces=NAMESPACES):
+    """
+    Build the catalog table row for one <file> element, filling missing columns with ""
+    """
+    row = dict.fromkeys(CATALOG_FIELDS, "")
+    for k, v in attrib.items():
+        new_key = namespaces[k] if k in namespaces else k.lower()
+        if new_key in row:
+            row[new_key] = v
+    row['country_markets'] = ','.join(country_markets)
+    return row
+
+
+def divide_iter_by_chunksize(iterable, chunk_size):
+    """
+    Same as divide_list_by_chunksize but for generators: only one chunk is held in memory
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class HighWaterMark(object):
+    """
+    Keep only the catalog rows whose Updated timestamp is newer than the mark of the previous sync.
+    Icecat writes Updated as YYYYMMDDhhmmss, so plain string comparison orders it correctly.
+    :param mark: Updated value stored by the last successful sync, "" to keep every row
+    """
+
+    def __init__(self, mark=""):
+        self.previous = mark or ""
+        self.mark = self.previous
+        self.skipped = 0
+
+    def filter(self, rows):
+        for row in rows:
+            updated = row['updated']
+            if updated > self.mark:
+                self.mark = updated
+            if updated <= self.previous:
+                self.skipped += 1
+                continue
+            yield row
+
+
+class StreamBuffer(object):
+    """
+    File-like reader over the byte chunks of an HTTP body (requests' iter_content). A download thread
+    pushes the chunks through a bounded queue, so iterparse consumes the index while it is still downloading
+    and the download never runs more than max_chunks ahead of the parser.
+    :param chunks: iterator of bytes
+    :param copy_path: optional local file that receives a copy of the body, for debugging
+    :param max_chunks: number of chunks buffered between the download thread and the parser
+    """
+
+    def __init__(self, chunks, copy_path=None, max_chunks=64):
+        self.chunks = queue.Queue(maxsize=max_chunks)
+        self.buffer = b""
+        self.eof = False
+        self.closed = False
+        self.bytes_read = 0
+        self.thread = Thread(target=self._fill, args=(chunks, copy_path))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _fill(self, chunks, copy_path):
+        copy = open(copy_path, 'wb') if copy_path else None
+        try:
+            for chunk in chunks:
+                if self.closed:
+                    break
+                if chunk:
+                    if copy:
+                        copy.write(chunk)
+                    self.chunks.put(chunk)
+            self.chunks.put(None)
+        except Exception as ex:
+            self.chunks.put(ex)
+        finally:
+            if copy:
+                copy.close()
+
+    def read(self, size=-1):
+        while not self.eof and (not self.buffer or size < 0):
+            chunk = self.chunks.get()
+            if chunk is None:
+                self.eof = True
+            elif isinstance(chunk, Exception):
+                self.eof = True
+                raise chunk
+            else:
+                self.buffer += chunk
+
+        if size < 0 or size >= len(self.buffer):
+            data, self.buffer = self.buffer, b""
+        else:
+            data, self.buffer = self.buffer[:size], self.buffer[size:]
+        self.bytes_read += len(data)
+        return data
+
+    def close(self):
+        self.closed = True
+        # unblock the download thread if the parser stopped early
+        while self.thread.is_alive():
+            try:
+                self.chunks.get(timeout=0.1)
+            except queue.Empty:
+                pass
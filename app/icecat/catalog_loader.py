@@ -0,0 +1,268 @@
+from app.icecat import catalog_index
+from google.cloud import bigquery
+from threading import Lock, Thread
+import gzip
+import json
+import logging
+import queue
+import time
+import uuid
+
+'''
+Loading parsed catalog index rows into icecat_data_dataset.catalog
+'''
+
+DATASET = 'icecat-demo.icecat_data_dataset'
+
+CATALOG_SCHEMA = [bigquery.SchemaField(field, "STRING", mode = "REQUIRED") for field in catalog_index.CATALOG_FIELDS]
+
+MERGE_CATALOG_QUERY = "MERGE icecat_data_dataset.catalog T \
+    USING icecat_data_dataset.{source_table} S \
+    ON T.product_id = S.product_id and T.path = S.path \
+    WHEN MATCHED THEN \
+    UPDATE SET path = S.path , limited = S.limited , highpic = S.highpic , highpicsize = S.highpicsize , highpicwidth = S.highpicwidth , \
+        highpicheight = S.highpicheight , product_id = S.product_id , updated = S.updated , quality = S.quality , prod_id = S.prod_id,  \
+        supplier_id = S.supplier_id , catid = S.catid , on_market = S.on_market , model_name = S.model_name , product_view = S.product_view ,  \
+        date_added = S.date_added , country_markets = S.country_markets    \
+    WHEN NOT MATCHED THEN \
+    INSERT (path, limited, highpic, highpicsize, highpicwidth, highpicheight, product_id, updated, quality, prod_id, supplier_id , catid, on_market, model_name, product_view, date_added, country_markets)  \
+        VALUES (path, limited, highpic, highpicsize, highpicwidth, highpicheight, product_id, updated, quality, prod_id, supplier_id , catid, on_market, model_name, product_view, date_added, country_markets)"
+
+
+class TempTableChunkLoader(object):
+    """
+    Merge one chunk of catalog rows: create a temp table, stream the rows with insert_rows_json,
+    MERGE it into the catalog table and drop the temp table again.
+    :param client: bigquery.Client()
+    :param log: optional logging.getLogger() instance
+    """
+
+    def __init__(self, client, log=None):
+        self.client = client
+        self.log = log or logging.getLogger()
+
+    def load(self, rows):
+        """
+        Returns True when the rows were merged into the catalog table
+        """
+        temp_table_name = 'temp_catalog'+ uuid.uuid4().hex
+        table_id = DATASET + '.' + temp_table_name
+        table = self.client.create_table(bigquery.Table(table_id, schema= CATALOG_SCHEMA))
+        print("  -- Created temp catalog table {}.{}.{}".format(table.project, table.dataset_id, table.table_id))
+
+        try:
+            errors = self.client.insert_rows_json(table_id , rows)
+            if errors != []:
+                self.log.error("Could not insert catalog rows into {}: {}".format(temp_table_name, errors[:10]))
+                return False
+
+            query_job = self.client.query(MERGE_CATALOG_QUERY.format(source_table = temp_table_name))
+            query_job.result()
+            print("Updated catalog table successfully")
+            return True
+        finally:
+            self.client.delete_table(table_id, not_found_ok = True)
+
+    def finish(self, on_merged=None):
+        return True
+
+    def discard(self):
+        pass
+
+
+class NDJSONStagingWriter(object):
+    """
+    Serialize catalog rows as gzip compressed, newline-delimited JSON into one staging file.
+    Takes any binary file object: a gcsfs file for the BigQuery load job, or a local file
+    as an offline stand-in to measure the serializer and chunker without the cloud.
+    :param f: binary file object opened for writing
+    :param compress: gzip the rows, BigQuery load jobs read .json.gz directly
+    """
+
+    def __init__(self, f, compress=True):
+        self.raw = f
+        self.f = gzip.GzipFile(fileobj=f, mode='wb', compresslevel=1) if compress else f
+        self.rows = 0
+        self.closed = False
+
+    def write_rows(self, rows):
+        self.f.write("".join(json.dumps(row, separators=(',', ':')) + "\n" for row in rows).encode('utf-8'))
+        self.rows += len(rows)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            if self.f is not self.raw:
+                self.f.close()
+        finally:
+            self.raw.close()
+
+
+class BatchLoadJobLoader(object):
+    """
+    Merge the whole catalog at once: every chunk is appended to one NDJSON staging file,
+    finish() loads it into a temp table with a single load job and runs a single MERGE.
+    A sync that stops before finish() calls discard() so the staging file is not left behind.
+    :param client: bigquery.Client()
+    :param file_system: blob_store.BlobStore used to write the staging file (a GCSBlobStore, BigQuery loads from gs://)
+    :param staging_uri: gs:// uri of the staging file
+    :param log: optional logging.getLogger() instance
+    """
+
+    def __init__(self, client, file_system, staging_uri, log=None):
+        self.client = client
+        self.file_system = file_system
+        self.staging_uri = staging_uri
+        self.log = log or logging.getLogger()
+        self.writer = NDJSONStagingWriter(file_system.open(staging_uri, 'wb'))
+        self.lock = Lock()
+
+    def load(self, rows):
+        # chunks can arrive from several LoaderPool workers, the staging file takes one at a time
+        with self.lock:
+            self.writer.write_rows(rows)
+        return True
+
+    def finish(self, on_merged=None):
+        """
+        Returns True when the staged rows were merged into the catalog table
+        :param on_merged: optional callable(rows) given the staged rows again in chunks once the MERGE succeeded
+        """
+        self.writer.close()
+        if not self.writer.rows:
+            self.file_system.rm(self.staging_uri)
+            return True
+
+        temp_table_name = 'temp_catalog'+ uuid.uuid4().hex
+        table_id = DATASET + '.' + temp_table_name
+        job_config = bigquery.LoadJobConfig(
+            schema = CATALOG_SCHEMA,
+            source_format = bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
+            write_disposition = bigquery.WriteDisposition.WRITE_TRUNCATE,
+        )
+        try:
+            print("  -- Loading {} staged catalog rows from {}".format(self.writer.rows, self.staging_uri))
+            load_job = self.client.load_table_from_uri(self.staging_uri, table_id, job_config = job_config)
+            load_job.result()
+            if load_job.errors:
+                self.log.error("Could not load catalog rows into {}: {}".format(temp_table_name, load_job.errors[:10]))
+                return False
+
+            query_job = self.client.query(MERGE_CATALOG_QUERY.format(source_table = temp_table_name))
+            query_job.result()
+            print("Updated catalog table successfully")
+            if on_merged:
+                for rows in catalog_index.divide_iter_by_chunksize(self.iter_staged_rows(), 10000):
+                    on_merged(rows)
+            return True
+        finally:
+            self.client.delete_table(table_id, not_found_ok = True)
+            self.file_system.rm(self.staging_uri)
+
+    def iter_staged_rows(self):
+        with self.file_system.open(self.staging_uri, 'rb') as f, gzip.GzipFile(fileobj=f, mode='rb') as rows:
+            for line in rows:
+                yield json.loads(line)
+
+    def discard(self):
+        """
+        Close and remove the staging file without loading it
+        """
+        try:
+            self.writer.close()
+        except Exception as ex:
+            self.log.warning("Could not close the catalog staging file {}: {}".format(self.staging_uri, repr(ex)))
+        try:
+            self.file_system.rm(self.staging_uri)
+        except FileNotFoundError:
+            pass
+
+
+class LoaderPool(object):
+    """
+    Keep up to `workers` catalog chunks loading at the same time while the parser produces the next ones.
+    Every chunk is retried with a growing delay before it is reported as failed.
+    The load callable carries the BigQuery client, so the pool runs the same with a fake client offline.
+    :param load: callable(rows) returning True when the chunk was merged
+    :param workers: number of chunks in flight
+    :param depth: number of parsed chunks allowed to wait for a free worker before the parser blocks
+    :param retries: extra attempts per chunk after a failure or an exception, 0 for a load that can not be
+                    repeated, e.g. BatchLoadJobLoader.load would append a partly written chunk again
+    :param retry_delay: seconds to wait before the first retry, doubled on every further retry
+    :param log: optional logging.getLogger() instance
+    """
+
+    def __init__(self, load, workers=1, depth=None, retries=2, retry_delay=1, log=None):
+        self.load = load
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.log = log or logging.getLogger()
+        self.chunks = queue.Queue(maxsize=depth or workers * 2)
+        self.lock = Lock()
+        self.chunk_count = 0
+        self.merged_chunks = 0
+        self.merged_rows = 0
+        self.retried = 0
+        self.failures = []
+        self.threads = []
+        for i in range(workers):
+            t = Thread(target=self._worker)
+            t.daemon = True
+            t.start()
+            self.threads.append(t)
+
+    def _worker(self):
+        while True:
+            item = self.chunks.get()
+            if item is None:
+                break
+            chunk_no, rows = item
+            error = None
+            for attempt in range(self.retries + 1):
+                if attempt:
+                    with self.lock:
+                        self.retried += 1
+                    time.sleep(self.retry_delay * 2 ** (attempt - 1))
+                try:
+                    if self.load(rows):
+                        error = None
+                        break
+                    error = "load returned a failure"
+                except Exception as ex:
+                    error = repr(ex)
+                self.log.warning("Loading catalog chunk {} failed (attempt {}): {}".format(chunk_no, attempt + 1, error))
+
+            with self.lock:
+                if error is None:
+                    self.merged_chunks += 1
+                    self.merged_rows += len(rows)
+                else:
+                    self.failures.append({"chunk" : chunk_no, "rows" : len(rows), "error" : error})
+                    self.log.error("Giving up on catalog chunk {} with {} rows".format(chunk_no, len(rows)))
+
+    def put(self, rows):
+        self.chunk_count += 1
+        self.chunks.put((self.chunk_count, rows))
+
+    def join(self):
+        """
+        Wait for the queued chunks and return the number of chunks that failed to merge
+        """
+        for t in self.threads:
+            self.chunks.put(None)
+        for t in self.threads:
+            t.join()
+        return len(self.failures)
+
+    def report(self):
+        return {
+            "chunks" : self.chunk_count,
+            "merged_chunks" : self.merged_chunks,
+            "merged_rows" : self.merged_rows,
+            "failed_chunks" : len(self.failures),
+            "failed_rows" : sum(failure['rows'] for failure in self.failures),
+            "retries" : self.retried,
+            "failures" : self.failures,
+        }
@@ -0,0 +1,210 @@
+from app.icecat import catalog_index
+from app.icecat import category_tree
+from google.cloud import bigquery
+from contextlib import closing
+import abc
+import os
+import sqlite3
+import time
+
+'''
+Catalog store: where product selection, catalog counts and supplier suggestions are answered from.
+CATALOG_STORE=bigquery (default) queries icecat_data_dataset, CATALOG_STORE=sqlite answers from a
+local SQLite file (CATALOG_STORE_PATH) that the catalog and search index syncs keep up to date.
+'''
+
+
+class CatalogStore(abc.ABC):
+    """
+    Interface shared by the catalog store backends. The upsert_* methods are called by the sync steps
+    in icecat_admin.IceCatDatabase with the rows they merged into BigQuery.
+    """
+
+    # True for a store that keeps its own copy of the synced rows, False when the syncs' MERGEs write it
+    KEEPS_COPY = False
+
+    @abc.abstractmethod
+    def categories(self):
+        """
+        Return every category as { category_id, category_name, parent_cat_id, description }
+        """
+
+    def subcategory_ids(self, category_id):
+        """
+        Return category_id and the IDs of all its descendants, from the in-memory category_tree
+        """
+        return category_tree.get_category_tree(self).subtree(category_id)
+
+    @abc.abstractmethod
+    def select_catalogs(self, category_ids, supplier_ids, match_all, limit):
+        """
+        Return the catalog rows matching the categories and / or suppliers, most viewed first
+        :param match_all: True to require both a matching category and a matching supplier
+        """
+
+    @abc.abstractmethod
+    def count_catalogs(self, category_ids, supplier_ids, match_all):
+        """
+        Return the number of catalog rows select_catalogs() matches without a limit
+        """
+
+    @abc.abstractmethod
+    def suggest_suppliers(self, category_ids, limit=100):
+        """
+        Return { supplier_id, supplier_name, num_prods } for the suppliers with most products in the categories
+        """
+
+    def upsert_catalogs(self, rows):
+        pass
+
+    def upsert_categories(self, rows):
+        pass
+
+    def upsert_suppliers(self, rows):
+        pass
+
+    def high_water_mark(self):
+        """
+        Return the newest Updated timestamp the store holds the catalog rows of, "" when it was never synced,
+        None when the store has no mark of its own (the catalog_sync mark in BigQuery covers it)
+        """
+        return None
+
+    def save_high_water_mark(self, index_file, high_water_mark, rows_merged):
+        pass
+
+
+def _in_list(ids):
+    return ",".join(f"'{w}'" for w in ids) if ids else "''"
+
+
+class BigQueryCatalogStore(CatalogStore):
+    """
+    Catalog store backed by the icecat_data_dataset tables. The tables are written by the sync MERGEs,
+    so the upsert_* methods have nothing to do.
+    """
+
+    def __init__(self, client=None):
+        self.client = client or bigquery.Client()
+
+    def _query(self, query):
+        query_job = self.client.query(query)
+        return query_job.result()
+
+    def categories(self):
+        results = self._query("select * from `icecat-demo.icecat_data_dataset.category`")
+        return [{ 'category_id' : row['category_id'], 'category_name' : row['category_name'], 'parent_cat_id' : row['parent_cat_id'], 'description' : row['description'] } for row in results]
+
+    def select_catalogs(self, category_ids, supplier_ids, match_all, limit):
+        operator = "and" if match_all else "or"
+        query = f"SELECT * FROM icecat_data_dataset.catalog WHERE catid in ({_in_list(category_ids)}) {operator} supplier_id in ({_in_list(supplier_ids)}) order by cast (product_view as int) desc limit {limit}"
+        return list(self._query(query))
+
+    def count_catalogs(self, category_ids, supplier_ids, match_all):
+        operator = "and" if match_all else "or"
+        query = f"SELECT count(*) FROM icecat_data_dataset.catalog WHERE catid in ({_in_list(category_ids)}) {operator} supplier_id in ({_in_list(supplier_ids)}) "
+        for row in self._query(query):
+            return row[0]
+        return 0
+
+    def suggest_suppliers(self, category_ids, limit=100):
+        query = f'SELECT catalog.supplier_id, suppliers.supplier_name, count(1) as num_prods \
+            FROM `icecat-demo.icecat_data_dataset.catalog` as catalog, `icecat-demo.icecat_data_dataset.supplier` as suppliers \
+            where catalog.catid in ({_in_list(category_ids)}) \
+            and catalog.supplier_id = suppliers.supplier_id \
+            group by catalog.supplier_id, suppliers.supplier_name \
+            order by num_prods desc \
+            LIMIT {limit}'
+        return [{"supplier_id" : row['supplier_id'] , "supplier_name" : row['supplier_name'] , 'num_prods': row['num_prods'] } for row in self._query(query)]
+
+
+class SQLiteCatalogStore(CatalogStore):
+    """
+    Embedded catalog store in a local SQLite file, indexed on catid, supplier_id and product_view.
+    A connection is opened per call, so the store can be shared by request threads and sync workers.
+    The delta catalog sync mark is kept in the file too, so a new file is filled from the whole index.
+    :param path: SQLite database file
+    """
+
+    KEEPS_COPY = True
+
+    def __init__(self, path=None):
+        self.path = path or os.environ.get("CATALOG_STORE_PATH", "_data/catalog.sqlite3")
+        folder = os.path.dirname(self.path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        with closing(self._connect()) as cnxn, cnxn:
+            cnxn.execute("PRAGMA journal_mode=WAL")
+            cnxn.execute("CREATE TABLE IF NOT EXISTS catalog ({}, PRIMARY KEY (product_id, path))".format(
+                ", ".join(field + " TEXT NOT NULL" for field in catalog_index.CATALOG_FIELDS)))
+            cnxn.execute("CREATE INDEX IF NOT EXISTS catalog_catid ON catalog (catid, CAST(product_view AS INTEGER))")
+            cnxn.execute("CREATE INDEX IF NOT EXISTS catalog_supplier_id ON catalog (supplier_id, CAST(product_view AS INTEGER))")
+            cnxn.execute("CREATE INDEX IF NOT EXISTS catalog_product_view ON catalog (CAST(product_view AS INTEGER))")
+            cnxn.execute("CREATE TABLE IF NOT EXISTS category (category_id TEXT PRIMARY KEY, category_name TEXT, parent_cat_id TEXT, description TEXT)")
+            cnxn.execute("CREATE INDEX IF NOT EXISTS category_parent_cat_id ON category (parent_cat_id)")
+            cnxn.execute("CREATE TABLE IF NOT EXISTS supplier (supplier_id TEXT PRIMARY KEY, supplier_name TEXT)")
+            cnxn.execute("CREATE TABLE IF NOT EXISTS catalog_sync (index_file TEXT, high_water_mark TEXT, rows_merged INTEGER, created_time TEXT)")
+
+    def _connect(self):
+        cnxn = sqlite3.connect(self.path, timeout=60)
+        cnxn.row_factory = sqlite3.Row
+        return cnxn
+
+    def _query(self, query, params=()):
+        with closing(self._connect()) as cnxn:
+            return [dict(row) for row in cnxn.execute(query, params)]
+
+    def _where(self, category_ids, supplier_ids, match_all):
+        operator = "and" if match_all else "or"
+        where = "catid in ({}) {} supplier_id in ({})".format(
+            ",".join("?" * len(category_ids)) or "''", operator, ",".join("?" * len(supplier_ids)) or "''")
+        return where, list(category_ids) + list(supplier_ids)
+
+    def categories(self):
+        return self._query("SELECT * FROM category")
+
+    def select_catalogs(self, category_ids, supplier_ids, match_all, limit):
+        where, params = self._where(category_ids, supplier_ids, match_all)
+        return self._query("SELECT * FROM catalog WHERE {} ORDER BY CAST(product_view AS INTEGER) DESC LIMIT ?".format(where), params + [limit])
+
+    def count_catalogs(self, category_ids, supplier_ids, match_all):
+        where, params = self._where(category_ids, supplier_ids, match_all)
+        return self._query("SELECT count(*) AS total FROM catalog WHERE {}".format(where), params)[0]['total']
+
+    def suggest_suppliers(self, category_ids, limit=100):
+        query = "SELECT catalog.supplier_id, supplier.supplier_name, count(1) AS num_prods \
+            FROM catalog JOIN supplier ON catalog.supplier_id = supplier.supplier_id \
+            WHERE catalog.catid IN ({}) \
+            GROUP BY catalog.supplier_id, supplier.supplier_name \
+            ORDER BY num_prods DESC LIMIT ?".format(",".join("?" * len(category_ids)) or "''")
+        return self._query(query, list(category_ids) + [limit])
+
+    def _upsert(self, table, fields, rows):
+        query = "INSERT OR REPLACE INTO {} ({}) VALUES ({})".format(table, ", ".join(fields), ", ".join("?" * len(fields)))
+        with closing(self._connect()) as cnxn, cnxn:
+            cnxn.executemany(query, ([row[field] for field in fields] for row in rows))
+
+    def upsert_catalogs(self, rows):
+        self._upsert("catalog", catalog_index.CATALOG_FIELDS, rows)
+
+    def upsert_categories(self, rows):
+        self._upsert("category", ("category_id", "category_name", "parent_cat_id", "description"), rows)
+
+    def upsert_suppliers(self, rows):
+        self._upsert("supplier", ("supplier_id", "supplier_name"), rows)
+
+    def high_water_mark(self):
+        return self._query("SELECT max(high_water_mark) AS high_water_mark FROM catalog_sync")[0]['high_water_mark'] or ""
+
+    def save_high_water_mark(self, index_file, high_water_mark, rows_merged):
+        with closing(self._connect()) as cnxn, cnxn:
+            cnxn.execute("INSERT INTO catalog_sync VALUES (?, ?, ?, ?)", (index_file, high_water_mark, rows_merged, time.strftime('%Y-%m-%d %H:%M:%S')))
+
+
+def get_catalog_store():
+    """
+    Return the catalog store selected by the CATALOG_STORE env variable
+    """
+    if os.environ.get("CATALOG_STORE", "bigquery") == "sqlite":
+        return SQLiteCatalogStore()
+    return BigQueryCatalogStore()
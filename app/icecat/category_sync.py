@@ -0,0 +1,153 @@
+from threading import Lock
+import concurrent.futures
+import json
+import logging
+import requests
+
+'''
+Creating the Icecat categories of an import in the Emporix tenant
+'''
+
+
+class TenantCategorySync(object):
+    """
+    Look up which categories already exist in the tenant with paged GET /categories calls,
+    then create the missing ones level by level: parents of one level are created before the next level,
+    the categories within a level are created in parallel.
+    :param endpoint: Emporix API url, e.g. https://api.emporix.io
+    :param tenant: Emporix tenant
+    :param headers: request headers with the access token and the import Content-Language
+    :param language: short code of the import language, used for localizedName
+    :param root_id: parentId given to the children of the Icecat root category "1"
+    :param workers: number of categories created at the same time
+    :param page_size: categories per page when listing the tenant categories
+    :param log: optional logging.getLogger() instance
+    """
+
+    def __init__(self, endpoint, tenant, headers, language, root_id, workers=8, page_size=200, log=None):
+        self.url = endpoint + "/category/" + tenant + "/categories"
+        self.headers = headers
+        # recall headers for tenants that do not support the import Content-Language
+        self.default_headers = { k : v for k, v in headers.items() if k != "Content-Language" }
+        self.language = language
+        self.root_id = root_id
+        self.workers = workers
+        self.page_size = page_size
+        self.log = log or logging.getLogger()
+        self.requests = 0
+        self.lock = Lock()
+
+    def _count_request(self):
+        with self.lock:
+            self.requests += 1
+
+    def fetch_existing(self):
+        """
+        Return the ECN -> Emporix id map of the tenant categories, None when the listing failed
+        """
+        existing = {}
+        seen = set()
+        page = 1
+        while True:
+            self._count_request()
+            res = requests.get(url = self.url, params = {"pageNumber" : page, "pageSize" : self.page_size}, headers = self.headers)
+            if not 200 <= res.status_code < 299:
+                self.log.warning("Could not list the tenant categories: {} {}".format(res.status_code, res.text[:200]))
+                return None
+            categories = res.json()
+            # the tenant may cap pageSize below page_size, so a short page is not the last one:
+            # page until an empty page, or one that only repeats categories already listed
+            new = [category for category in categories if category['id'] not in seen]
+            if not new:
+                return existing
+            for category in new:
+                seen.add(category['id'])
+                for ecn in category.get('ecn') or []:
+                    existing.setdefault(ecn, category['id'])
+            page += 1
+
+    def lookup(self, ecn):
+        """
+        Return the Emporix id of the category with the given ECN, None when it is not in the tenant
+        """
+        self._count_request()
+        res = requests.get(url = self.url, params = {"ecn" : ecn}, headers = self.headers)
+        try:
+            return res.json()[0].get('id')
+        except Exception:
+            return None
+
+    def create(self, category, parent_id):
+        """
+        Create one category, recalling without Content-Language on a 400.
+        Returns the response of the last request, None when it was not JSON.
+        """
+        body = {
+            "localizedName": {
+                self.language: category['Name']
+            },
+            "name": category['Name'],
+            "position": None,
+            "published": True,
+            "parentId": parent_id ,
+            'ecn' : [category['categoryID']]
+        }
+        self._count_request()
+        res = requests.post(url = self.url + "?publish=true", data = json.dumps(body), headers = self.headers)
+        try:
+            res = res.json()
+        except Exception:
+            return None
+        if 'id' not in res and res.get('code') == 400:
+            self.log.warning("standard create category {} fail and recall with direct lanaguage EN option".format(category['categoryID']))
+            body['localizedName'] = { "en": category['Name'] }
+            self._count_request()
+            res = requests.post(url = self.url + "?publish=true", data = json.dumps(body), headers = self.default_headers)
+            try:
+                res = res.json()
+            except Exception:
+                return None
+        return res
+
+    def sync(self, categories):
+        """
+        Make sure every category exists in the tenant.
+        :param categories: de-duplicated { categoryID, Name, parentCategoryId } list, parents first (CategoryMap.explode)
+        Returns (InjectedCategories, assignmentedCategories, imported_category_list, error) where error is None
+        or the message of a create request that did not answer with JSON.
+        """
+        existing = self.fetch_existing()
+        with concurrent.futures.ThreadPoolExecutor(max_workers = self.workers) as executor:
+            if existing is None:
+                ids = executor.map(self.lookup, [category['categoryID'] for category in categories])
+                existing = { category['categoryID'] : id for category, id in zip(categories, ids) if id }
+
+            injected = []
+            levels = {}
+            level_of = {}
+            for category in categories:
+                catId = category['categoryID']
+                id = existing.get(catId)
+                injected.append({ "categoryID": id or catId, "Name": category['Name'], "parentCategoryId": category['parentCategoryId'], 'IsRequest': id is None, 'catId': catId })
+                level = level_of.get(category['parentCategoryId'], -1) + 1
+                level_of[catId] = level
+                if id is None:
+                    levels.setdefault(level, []).append(category)
+
+            assignmented = { category['catId'] : category['categoryID'] for category in injected if not category['IsRequest'] }
+            imported = []
+            for level in sorted(levels):
+                level_categories = levels[level]
+                parent_ids = [self.root_id if category['parentCategoryId'] == '1' else assignmented.get(category['parentCategoryId']) for category in level_categories]
+                for category, res in zip(level_categories, executor.map(self.create, level_categories, parent_ids)):
+                    if res is None:
+                        self.log.warning(" - Error. wrong credential or something in requesting create category. ")
+                        return injected, assignmented, imported, "You have wrong credential."
+                    if 'id' in res:
+                        self.log.info("  category id {} was created in emporix".format(category['categoryID']))
+                        imported.append(category['categoryID'])
+                        assignmented[category['categoryID']] = res['id']
+                    else:
+                        self.log.warning("  category id {} was not created: {}".format(category['categoryID'], res))
+
+        return injected, assignmented, imported, None
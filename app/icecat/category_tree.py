@@ -0,0 +1,174 @@
+from threading import Lock
+import os
+import time
+
+'''
+In-memory index of the Icecat category tree, built per process from the category table and rebuilt once it is
+CATEGORY_TREE_TTL seconds old, so categories synced by another instance are picked up
+'''
+
+
+class CategoryTree(object):
+    """
+    Parent -> children adjacency plus Euler tour (preorder) intervals of the category tree.
+    Every category gets [enter, leave) positions in one preorder list, so its subtree is a slice
+    of that list and "is X under Y" is two integer comparisons.
+    :param rows: iterable of { category_id, parent_cat_id, ... } as returned by CatalogStore.categories()
+    """
+
+    def __init__(self, rows):
+        self.parent = {}
+        self.children = {}
+        for row in rows:
+            category_id = row['category_id']
+            parent_id = row['parent_cat_id']
+            self.parent[category_id] = parent_id
+            if parent_id != category_id:
+                self.children.setdefault(parent_id, []).append(category_id)
+
+        self.order = []
+        self.enter = {}
+        self.leave = {}
+        roots = [category_id for category_id, parent_id in self.parent.items() if parent_id == category_id or parent_id not in self.parent]
+        # categories caught in a parent cycle are not reachable from any root, walk them last
+        for root in roots + list(self.parent):
+            if root not in self.enter:
+                self._walk(root)
+
+    def _walk(self, root):
+        # iterative DFS, the Icecat tree is shallow but a bad parent_cat_id must not hit the recursion limit
+        stack = [(root, False)]
+        while stack:
+            category_id, done = stack.pop()
+            if done:
+                self.leave[category_id] = len(self.order)
+                continue
+            if category_id in self.enter:
+                continue
+            self.enter[category_id] = len(self.order)
+            self.order.append(category_id)
+            stack.append((category_id, True))
+            for child in reversed(self.children.get(category_id, ())):
+                stack.append((child, False))
+
+    def __contains__(self, category_id):
+        return category_id in self.enter
+
+    def __len__(self):
+        return len(self.order)
+
+    def subtree(self, category_id):
+        """
+        Return category_id followed by all its descendants, [] for an unknown category
+        """
+        if category_id not in self.enter:
+            return []
+        return self.order[self.enter[category_id]:self.leave[category_id]]
+
+    def ancestors(self, category_id):
+        """
+        Return the parent chain of category_id, nearest parent first, up to the root
+        """
+        chain = []
+        parent_id = self.parent.get(category_id)
+        while parent_id is not None and parent_id != category_id and parent_id not in chain:
+            chain.append(parent_id)
+            category_id, parent_id = parent_id, self.parent.get(parent_id)
+        return chain
+
+    def is_under(self, category_id, ancestor_id):
+        """
+        True when category_id is ancestor_id or one of its descendants
+        """
+        if category_id not in self.enter or ancestor_id not in self.enter:
+            return False
+        return self.enter[ancestor_id] <= self.enter[category_id] < self.leave[ancestor_id]
+
+
+_tree = None
+_tree_built = 0
+_tree_lock = Lock()
+
+
+def get_category_tree(store, ttl=None):
+    """
+    Return the process wide CategoryTree, built from store.categories() on first use and again once it is
+    older than `ttl`. An empty tree is not kept, the next call looks at the store again.
+    :param store: catalog_store.CatalogStore
+    :param ttl: seconds, defaults to the CATEGORY_TREE_TTL env variable or 3600
+    """
+    global _tree, _tree_built
+    if ttl is None:
+        ttl = float(os.environ.get("CATEGORY_TREE_TTL", "3600"))
+    if _tree is None or time.monotonic() - _tree_built > ttl:
+        with _tree_lock:
+            if _tree is None or time.monotonic() - _tree_built > ttl:
+                tree = CategoryTree(store.categories())
+                if not tree.enter:
+                    return tree
+                _tree = tree
+                _tree_built = time.monotonic()
+    return _tree
+
+
+def refresh_category_tree(rows):
+    """
+    Replace the process wide CategoryTree, called by syncSearchIndexDatabase with the merged categories
+    """
+    global _tree, _tree_built
+    tree = CategoryTree(rows)
+    with _tree_lock:
+        _tree = tree
+        _tree_built = time.monotonic()
+    return tree
+
+
+class CategoryMap(object):
+    """
+    IceCatCatalog.categories keyed by ID, with the root-first parent path of every category memoized,
+    used to find the categories an import has to create in the tenant.
+    :param categories: list of { 'ID', 'Name', 'ParentID', ... } as loaded by IceCatCatalog._parse
+    """
+    ROOT_ID = "1"
+
+    def __init__(self, categories):
+        self.by_id = {}
+        for category in categories:
+            self.by_id.setdefault(category['ID'], { "categoryID": category['ID'], "Name": category['Name'], "parentCategoryId": category['ParentID'] })
+        self._paths = {}
+
+    def path(self, category_id):
+        """
+        Return the categories from just below the Icecat root down to category_id. The walk stops at
+        the root, at an unknown parent or at a parent cycle.
+        """
+        chain = []
+        seen = set()
+        while category_id not in self._paths:
+            category = self.by_id.get(category_id)
+            if category is None or category_id == self.ROOT_ID or category_id in seen:
+                self._paths[category_id] = ()
+                break
+            seen.add(category_id)
+            chain.append(category)
+            category_id = category['parentCategoryId']
+
+        path = self._paths[category_id]
+        for category in reversed(chain):
+            path = path + (category,)
+            self._paths[category['categoryID']] = path
+        return path
+
+    def explode(self, category_ids):
+        """
+        Return the de-duplicated categories to create for category_ids and all their ancestors,
+        every parent before its children, in the order the former explode_categories() produced
+        """
+        exploded = []
+        seen = set()
+        for category_id in reversed(category_ids):
+            for category in self.path(category_id):
+                if category['categoryID'] not in seen:
+                    seen.add(category['categoryID'])
+                    exploded.append(category)
+        return exploded
@@ -1,17 +1,25 @@
-
+from app.icecat import blob_store
+from app.icecat import catalog_index
+from app.icecat import catalog_loader
+from app.icecat import catalog_store
+from app.icecat import category_tree
+from app.icecat import mixin_schema_cache
+from app.icecat import reference_snapshot
 from dotenv import load_dotenv
 from collections import defaultdict
 from google.cloud import bigquery
+import concurrent.futures
 import gzip
+import hashlib
 import json
 import os
 import xml.etree.cElementTree as ET
 import progressbar
 import requests
 import logging
-import gcsfs
 import os
 import gc
+import time
 import uuid
 
 
@@ -19,7 +27,7 @@ if os.path.isfile('cert/icecat-demo-612ccdfd6436.json'):
     os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = "cert/icecat-demo-612ccdfd6436.json"
 
 g_mixin = defaultdict(list)
-gcs_file_system = gcsfs.GCSFileSystem(project="icecat-demo")
+gcs_file_system = blob_store.get_blob_store()
 '''
 Process only English data
 '''
@@ -36,11 +44,13 @@ class IceCat(object):
     :param auth: Username and password touple, as needed for Ice Cat website authentication
     :param data_dir: Directory to hold downloaded reference and product xml files
     """
+    # attributes set by _parse that are restored from a reference_snapshot instead of parsing again
+    SNAPSHOT_ATTRS = None
 
     def __init__(self, log=None, FILENAME=None, auth=(os.environ.get("ICECAT_USERNAME"), os.environ.get("ICECAT_PASSWORD")), data_dir='_data/', lang_id='1'):
         
         self.lang_id = lang_id
-        self.gcs_file_system = gcsfs.GCSFileSystem(project="icecat-demo")
+        self.gcs_file_system = blob_store.get_blob_store()
 
         logging.basicConfig(filename='IceCat_Catalogs.log', encoding='utf-8', level=logging.INFO)
         self.log = logging.getLogger()
@@ -49,14 +59,21 @@ class IceCat(object):
         self.xml_file = self.FILENAME
         self.gcs_file_path = "gs://" + os.environ.get("GOOGLE_PRODUCT_BUCKET")+ "/"+ self.xml_file
         
-        if self.gcs_file_system.exists(self.gcs_file_path) :
-            self._parse(self.gcs_file_path, lang_id)
+        def parse():
+            if self.gcs_file_system.exists(self.gcs_file_path) :
+                self._parse(self.gcs_file_path, lang_id)
+            else:
+                xml_file = self._download()
+                self._parse(self.gcs_file_path, lang_id)
+            gc.collect()
+
+        if self.SNAPSHOT_ATTRS:
+            # reference lists change at most daily, they are parsed once per version of the source
+            reference_snapshot.get_reference_snapshot_cache().restore(self, self.gcs_file_path, lang_id, parse)
         else:
-            xml_file = self._download()
-            self._parse(self.gcs_file_path, lang_id)
+            parse()
         
         del self.gcs_file_system
-        gc.collect()
 
     def _download(self):
         
@@ -89,10 +106,11 @@ class IceCatFeatureGroupList(IceCat):
     baseurl = 'https://data.Icecat.biz/export/freexml/refs/'
     FILENAME = 'FeatureGroupsList.xml.gz'
     TYPE = 'FeatureGroupList'
+    SNAPSHOT_ATTRS = ('id_map',)
     
     def _parse(self, xml_file, lang_id):
 
-        gcs_file_system = gcsfs.GCSFileSystem(project="icecat-demo")
+        gcs_file_system = blob_store.get_blob_store()
         if xml_file.endswith('.gz'):
             with gcs_file_system.open(xml_file) as gzip_xml_file:
                 with gzip.open(gzip_xml_file, 'rb', 'unicode') as f:
@@ -130,122 +148,103 @@ class IceCatCategoryFeatureList(IceCat):
     baseurl = 'https://data.Icecat.biz/export/freexml/refs/'
     FILENAME = 'CategoryFeaturesList.xml.gz'
     TYPE = 'CategoryFeaturesList'  
+    SNAPSHOT_ATTRS = ('items',)
 
     def parse_xml(self, file_name, lang_id):
-        events = ("start", "end")
-        self.categoryfeaturegroup_matching_list = []
+        """
+        Fill self.items { category ID : { feature group ID : { feature name : json schema property } } } in one
+        pass over the iterparse events. CategoryFeatureGroup IDs are resolved to their FeatureGroup through a dict,
+        and every Category is cleared and dropped once it ends, so memory holds one category at a time.
+        """
+        self.categoryfeaturegroup_matching_list = {}
         self.items = {}
-        self.feature_element_flag = False
-        self.feature_CategoryFeature_ID = None
-        self.parent_featuregrup = None
+        self.parent_featuregrup_id = None
         self.top_categoryId = None
         self.feature_type = None
         self.feature_measure = False
-        context = ET.iterparse(file_name, events=events)
-        return self.parsefeature(context,  lang_id)
-
-   
-    def parsefeature(self,context, lang_id , cur_elem = None):
-        if cur_elem:
-            if cur_elem.tag == "Category":
-                self.top_categoryId = cur_elem.attrib['ID']
-                self.items.update({self.top_categoryId : {}})
-
-            if cur_elem.tag == "CategoryFeatureGroup":
-                featureGroup = cur_elem.find('FeatureGroup')
-
+        feature_element_flag = False
+        stack = []
+        for action, elem in ET.iterparse(file_name, events=("start", "end")):
+            if action == "start":
+                stack.append(elem)
+                if elem.tag == "Category":
+                    self.top_categoryId = elem.attrib['ID']
+                    self.items.update({self.top_categoryId : {}})
+                elif elem.tag == "Feature":
+                    feature_element_flag = True
+                    self.key_count += 1
+                    self.bar.update(self.key_count)
+                    self.parent_featuregrup_id = self.categoryfeaturegroup_matching_list.get(elem.attrib['CategoryFeatureGroup_ID'], self.parent_featuregrup_id)
+                    self.feature_type = elem.attrib['Type']
+                elif elem.tag == "Measure":
+                    self.feature_measure = elem.attrib['Sign'] != ""
+                elif elem.tag == "Name" and feature_element_flag and elem.attrib.get('langid') == lang_id:
+                    self.add_feature(elem.attrib["Value"])
+                continue
+
+            stack.pop()
+            if elem.tag == "CategoryFeatureGroup":
+                featureGroup = elem.find('FeatureGroup')
                 featureGroup_id = featureGroup.attrib["ID"]
-                self.categoryfeaturegroup_matching_list.append({cur_elem.attrib["ID"]: featureGroup_id})           
-                
+                self.categoryfeaturegroup_matching_list[elem.attrib["ID"]] = featureGroup_id
                 # if items don't have featureGroup, and then insert it
                 if self.items[self.top_categoryId].get(featureGroup_id) == None:
                     self.items[self.top_categoryId].update({featureGroup_id : {}})
+                elem.clear()
+            elif elem.tag == "Feature":
+                feature_element_flag = False
+                elem.clear()
+            elif elem.tag == "Category":
+                elem.clear()
+                if stack:
+                    # the finished category is the only child of CategoryFeaturesList left
+                    stack[-1].remove(elem)
+        return self.items
 
-            if cur_elem.tag == "Feature":
-                self.key_count += 1
-                self.bar.update(self.key_count)
-                for feature in self.categoryfeaturegroup_matching_list:
-                    if feature.get(cur_elem.attrib['CategoryFeatureGroup_ID']) != None :
-                        self.parent_featuregrup_id = feature[cur_elem.attrib['CategoryFeatureGroup_ID']] 
-                        break
-                
-                self.feature_CategoryFeature_ID = cur_elem.attrib['CategoryFeature_ID']
-                self.feature_type = cur_elem.attrib['Type']
-
-            if cur_elem.tag == "Measure":
-                if cur_elem.attrib['Sign'] != "":
-                    self.feature_measure = True
+    def add_feature(self, value):
+        """
+        Add the json schema property of the feature named `value` to its category feature group, unless it has one
+        """
+        feature_name = mixin_schema_cache.slug(value)
+        try:
+            group = self.items[self.top_categoryId].get(self.parent_featuregrup_id)
+            if group.get(feature_name) == None or group.get(feature_name) == {}:
+                if self.feature_type == "numerical":
+                    if self.feature_measure:
+                        json_content = {
+                            "$ref": "https://storage.googleapis.com/"+ os.environ.get("GOOGLE_BUCKET_NAME")+ "/atomic_uom.v3",
+                            "description": value
+                        }
+                    else:
+                        json_content = {
+                            "type" : ["number" , "null"],
+                            "description" : value
+                        }
+                elif self.feature_type == "y_n":
+                    json_content = {
+                        "type" :["boolean" , "null"],
+                        "default" : False , 
+                        "description" : value
+                    }
+                elif self.feature_type == "range":
+                    json_content = {
+                        "$ref": "https://storage.googleapis.com/"+ os.environ.get("GOOGLE_BUCKET_NAME")+ "/range_uom.v3",
+                        "description": value
+                    }
                 else:
-                    self.feature_measure = False
-
-
-        for action, elem in context:
-            if elem.tag != "Signs":
-                if elem.tag == "Name" and self.feature_element_flag:
-                        if elem.attrib['langid'] == lang_id:
-                            feature_name =  elem.attrib["Value"].lower().replace(" ", "_").replace("/", "_").replace(".", "_").replace("(", "_").replace(")", "_")
-                            description_text = elem.attrib["Value"]
-                            try:
-                                if self.items[self.top_categoryId].get(self.parent_featuregrup_id).get(feature_name) == None  or self.items[self.top_categoryId].get(self.parent_featuregrup_id).get(feature_name) == {} :
-                                    
-                                    if self.feature_type == "numerical":
-                                        if self.feature_measure:
-                                            json_content = {
-                                                feature_name:{
-                                                    "$ref": "https://storage.googleapis.com/"+ os.environ.get("GOOGLE_BUCKET_NAME")+ "/atomic_uom.v3",
-                                                    "description": description_text
-                                            }}
-                                        else:
-                                            json_content = {
-                                                feature_name:{
-                                                    "type" : ["number" , "null"],
-                                                    "description" : description_text
-                                            
-                                                }
-                                            }
-                                    elif self.feature_type == "y_n":
-                                        json_content = {
-                                            feature_name:{
-                                                "type" :["boolean" , "null"],
-                                                "default" : False , 
-                                                "description" : description_text
-                                        
-                                        }}
-                                    elif self.feature_type == "range":
-                                        json_content = {
-                                            feature_name:{
-                                                "$ref": "https://storage.googleapis.com/"+ os.environ.get("GOOGLE_BUCKET_NAME")+ "/range_uom.v3",
-                                                "description": description_text
-                                        }}
-                                    else:
-                                        json_content = {
-                                            feature_name:{
-                                                "type" : ["string" , "null"],
-                                                "description" : description_text
-                                            
-                                        }}
-                                    
-                                    # inserting schema into json 
-                                    self.items[self.top_categoryId].get(self.parent_featuregrup_id).update(json_content)
-                            except:
-                                self.log.error(f" - top_categoryId {self.top_categoryId} parent_featuregrup_id {self.parent_featuregrup_id}" )
-
-                if action == "start" :
-                    if elem.tag =="Feature":
-                        self.feature_element_flag = True
-                    self.parsefeature(context,lang_id , elem)
-                elif action == "end":
-                    if elem.tag =="Feature":
-                        self.feature_element_flag = False
-                    elem.clear()
-                    break    
-            
-        return self.items
+                    json_content = {
+                        "type" : ["string" , "null"],
+                        "description" : value
+                    }
+                # inserting schema into json 
+                group.update({feature_name : json_content})
+        except:
+            self.log.error(f" - top_categoryId {self.top_categoryId} parent_featuregrup_id {self.parent_featuregrup_id}" )
 
     def _parse(self, xml_file, lang_id):
         self.key_count = 0
         with progressbar.ProgressBar(max_value=progressbar.UnknownLength) as self.bar:
-            gcs_file_system = gcsfs.GCSFileSystem(project="icecat-demo")
+            gcs_file_system = blob_store.get_blob_store()
             if xml_file.endswith('.gz'):
                 with gcs_file_system.open(xml_file) as gzip_file:
                     with gzip.open(gzip_file, 'rb', 'unicode') as f:
@@ -262,7 +261,8 @@ class IceCatCategoryMapping(IceCat):
     baseurl = 'https://data.icecat.biz/export/freexml/refs/'
     FILENAME = 'CategoriesList.xml.gz'
     TYPE = 'Categories List'
-    gcs_file_system = gcsfs.GCSFileSystem(project="icecat-demo")
+    SNAPSHOT_ATTRS = ('id_map',)
+    gcs_file_system = blob_store.get_blob_store()
     def _parse(self, xml_file, lang_id):
         
         if xml_file.endswith('.gz'):	      
@@ -308,18 +308,87 @@ class IceCatCategoryMapping(IceCat):
 class IceCatMixin(IceCat):
     """
     Create Emporix mixin json files from icecat featurelist on local.
+    Only the category / feature group pairs of CategoryFeaturesList get a schema, they are uploaded
+    MIXIN_UPLOAD_WORKERS at a time as they are generated, and a schema whose content is unchanged since the
+    last run is not uploaded again. One instance at a time generates the schemas.
     """
+    # content hash of every schema written, in the schema bucket
+    MANIFEST = mixin_schema_cache.MANIFEST
+    # run holding the schema bucket, and the seconds after which a crashed run's lock is taken over
+    LOCK = "_mixin_manifest.lock"
+    LOCK_TTL = 1800
+
     def __init__(self,  *args, **kwargs): 
         self.features = None
         self.categoryfeatures = None
         self.category = None
         self.data_dir = "_data/mixin/"
+        self.log = logging.getLogger()
         if not os.path.exists(self.data_dir):
             os.makedirs(self.data_dir)
 
-    def makeMixin(self):
-        makeCount = 0
+    def iter_schemas(self):
+        """
+        Yields (gcs path, json schema) for every category / feature group pair with features. When two pairs
+        map to one file name the later one is yielded last, as it used to overwrite the earlier one.
+        """
+        feature_groups = { feature['id'] : (n, feature['name']) for n, feature in enumerate(self.features.id_map) }
+        for category in self.category:
+            groups = self.categoryfeatures.get(category['ID'])
+            if not groups:
+                continue
+            category_name_desciption = category['Name']
+            category_name = mixin_schema_cache.slug(category_name_desciption)
+            for feature_id in sorted((feature_id for feature_id in groups if feature_id in feature_groups), key=lambda feature_id: feature_groups[feature_id][0]):
+                json_schema_property = groups[feature_id]
+                if not json_schema_property:
+                    continue
+                feature_name = feature_groups[feature_id][1]
+                json_schema = {
+                    "$schema": "http://json-schema.org/draft-04/schema#",
+                    "type": "object",
+                    "description": "Mixin schema for "  + feature_name.lower() + " of Category : "  +category_name_desciption,
+                    "properties": 
+                        json_schema_property  
+                }
+                yield "gs://" + os.environ.get("GOOGLE_BUCKET_NAME")+ "/"+ category_name + "-" + mixin_schema_cache.slug(feature_name) +".json", json_schema
+
+    def _load_manifest(self, store):
+        try:
+            with store.open("gs://" + os.environ.get("GOOGLE_BUCKET_NAME") + "/" + self.MANIFEST) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as ex:
+            self.log.warning("Could not read the mixin manifest, all schemas are uploaded: {}".format(repr(ex)))
+            return {}
+
+    def _acquire_lock(self, store, run_id):
+        """
+        Take the LOCK file of the schema bucket for `run_id`, False while an unexpired run of another instance holds it.
+        The store has no create-if-absent, so the lock is read back after it is written and the last writer wins.
+        """
+        lock_path = "gs://" + os.environ.get("GOOGLE_BUCKET_NAME") + "/" + self.LOCK
+        try:
+            with store.open(lock_path) as f:
+                lock = json.load(f)
+            if lock.get('run_id') != run_id and lock.get('expires', 0) > time.time():
+                return False
+        except FileNotFoundError:
+            pass
+        except Exception as ex:
+            self.log.warning("Could not read the mixin lock, taking it over: {}".format(repr(ex)))
+        store.write(lock_path, json.dumps({"run_id" : run_id, "expires" : time.time() + self.LOCK_TTL}).encode('utf-8'))
+        with store.open(lock_path) as f:
+            return json.load(f).get('run_id') == run_id
+
+    def _release_lock(self, store):
+        try:
+            store.rm("gs://" + os.environ.get("GOOGLE_BUCKET_NAME") + "/" + self.LOCK)
+        except FileNotFoundError:
+            pass
 
+    def makeMixin(self):
         if not self.features:
             self.categoryfeatures = IceCatCategoryFeatureList()
             self.categoryfeatures = self.categoryfeatures.items
@@ -327,34 +396,80 @@ class IceCatMixin(IceCat):
             self.category = IceCatCategoryMapping()
             self.category = self.category.id_map
 
-            with progressbar.ProgressBar(max_value=progressbar.UnknownLength) as bar:
-                for category in self.category:
-                    category_id = category['ID']
-                    category_name_desciption = category['Name']
-                    category_name = category_name_desciption.lower().replace(" ", "_").replace("/", "_").replace(".", "_").replace("(", "_").replace(")", "_")
-
-                    for feature in self.features.id_map:
-                        description = "Mixin schema for "  + feature['name'].lower() + " of Category : "  +category_name_desciption
-                        schema_name = feature['name'].lower().replace(" ", "_").replace("/", "_").replace(".", "_").replace("(", "_").replace(")", "_")
-                        feature_id = feature['id']
-
-                        if self.categoryfeatures.get(category_id) != None and self.categoryfeatures.get(category_id) != {}:
-                            if self.categoryfeatures.get(category_id).get(feature_id) != None and self.categoryfeatures.get(category_id).get(feature_id) != {}:
-                                json_schema_property = self.categoryfeatures.get(category_id).get(feature_id)
-                                json_schema = {
-                                    "$schema": "http://json-schema.org/draft-04/schema#",
-                                    "type": "object",
-                                    "description": description,
-                                    "properties": 
-                                        json_schema_property  
-                                }
-                                gcs_json_path = "gs://" + os.environ.get("GOOGLE_BUCKET_NAME")+ "/"+ category_name + "-" + schema_name +".json"
-                                with gcs_file_system.open(gcs_json_path, 'w') as f:
-                                    json.dump(json_schema, f , indent = 4)
-                                    makeCount += 1
-                                    bar.update(makeCount)
-                            
-        return { "Success": f"You have generated {makeCount} mixin json file successfully!"}
+        store = blob_store.get_blob_store()
+        run_id = uuid.uuid4().hex
+        if not self._acquire_lock(store, run_id):
+            return { "error" : "Another instance is generating the mixin schemas, try again once it finished" }
+        try:
+            return self._make_mixin(store)
+        finally:
+            self._release_lock(store)
+
+    def _make_mixin(self, store):
+        # a schema is uploaded again when its content changed or the file is gone
+        manifest = self._load_manifest(store)
+        try:
+            existing = set(os.path.basename(path) for path in store.list("gs://" + os.environ.get("GOOGLE_BUCKET_NAME")))
+        except FileNotFoundError:
+            existing = set()
+        workers = int(os.environ.get("MIXIN_UPLOAD_WORKERS", "32"))
+
+        schemas = set()
+        # gcs path -> hash of the last upload submitted, and of the uploads that succeeded
+        submitted = {}
+        uploaded = {}
+        # future -> (gcs path, hash), at most workers * 2 serialized schemas are held
+        in_flight = {}
+        makeCount = 0
+        failed = 0
+
+        def collect(future):
+            nonlocal makeCount, failed
+            gcs_json_path, digest = in_flight.pop(future)
+            try:
+                future.result()
+                uploaded[gcs_json_path] = digest
+                makeCount += 1
+            except Exception as ex:
+                self.log.error("Could not upload a mixin schema: {}".format(repr(ex)))
+                failed += 1
+            bar.update(makeCount + failed)
+
+        with progressbar.ProgressBar(max_value=progressbar.UnknownLength) as bar:
+            with concurrent.futures.ThreadPoolExecutor(max_workers = workers) as executor:
+                for gcs_json_path, json_schema in self.iter_schemas():
+                    schemas.add(gcs_json_path)
+                    data = json.dumps(json_schema, indent = 4).encode('utf-8')
+                    digest = hashlib.sha256(data).hexdigest()
+                    if gcs_json_path in submitted:
+                        # a later pair mapped to the same file, it is written after the earlier one
+                        if submitted[gcs_json_path] == digest:
+                            continue
+                        for future in [future for future, (path, _) in in_flight.items() if path == gcs_json_path]:
+                            future.result()
+                            collect(future)
+                    elif manifest.get(gcs_json_path) == digest and os.path.basename(gcs_json_path) in existing:
+                        continue
+                    while len(in_flight) >= workers * 2:
+                        done, _ = concurrent.futures.wait(in_flight, return_when = concurrent.futures.FIRST_COMPLETED)
+                        for future in done:
+                            collect(future)
+                    submitted[gcs_json_path] = digest
+                    in_flight[executor.submit(store.write, gcs_json_path, data)] = (gcs_json_path, digest)
+                for future in concurrent.futures.as_completed(list(in_flight)):
+                    collect(future)
+        print(" - {} mixin schemas, {} changed".format(len(schemas), len(submitted)))
+
+        # failed uploads keep their former hash and are retried on the next run. The manifest is read again,
+        # so the hashes another instance recorded meanwhile are kept
+        manifest = self._load_manifest(store)
+        manifest.update(uploaded)
+        store.write("gs://" + os.environ.get("GOOGLE_BUCKET_NAME") + "/" + self.MANIFEST, json.dumps(manifest).encode('utf-8'))
+        if makeCount:
+            # schemas compiled by this process before the upload are stale
+            mixin_schema_cache.get_mixin_schema_cache().clear()
+
+        return { "Success": f"You have generated {makeCount} mixin json file successfully!", "unchanged" : len(schemas) - len(submitted), "failed" : failed }
 
 class IceCatLanguageMapping(IceCat):
     """
@@ -364,9 +479,10 @@ class IceCatLanguageMapping(IceCat):
     baseurl = 'https://data.Icecat.biz/export/freexml/refs/'
     FILENAME = 'LanguageList.xml.gz'
     TYPE = 'Language List'
+    SNAPSHOT_ATTRS = ('id_map',)
     
     def _parse(self, xml_file, lang_id):
-        gcs_file_system = gcsfs.GCSFileSystem(project="icecat-demo")
+        gcs_file_system = blob_store.get_blob_store()
         if xml_file.endswith('.gz'):
             with gcs_file_system.open(xml_file) as gzip_xml_file:
                 with gzip.open(gzip_xml_file, 'rb', 'unicode') as f:
@@ -399,9 +515,10 @@ class IceCatSupplierList(IceCat):
     baseurl = 'https://data.Icecat.biz/export/freexml/refs/'
     FILENAME = 'SuppliersList.xml.gz'
     TYPE = 'SuppliersList'
+    SNAPSHOT_ATTRS = ('id_map',)
     
     def _parse(self, xml_file, lang_id):
-        gcs_file_system = gcsfs.GCSFileSystem(project="icecat-demo")
+        gcs_file_system = blob_store.get_blob_store()
         if xml_file.endswith('.gz'):	      
             with gcs_file_system.open(xml_file) as gzip_xml_file:	
                 with gzip.open(gzip_xml_file, 'rb', 'unicode') as f:
@@ -442,6 +559,7 @@ class IceCatDatabase(IceCat):
         self.languages = None
         self.catalogs = None
         self.key_count = 0
+        self.log = logging.getLogger()
         self._namespaces = {
             'Product_ID': 'product_id',
             'Updated': 'updated',
@@ -507,127 +625,194 @@ class IceCatDatabase(IceCat):
         for index in range(0, len(list) , chunk_size):
             yield list[index:index + chunk_size]
 
-    def syncCatalogIndexDatabase(self):
+    def createCatalogSyncTable(self, client):
+        table = bigquery.Table('icecat-demo.icecat_data_dataset.catalog_sync', schema = [
+            bigquery.SchemaField("run_id" ,          "STRING" ,     mode = "REQUIRED") , 
+            bigquery.SchemaField("index_file" ,      "STRING" ,     mode = "REQUIRED") , 
+            bigquery.SchemaField("high_water_mark" , "STRING" ,     mode = "REQUIRED") , 
+            bigquery.SchemaField("rows_merged" ,     "INTEGER" ,    mode = "REQUIRED") , 
+            bigquery.SchemaField("created_time" ,    "STRING" ,     mode = "REQUIRED") , 
+        ])
+        client.create_table(table, exists_ok = True)
+
+    def getCatalogHighWaterMark(self, client):
+        """
+        Return the newest Updated timestamp merged by a previous catalog sync, "" when nothing was synced yet
+        """
+        self.createCatalogSyncTable(client)
+        query = "SELECT max(high_water_mark) as high_water_mark FROM icecat_data_dataset.catalog_sync"
+        query_job = client.query(query)
+        results = query_job.result() 
+
+        high_water_mark = ""
+        if  results.total_rows:  
+            for row in results:
+                high_water_mark = row['high_water_mark'] or ""
+        return high_water_mark
+
+    def saveCatalogHighWaterMark(self, client, index_file, high_water_mark, rows_merged):
+        row = {
+            "run_id" : uuid.uuid4().hex,
+            "index_file" : index_file,
+            "high_water_mark" : high_water_mark,
+            "rows_merged" : rows_merged,
+            "created_time" : time.strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        self.createCatalogSyncTable(client)
+        errors = client.insert_rows_json('icecat-demo.icecat_data_dataset.catalog_sync', [row])
+        if errors != []:
+            self.log.error("Could not save the catalog high water mark: {}".format(errors))
+
+    def syncCatalogIndexDatabase(self, streaming=True, delta=False, full_index=False, pipelined=False, keep_file=False, bulk=False, loader_workers=None):
+        """
+        Download files.index.xml and merge it into icecat_data_dataset.catalog in chunks of 10,000 rows.
+        :param streaming: walk the index with catalog_index.iter_catalog_index so only one chunk of rows
+                          is in memory at a time. False keeps the old recursive pt() parse of the whole file.
+        :param delta: download daily.index.xml instead and merge only the rows whose Updated is newer than
+                      the high water mark saved by the previous run (icecat_data_dataset.catalog_sync, and the
+                      catalog_store's own mark when it keeps a copy). Without a mark the whole index is read.
+        :param full_index: with delta, read files.index.xml and keep the rows newer than the mark,
+                           e.g. to catch up after the daily sync was skipped for several days.
+        :param pipelined: parse the HTTP body while it downloads instead of saving the whole index to disk first,
+                          so download, parse and load overlap instead of running one after another.
+        :param keep_file: keep the local copy of the index after the sync, for debugging
+        :param bulk: stage every row in one NDJSON file on GCS and merge it with a single load job and
+                     a single MERGE, instead of one temp table and one MERGE per chunk. Needs BLOB_STORE=gcs.
+        :param loader_workers: number of chunks loaded in parallel by catalog_loader.LoaderPool,
+                               defaults to the CATALOG_LOADER_WORKERS env variable or 1
+        Every merged chunk is also written to the configured catalog_store (a no-op for the BigQuery store).
+        """
+        if bulk and not isinstance(gcs_file_system, blob_store.GCSBlobStore):
+            return {"error" : "A bulk catalog sync needs BLOB_STORE=gcs, the BigQuery load job reads the staging file from gs://"}
+        start = time.time()
+        client = bigquery.Client()
+        store = catalog_store.get_catalog_store()
+        high_water_mark = catalog_index.HighWaterMark()
+        if delta:
+            streaming = True
+            mark = self.getCatalogHighWaterMark(client)
+            store_mark = store.high_water_mark()
+            if store_mark is not None:
+                # a store synced less recently than BigQuery, or never, gets the rows it is missing too
+                mark = min(mark, store_mark)
+            if not mark:
+                # daily.index.xml only holds the latest changes, a first sync needs the whole index
+                full_index = True
+            high_water_mark = catalog_index.HighWaterMark(mark)
+            print(" - merging catalog rows updated after {}".format(high_water_mark.previous or "the beginning"))
+
         baseurl = 'https://data.icecat.biz/export/freexml/EN/'
-        fileName = 'files.index.xml'
+        fileName = 'daily.index.xml' if delta and not full_index else 'files.index.xml'
         file_type = 'Catalog Index'
         auth = (os.environ.get("ICECAT_USERNAME"), os.environ.get("ICECAT_PASSWORD"))
         print(" - Downloading {} from {}".format(file_type, baseurl + fileName))
+        if pipelined:
+            streaming = True
+        if not loader_workers:
+            loader_workers = int(os.environ.get("CATALOG_LOADER_WORKERS", "1"))
  
         # download the file into local
         download_file_name = uuid.uuid4().hex +".xml"
 
         res = requests.get(baseurl + fileName, auth = auth, stream=True)
-        with open(download_file_name, 'wb') as f:
-            for chunk in res.iter_content(chunk_size=1024):
-                if chunk:
-                    f.write(chunk)
-            f.close()
-        
+        if not 200 <= res.status_code < 299:
+            return {"error" : "Did not receive good status code: {} while downloading the {}".format(res.status_code, fileName)}
 
-        if 200 <= res.status_code < 299:
+        if pipelined:
+            # the parser reads the HTTP body directly, the local copy is only written with keep_file
+            index_file = catalog_index.StreamBuffer(res.iter_content(chunk_size=64 * 1024), download_file_name if keep_file else None)
+        else:
+            with open(download_file_name, 'wb') as f:
+                for chunk in res.iter_content(chunk_size=1024):
+                    if chunk:
+                        f.write(chunk)
+                f.close()
             print(" - file has been downloaded successfully")
+
+        if streaming:
+            if not pipelined:
+                index_file = open(download_file_name, 'rb')
+            catalog_rows = high_water_mark.filter(catalog_index.iter_catalog_index(index_file, self._namespaces))
+            chunked_catalogs = catalog_index.divide_iter_by_chunksize(catalog_rows, 10000)
+        else:
             with progressbar.ProgressBar(max_value=progressbar.UnknownLength) as self.bar:	        
                 self.catalogs = self.parse_xml(download_file_name)
                 self.catalogs = self.catalogs['icecat-interface']['files.index']['file']
                 
             print(" - Parsed {} products from IceCat catalog".format(str(len(self.catalogs))))   
-            chunked_catalogs = self.divide_list_by_chunksize(self.catalogs, 10000)
-
-            client = bigquery.Client()
-            schema = [
-                bigquery.SchemaField("path" ,           "STRING" ,     mode = "REQUIRED") , 
-                bigquery.SchemaField("limited" ,        "STRING" ,     mode = "REQUIRED") , 
-                bigquery.SchemaField("highpic" ,        "STRING" ,     mode = "REQUIRED") , 
-                bigquery.SchemaField("highpicsize" ,    "STRING" ,     mode = "REQUIRED") , 
-                bigquery.SchemaField("highpicwidth" ,   "STRING" ,     mode = "REQUIRED") , 
-                bigquery.SchemaField("highpicheight" ,  "STRING" ,     mode = "REQUIRED") , 
-                bigquery.SchemaField("product_id" ,     "STRING" ,     mode = "REQUIRED") , 
-                bigquery.SchemaField("updated" ,        "STRING" ,     mode = "REQUIRED") , 
-                bigquery.SchemaField("quality" ,        "STRING" ,     mode = "REQUIRED") , 
-                bigquery.SchemaField("prod_id" ,        "STRING" ,     mode = "REQUIRED") , 
-                bigquery.SchemaField("supplier_id" ,    "STRING" ,     mode = "REQUIRED") , 
-                bigquery.SchemaField("catid" ,          "STRING" ,     mode = "REQUIRED") , 
-                bigquery.SchemaField("on_market" ,      "STRING" ,     mode = "REQUIRED") , 
-                bigquery.SchemaField("model_name" ,     "STRING" ,     mode = "REQUIRED") , 
-                bigquery.SchemaField("product_view" ,   "STRING" ,     mode = "REQUIRED") , 
-                bigquery.SchemaField("date_added" ,     "STRING" ,     mode = "REQUIRED") , 
-                bigquery.SchemaField("country_markets" ,"STRING" ,     mode = "REQUIRED") , 
-            ]
-            
-            for each_chunk_catalogs in chunked_catalogs:
-            
-                temp_table_name = 'temp_catalog'+ uuid.uuid4().hex
-                table_id = 'icecat-demo.icecat_data_dataset.' + temp_table_name
-                table = bigquery.Table(table_id, schema= schema)
-                table = client.create_table(table)
-
-                print(
-                    "  -- Created temp catalog table {}.{}.{}".format(table.project, table.dataset_id, table.table_id)
-                )
-
-                if table :
-                    print("  -- making insert rows from catalog list")
-                    rows_to_insert = []
-                    count = 0
-                    with progressbar.ProgressBar(max_value= len(each_chunk_catalogs)) as bar:
-                        for catalog in each_chunk_catalogs:
-                            if 'path' in catalog:
-                                rows_to_insert.append({
-                                        "path" :   catalog['path']  if 'path' in catalog else "",
-                                        "limited" :catalog['limited'] if 'limited' in catalog else "",
-                                        "highpic" :catalog['highpic'] if 'highpic' in catalog else "",
-                                        "highpicsize" :catalog['highpicsize'] if 'highpicsize' in catalog else "",
-                                        "highpicwidth" :catalog['highpicwidth'] if 'highpicwidth' in catalog else "",
-                                        "highpicheight" :catalog['highpicheight'] if 'highpicheight' in catalog else "",
-                                        "product_id" :catalog['product_id'] if 'product_id' in catalog else "",
-                                        "updated" :catalog['updated'] if 'updated' in catalog else "",
-                                        "quality" :catalog['quality'] if 'quality' in catalog else "",
-                                        "prod_id" :catalog['prod_id'] if 'prod_id' in catalog else "",
-                                        "supplier_id" :catalog['supplier_id'] if 'supplier_id' in catalog else "",
-                                        "catid" : catalog['catid'] if 'catid' in catalog else "" ,
-                                        "on_market" :catalog['on_market'] if 'on_market' in catalog else "",
-                                        "model_name" :catalog['model_name'] if 'model_name' in catalog else "",
-                                        "product_view" :catalog['product_view'] if 'product_view' in catalog else "",
-                                        "date_added" :catalog['date_added'] if 'date_added' in catalog else "",
-                                        "country_markets" :','.join(catalog['country_markets'] if 'country_markets' in catalog else "")
-                                    }
-                                )
-                            count += 1
-                            bar.update(count)
-                    
-                    errors = client.insert_rows_json(table_id , rows_to_insert)
-                    if errors == []:   # successfully inserted
-                        query = f"MERGE icecat_data_dataset.catalog T \
-                            USING icecat_data_dataset.{temp_table_name} S \
-                            ON T.product_id = S.product_id and T.path = S.path \
-                            WHEN MATCHED THEN \
-                            UPDATE SET path = S.path , limited = S.limited , highpic = S.highpic , highpicsize = S.highpicsize , highpicwidth = S.highpicwidth , \
-                                highpicheight = S.highpicheight , product_id = S.product_id , updated = S.updated , quality = S.quality , prod_id = S.prod_id,  \
-                                supplier_id = S.supplier_id , catid = S.catid , on_market = S.on_market , model_name = S.model_name , product_view = S.product_view ,  \
-                                date_added = S.date_added , country_markets = S.country_markets    \
-                            WHEN NOT MATCHED THEN \
-                            INSERT (path, limited, highpic, highpicsize, highpicwidth, highpicheight, product_id, updated, quality, prod_id, supplier_id , catid, on_market, model_name, product_view, date_added, country_markets)  \
-                                VALUES (path, limited, highpic, highpicsize, highpicwidth, highpicheight, product_id, updated, quality, prod_id, supplier_id , catid, on_market, model_name, product_view, date_added, country_markets)"
-                        query_job = client.query(query)    
-                        result = query_job.result()
-                        print("Updated catalog table successfully")
-      
-                client.delete_table(table_id, not_found_ok = True)
-            
-            os.remove(download_file_name)
-            return {'success': "Updated catalog table successfully."}
+            chunked_catalogs = (
+                [catalog_index.catalog_row_from_dict(catalog) for catalog in each_chunk_catalogs if 'path' in catalog]
+                for each_chunk_catalogs in self.divide_list_by_chunksize(self.catalogs, 10000)
+            )
+
+        if bulk:
+            staging_uri = "gs://" + os.environ.get("GOOGLE_PRODUCT_BUCKET") + "/staging/catalog-" + uuid.uuid4().hex + ".json.gz"
+            loader = catalog_loader.BatchLoadJobLoader(client, gcs_file_system, staging_uri, log = self.log)
         else:
-            return {"error" : "Did not receive good status code: {} while downloading the daily.index.xml".format(res.status_code)}
-            
-        # parsing file
-        os.remove(download_file_name)
+            loader = catalog_loader.TempTableChunkLoader(client, log = self.log)
+        synced_count = 0
+
+        def load(rows):
+            # the store only gets the rows BigQuery merged, bulk rows once finish() merged them all
+            if not loader.load(rows):
+                return False
+            if store.KEEPS_COPY and not bulk:
+                store.upsert_catalogs(rows)
+            return True
+
+        # a retried bulk chunk would be appended to the staging file a second time
+        loader_pool = catalog_loader.LoaderPool(load, workers = 1 if bulk else loader_workers, retries = 0 if bulk else 2, log = self.log)
+        parsed = False
+        try:
+            for rows_to_insert in chunked_catalogs:
+                synced_count += len(rows_to_insert)
+                print("  -- parsed {} products from IceCat catalog so far".format(synced_count))
+                loader_pool.put(rows_to_insert)
+            parsed = True
+        finally:
+            failed_chunks = loader_pool.join()
+            if not parsed:
+                # finish() will not run, drop what was staged so far
+                loader.discard()
+            if streaming:
+                index_file.close()
+            if not keep_file and os.path.exists(download_file_name):
+                os.remove(download_file_name)
+
+        load_report = loader_pool.report()
+        if failed_chunks:
+            # a staging file missing a chunk, or holding part of one, is not merged
+            loader.discard()
+            if bulk:
+                load_report.update({'merged_rows' : 0, 'failed_rows' : synced_count})
+        elif not loader.finish(on_merged = store.upsert_catalogs if store.KEEPS_COPY else None):
+            failed_chunks += 1
+            load_report.update({'failed_chunks' : failed_chunks, 'merged_rows' : 0, 'failed_rows' : synced_count})
+
+        # a failed chunk keeps the old mark so the next delta run picks those rows up again
+        if streaming and failed_chunks == 0:
+            self.saveCatalogHighWaterMark(client, fileName, high_water_mark.mark, load_report['merged_rows'])
+            store.save_high_water_mark(fileName, high_water_mark.mark, load_report['merged_rows'])
+
+        if failed_chunks:
+            result = {'error': "{} catalog chunk(s) could not be merged.".format(failed_chunks)}
+        else:
+            result = {'success': "Updated catalog table successfully."}
+        result.update({"sync_time" : str(int(time.time() - start)) + "s", "load_report" : load_report})
+        if delta:
+            # the rows of failed chunks were parsed but not merged
+            result.update({'merged_rows' : load_report['merged_rows'], 'failed_chunks' : failed_chunks,
+                'skipped_rows' : high_water_mark.skipped, 'high_water_mark' : high_water_mark.mark})
+        if keep_file:
+            result.update({'index_file' : download_file_name})
+        return result
         
     def syncSearchIndexDatabase(self):
         self.suppliers = IceCatSupplierList()
         self.categories = IceCatCategoryMapping(lang_id="1")
         self.languages = IceCatLanguageMapping()
         client = bigquery.Client()
+        store = catalog_store.get_catalog_store()
 
         count = 0
         
@@ -707,6 +892,7 @@ class IceCatDatabase(IceCat):
                     rows_to_insert.append(
                         {'supplier_id' : id, "supplier_name": name}
                     )
+            store.upsert_suppliers(rows_to_insert)
             
             errors = client.insert_rows_json(table_id , rows_to_insert)
             if errors == []:   # successfully inserted
@@ -755,7 +941,6 @@ class IceCatDatabase(IceCat):
                     rows_to_insert.append(
                         {'category_id' : id, "category_name": name , "parent_cat_id": parent_id , 'description' : description}
                     )
-            
             errors = client.insert_rows_json(table_id , rows_to_insert)
             if errors == []:   # successfully inserted
                 query = f"MERGE icecat_data_dataset.category T \
@@ -768,6 +953,8 @@ class IceCatDatabase(IceCat):
                 query_job = client.query(query)    
                 result = query_job.result()
                 print("Updated supplier table successfully")
+                store.upsert_categories(rows_to_insert)
+                category_tree.refresh_category_tree(rows_to_insert)
             
             client.delete_table(table_id, not_found_ok = True)
 
@@ -1,10 +1,11 @@
+from app.icecat import blob_store
+from app.icecat import catalog_store
 from dotenv import load_dotenv
 from google.cloud import bigquery
 import json
 import os
 import requests
 import logging
-import gcsfs
 import os
 import gc
 
@@ -13,7 +14,7 @@ if os.path.isfile('cert/icecat-demo-612ccdfd6436.json'):
     os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = "cert/icecat-demo-612ccdfd6436.json"
 
 
-gcs_file_system = gcsfs.GCSFileSystem(project="icecat-demo")
+gcs_file_system = blob_store.get_blob_store()
 '''
 Process only English data
 '''
@@ -34,7 +35,7 @@ class IceCat(object):
     def __init__(self, log=None, FILENAME=None, auth=(os.environ.get("ICECAT_USERNAME"), os.environ.get("ICECAT_PASSWORD")), data_dir='_data/', lang_id='1'):
         
         self.lang_id = lang_id
-        self.gcs_file_system = gcsfs.GCSFileSystem(project="icecat-demo")
+        self.gcs_file_system = blob_store.get_blob_store()
 
         logging.basicConfig(filename='IceCat_Catalogs.log', encoding='utf-8', level=logging.INFO)
         self.log = logging.getLogger()
@@ -137,44 +138,13 @@ class IceCatDatabase(IceCat):
 
     def getSuggestSuppliers(self, categoryIds):
         self.extended_categoryIds = []
-        client = bigquery.Client()
+        store = catalog_store.get_catalog_store()
         for category in categoryIds:
-            subCategoryIds = []
-            query = f'with recursive category_tree as ( \
-                SELECT * FROM `icecat-demo.icecat_data_dataset.category`  \
-                where category_id = "{category}" \
-                UNION ALL \
-                SELECT c.* FROM `icecat-demo.icecat_data_dataset.category` as c, category_tree as tree  \
-                where c.parent_cat_id = tree.category_id \
-                ) \
-            select * from category_tree'
-            
-            query_job = client.query(query)
-            results = query_job.result() 
-            if  results.total_rows:  
-                for row in results:
-                    subCategoryIds.append(row['category_id'])
-
-            self.extended_categoryIds.extend(subCategoryIds)
-
-        if self.extended_categoryIds:
-            str_category = ",".join(f"'{w}'" for w in self.extended_categoryIds)
-        
-        query = f'SELECT catalog.supplier_id, suppliers.supplier_name, count(1) as num_prods \
-            FROM `icecat-demo.icecat_data_dataset.catalog` as catalog, `icecat-demo.icecat_data_dataset.supplier` as suppliers \
-            where catalog.catid in ({str_category}) \
-            and catalog.supplier_id = suppliers.supplier_id \
-            group by catalog.supplier_id, suppliers.supplier_name \
-            order by num_prods desc \
-            LIMIT 100'
-        
-        query_job = client.query(query)
-        results = query_job.result() 
+            self.extended_categoryIds.extend(store.subcategory_ids(category))
 
-        if  results.total_rows:  
-            result_str = []
-            for row in results:
-                result_str.append({"supplier_id" : row['supplier_id'] , "supplier_name" : row['supplier_name'] , 'num_prods': row['num_prods'] })
+        result_str = store.suggest_suppliers(self.extended_categoryIds, 100)
+
+        if  result_str:  
             return {'result' : result_str}
         else:
             return {"inform" : "nothing"}
\ No newline at end of file
@@ -1,9 +1,18 @@
+from app.icecat import blob_store
 from app.icecat import bulk_downloader
+from app.icecat import catalog_index
+from app.icecat import catalog_store
+from app.icecat import category_sync
+from app.icecat import category_tree
+from app.icecat import mixin_schema_cache
+from app.icecat import product_detail_cache
+from app.icecat import product_extract
+from app.icecat import reference_snapshot
 from dotenv import load_dotenv
 from datetime import datetime
 from collections import defaultdict
+from threading import BrokenBarrierError, Lock, Thread
 from google.cloud import bigquery
-import xmltodict
 import gzip
 import json
 import os
@@ -13,9 +22,10 @@ import requests
 import logging
 import polling
 import concurrent.futures
-import gcsfs
+import multiprocessing
 import os
 import gc
+import queue
 import time
 import calendar
 import random
@@ -24,8 +34,7 @@ import uuid
 if os.path.isfile('cert/icecat-demo-612ccdfd6436.json'):
     os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = "cert/icecat-demo-612ccdfd6436.json"
 
-g_mixin = defaultdict(list)
-gcs_file_system = gcsfs.GCSFileSystem(project="icecat-demo")
+gcs_file_system = blob_store.get_blob_store()
 '''
 Process only English data
 '''
@@ -42,11 +51,13 @@ class IceCat(object):
     :param auth: Username and password touple, as needed for Ice Cat website authentication
     :param data_dir: Directory to hold downloaded reference and product xml files
     """
+    # attributes set by _parse that are restored from a reference_snapshot instead of parsing again
+    SNAPSHOT_ATTRS = None
 
     def __init__(self, log=None, FILENAME=None, auth=(os.environ.get("ICECAT_USERNAME"), os.environ.get("ICECAT_PASSWORD")), data_dir='_data/', lang_id='1'):
         
         self.lang_id = lang_id
-        self.gcs_file_system = gcsfs.GCSFileSystem(project="icecat-demo")
+        self.gcs_file_system = blob_store.get_blob_store()
 
         logging.basicConfig(filename='IceCat_Catalogs.log', encoding='utf-8', level=logging.INFO)
         self.log = logging.getLogger()
@@ -55,14 +66,21 @@ class IceCat(object):
         self.xml_file = self.FILENAME
         self.gcs_file_path = "gs://" + os.environ.get("GOOGLE_PRODUCT_BUCKET")+ "/"+ self.xml_file
         
-        if self.gcs_file_system.exists(self.gcs_file_path) :
-            self._parse(self.gcs_file_path, lang_id)
+        def parse():
+            if self.gcs_file_system.exists(self.gcs_file_path) :
+                self._parse(self.gcs_file_path, lang_id)
+            else:
+                xml_file = self._download()
+                self._parse(self.gcs_file_path, lang_id)
+            gc.collect()
+
+        if self.SNAPSHOT_ATTRS:
+            # reference lists change at most daily, they are parsed once per version of the source
+            reference_snapshot.get_reference_snapshot_cache().restore(self, self.gcs_file_path, lang_id, parse)
         else:
-            xml_file = self._download()
-            self._parse(self.gcs_file_path, lang_id)
+            parse()
         
         del self.gcs_file_system
-        gc.collect()
 
     def _download(self):
         
@@ -96,9 +114,10 @@ class IceCatSupplierMapping(IceCat):
     baseurl = 'https://data.icecat.biz/export/freeurls/'
     FILENAME = 'supplier_mapping.xml'
     TYPE = 'Supplier Mapping'
+    SNAPSHOT_ATTRS = ('id_map',)
 
     def _parse(self, xml_file, lang_id):
-        gcs_file_system = gcsfs.GCSFileSystem(project="icecat-demo")
+        gcs_file_system = blob_store.get_blob_store()
         if xml_file:	       
             with gcs_file_system.open(xml_file) as f:	 
                 data = ET.parse(f).getroot()  
@@ -143,7 +162,8 @@ class IceCatCategoryMapping(IceCat):
     baseurl = 'https://data.icecat.biz/export/freexml/refs/'
     FILENAME = 'CategoriesList.xml.gz'
     TYPE = 'Categories List'
-    gcs_file_system = gcsfs.GCSFileSystem(project="icecat-demo")
+    SNAPSHOT_ATTRS = ('id_map',)
+    gcs_file_system = blob_store.get_blob_store()
     def _parse(self, xml_file, lang_id):
         
         if xml_file.endswith('.gz'):	      
@@ -194,9 +214,10 @@ class IceCatLanguageMapping(IceCat):
     baseurl = 'https://data.Icecat.biz/export/freexml/refs/'
     FILENAME = 'LanguageList.xml.gz'
     TYPE = 'Language List'
+    SNAPSHOT_ATTRS = ('id_map',)
     
     def _parse(self, xml_file, lang_id):
-        gcs_file_system = gcsfs.GCSFileSystem(project="icecat-demo")
+        gcs_file_system = blob_store.get_blob_store()
         if xml_file.endswith('.gz'):
             with gcs_file_system.open(xml_file) as gzip_xml_file:
                 with gzip.open(gzip_xml_file, 'rb', 'unicode') as f:
@@ -229,9 +250,10 @@ class IceCatSupplierList(IceCat):
     baseurl = 'https://data.Icecat.biz/export/freexml/refs/'
     FILENAME = 'SuppliersList.xml.gz'
     TYPE = 'SuppliersList'
+    SNAPSHOT_ATTRS = ('id_map',)
     
     def _parse(self, xml_file, lang_id):
-        gcs_file_system = gcsfs.GCSFileSystem(project="icecat-demo")
+        gcs_file_system = blob_store.get_blob_store()
         if xml_file.endswith('.gz'):	      
             with gcs_file_system.open(xml_file) as gzip_xml_file:	
                 with gzip.open(gzip_xml_file, 'rb', 'unicode') as f:
@@ -266,105 +288,75 @@ class IceCatProductDetails(IceCat):
     :param keys: a list of product detail keys. Refer to Basic Usage Example
     :param cleanup_data_files: whether to delete xml files after parsing.
     :param filename: xml file with the product details
+    :param xml_data: the product XML bytes as downloaded, parsed instead of reading xml_file
     Refer to IceCat class for additional arguments
     """
-    def __init__(self, keys, cleanup_data_files=True, xml_file=None, *args, **kwargs):
+    def __init__(self, keys, cleanup_data_files=True, xml_file=None, xml_data=None, *args, **kwargs):
         self.keys = keys
         self.FILENAME = xml_file
         self.cleanup_data_files = cleanup_data_files
         logging.basicConfig(filename='IceCat_Catalogs.log', encoding='utf-8', level=logging.INFO)
         self.log = logging.getLogger()
-        self._parse(xml_file)
+        # per product, a class level dict leaked fields between products and threads
+        self.o = {}
+        # features parseMixin could not map, e.g. a schema not written yet or not readable
+        self.mixin_errors = 0
+        self._parse(xml_file, xml_data=xml_data)
 
     baseurl = 'https://data.icecat.biz/'
     TYPE = 'Product details'
 
-    o = {}
-
     def parseMixin(self, product_feature):
-        category_name = self.product_dict.get('Category').get("Name").get("Value").lower().replace(" ", "_").replace("/", "_").replace(".", "_").replace("(", "_").replace(")", "_")
         category_featurename = self.category_feature_matching_list[product_feature.get('CategoryFeatureGroup_ID')]
-        gcs_json_path = "gs://" + os.environ.get("GOOGLE_BUCKET_NAME")+ "/"+ category_name + "-" + category_featurename +".json"
-        json_url = "https://storage.googleapis.com/" + os.environ.get("GOOGLE_BUCKET_NAME")+ "/" + category_name + "-"  + category_featurename + ".json"
         try:
-            if g_mixin.get(category_name + "-" + category_featurename) == None:
-                gcs_file_system = gcsfs.GCSFileSystem(project="icecat-demo")
-                gcs_file_system.invalidate_cache(gcs_json_path)
-                with  gcs_file_system.open(gcs_json_path) as f:
-                    mixin_schema = json.load(f)
-                    g_mixin.update({category_name + "-" + category_featurename : mixin_schema})
-
-            else:
-                mixin_schema = g_mixin.get(category_name + "-" + category_featurename)
+            # compiled once per schema, a feature is one dict lookup and one converter call
+            converters = self.converters.get(category_featurename)
+            if converters is None:
+                converters = mixin_schema_cache.get_mixin_schema_cache().get(self.category_name + "-" + category_featurename)
+                self.converters[category_featurename] = converters
 
             if self.metadata_mixin.get(category_featurename) == None:
+                json_url = "https://storage.googleapis.com/" + os.environ.get("GOOGLE_BUCKET_NAME")+ "/" + self.category_name + "-"  + category_featurename + ".json"
                 self.metadata_mixin.update({category_featurename : json_url })
                 self.mixin.update({category_featurename : {}})
 
             Feature_elem = product_feature.get('Feature')
             self.feature_id_list.append(Feature_elem.get('ID'))
-            nameElem = Feature_elem.get("Name")
-            featurename = nameElem.get('Value').lower().replace(" ", "_").replace("/", "_").replace(".", "_").replace("(", "_").replace(")", "_")
-            
-            if self.mixin[category_featurename].get(featurename) == None:
-                    feature_schema_detail = mixin_schema['properties'][featurename]
-                    
-                    #checking the schema is range or text
-                    if feature_schema_detail.get('$ref') != None:
-                        ref = feature_schema_detail['$ref']
-                        localValue = product_feature.get('LocalValue').get('Value')
-                        sign = product_feature.get('Feature').get("Measure").get('Signs')
-                        if sign == None:
-                            uom = ""
-                        else:
-                            uom = sign.get('Sign').get('#text')
-                        if uom == "":
-                            presentationValue= product_feature.get('Presentation_Value')
-                            uom = presentationValue.split(localValue)[1].strip()
-                        
-                        if "atomic_uom" in ref:
-                            self.mixin[category_featurename].update({featurename : {"value" : float(localValue), "uom" : uom}})
-                        else:                    # range_uom
-                            
-                            splitString = localValue.split('-')
-                            if len(splitString) == 2:
-                                firstValue = float(splitString[0].strip())
-                                toValue = float(splitString[0].strip())
-                            else:
-                                firstValue = float(splitString[0].strip())
-                                toValue = 1
-                                self.mixin[category_featurename].update({featurename : {"firstValue" : firstValue, "toValue": toValue , "uom" : uom}})
-                    else:
-                        if feature_schema_detail['type'][0] == "string":
-                            value = product_feature.get('Presentation_Value')
-                            self.mixin[category_featurename].update({featurename : value})
-
-                        elif feature_schema_detail['type'][0] == "number":
-                            value = product_feature.get('Presentation_Value')
-                            self.mixin[category_featurename].update({featurename : int(value)})
+            featurename = mixin_schema_cache.slug(Feature_elem.get("Name").get('Value'))
 
-                        else: # boolean
-                            value = product_feature.get('Presentation_Value')
-                            value = True if value == "Y" else False
-                            self.mixin[category_featurename].update({featurename : value})
+            if self.mixin[category_featurename].get(featurename) == None:
+                value = converters[featurename](product_feature)
+                if value is not mixin_schema_cache.SKIP:
+                    self.mixin[category_featurename].update({featurename : value})
 
         except Exception as ex:
+            self.mixin_errors += 1
             template = "An exception of type {0} occurred. Arguments:\n{1!r}"
             message = template.format(type(ex).__name__, ex.args)
             # print(message)
             self.log.error(message)
             
-    def _parse(self, xml_file, lang_id = "1"):
-        gcs_file_system = gcsfs.GCSFileSystem(project="icecat-demo")  
-        with  gcs_file_system.open(xml_file) as f:
-            self.xml_file = xml_file
-            self.product_dict = xmltodict.parse(f, attr_prefix = '' )
-            self.product_dict = self.product_dict['ICECAT-interface']['Product']
+    def _parse(self, xml_file, lang_id = "1", xml_data = None):
+        gcs_file_system = blob_store.get_blob_store()  
+        self.xml_file = xml_file
+        # only the Product children read below are kept, same shape as xmltodict.parse(attr_prefix='')
+        if xml_data is not None:
+            self.product_dict = product_extract.extract_product(xml_data)
+        else:
+            with  gcs_file_system.open(xml_file) as f:
+                if xml_file.endswith('.gz'):
+                    # decompressed while it is parsed, the XML is never whole in memory
+                    with gzip.open(f, 'rb') as xml:
+                        self.product_dict = product_extract.extract_product(xml)
+                else:
+                    self.product_dict = product_extract.extract_product(f)
 
         self.category_feature_matching_list = {}
         self.metadata_mixin = {}
         self.mixin = {}
         self.feature_id_list = []
+        # feature group name -> converter table, looked up in the schema cache once per product
+        self.converters = {}
         
         # get general features
     
@@ -429,10 +421,11 @@ class IceCatProductDetails(IceCat):
 
 
         for category_feature_group in self.product_dict.get('CategoryFeatureGroup'):
-            self.category_feature_matching_list.update({category_feature_group['ID'] : category_feature_group.get('FeatureGroup').get('Name').get('Value').lower().replace(" ", "_").replace("/", "_").replace(".", "_").replace("(", "_").replace(")", "_")})
+            self.category_feature_matching_list.update({category_feature_group['ID'] : mixin_schema_cache.slug(category_feature_group.get('FeatureGroup').get('Name').get('Value'))})
         
        
         if self.product_dict.get("ProductFeature") != None:
+            self.category_name = mixin_schema_cache.slug(self.product_dict.get('Category').get("Name").get("Value"))
             if type(self.product_dict.get('ProductFeature')) == list:
                 for product_feature in self.product_dict.get("ProductFeature"):
                     self.parseMixin(product_feature)
@@ -454,6 +447,62 @@ class IceCatProductDetails(IceCat):
     def get_data(self):
         return self.o
 
+
+def parse_product_details(xml_file, xml_data, keys):
+    """
+    Returns (IceCatProductDetails(...).get_data(), number of features parseMixin failed on), in the calling
+    thread or in a detail_process_pool() worker
+    """
+    details = IceCatProductDetails(xml_file=xml_file, xml_data=xml_data, keys=keys, cleanup_data_files=False)
+    return details.get_data(), details.mixin_errors
+
+
+_warm_up_barrier = None
+
+
+def _init_detail_process(schemas, barrier):
+    global _warm_up_barrier
+    _warm_up_barrier = barrier
+    if schemas:
+        mixin_schema_cache.get_mixin_schema_cache().update(schemas)
+
+
+def _warm_up_detail_process():
+    # held until every worker has one, so no worker takes two of them
+    try:
+        _warm_up_barrier.wait(timeout=120)
+    except BrokenBarrierError:
+        pass
+    return os.getpid()
+
+
+def detail_process_pool(processes, start_method=None):
+    """
+    Returns a ProcessPoolExecutor for parse_product_details(), so the XML parsing is not held back by the GIL.
+    The workers are not forked from this multi-threaded process, a child could inherit a lock held by another
+    thread (the mixin schema cache, the blob store, the detail cache executor) and hang on it. They start from a
+    forkserver that imported this module, or spawn where there is none, and each gets one copy of the mixin
+    schemas in the MixinSchemaCache when it starts. Load the schemas before calling this.
+    :param processes: number of worker processes
+    :param start_method: multiprocessing start method, defaults to $DETAIL_PARSE_START_METHOD, else forkserver or spawn
+    """
+    start_method = start_method or os.environ.get("DETAIL_PARSE_START_METHOD") or (
+        "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn")
+    context = multiprocessing.get_context(start_method)
+    if start_method == "forkserver":
+        context.set_forkserver_preload([__name__])
+    schemas = mixin_schema_cache.get_mixin_schema_cache().snapshot()
+    # the barrier can only reach the workers as an initializer argument
+    barrier = context.Barrier(processes)
+    pool = concurrent.futures.ProcessPoolExecutor(max_workers=processes, mp_context=context,
+                                                  initializer=_init_detail_process, initargs=(schemas, barrier))
+    # the workers start one per submit that finds no idle worker, start all of them now and not next to the
+    # download threads: one warm-up task per worker, each waiting on the barrier until all workers run one
+    for future in [pool.submit(_warm_up_detail_process) for _ in range(processes)]:
+        future.result()
+    return pool
+
+
 class IceCatFeatureLogosList(IceCat):
     """
     create the dict of Category feature logo from icecat FeatureLogosList.xml
@@ -463,9 +512,10 @@ class IceCatFeatureLogosList(IceCat):
     baseurl = 'https://data.Icecat.biz/export/freexml/refs/'
     FILENAME = 'FeatureLogosList.xml.gz'
     TYPE = 'FeatureLogosList'
+    SNAPSHOT_ATTRS = ('id_map',)
     
     def _parse(self, xml_file, lang_id):
-        gcs_file_system = gcsfs.GCSFileSystem(project="icecat-demo")
+        gcs_file_system = blob_store.get_blob_store()
         if xml_file.endswith('.gz'):	      
             with gcs_file_system.open(xml_file) as gzip_xml_file:	
                 with gzip.open(gzip_xml_file, 'rb', 'unicode') as f:
@@ -635,6 +685,8 @@ class IceCatCatalog(IceCat):
         super(IceCatCatalog, self).__init__(lang_id=str(lang_id[0]), *args, **kwargs)
 
     baseurl = 'https://data.icecat.biz/export/freexml/EN/'
+    # product XMLs are <product_xml_baseurl><lang>/<product_id>.xml
+    product_xml_baseurl = 'https://data.Icecat.biz/export/freexml/'
     TYPE = 'Catalog Index'
 
     InjectedCategories = []
@@ -727,41 +779,19 @@ class IceCatCatalog(IceCat):
         self.xml_file = xml_file
         self.key_count = 0
 
-        client = bigquery.Client()
+        store = catalog_store.get_catalog_store()
 
         ###############################################################################
         if not self.categories:
             self.categories = []
-            print(" - getting categories from bigquery")
-
-            query = "select * from `icecat-demo.icecat_data_dataset.category`"
-            query_job = client.query(query)
-            results = query_job.result() 
+            print(" - getting categories from the catalog store")
 
-            if  results.total_rows:  
-                for row in results:
-                    self.categories.append({ 'ID': row['category_id'], 'Name': row['category_name'], "ParentID": row['parent_cat_id'], "ParentName": ""  , 'description': row['description']})
+            for row in store.categories():
+                self.categories.append({ 'ID': row['category_id'], 'Name': row['category_name'], "ParentID": row['parent_cat_id'], "ParentName": ""  , 'description': row['description']})
 
 
         for category in self.payload_categoryIds:
-            subCategoryIds = []
-            query = f'with recursive category_tree as ( \
-                SELECT * FROM `icecat-demo.icecat_data_dataset.category`  \
-                where category_id = "{category}" \
-                UNION ALL \
-                SELECT c.* FROM `icecat-demo.icecat_data_dataset.category` as c, category_tree as tree  \
-                where c.parent_cat_id = tree.category_id \
-                ) \
-                select * from category_tree'
-            
-            query_job = client.query(query)
-            results = query_job.result() 
-
-            if  results.total_rows:  
-                for row in results:
-                    subCategoryIds.append(row['category_id'])
-
-            self.extended_categoryIds.extend(subCategoryIds)
+            self.extended_categoryIds.extend(store.subcategory_ids(category))
         
         ###################################################################################
 
@@ -776,50 +806,15 @@ class IceCatCatalog(IceCat):
 
         ##############################################################################################################
        
-        # get catalogs from bigquery
-       
-        print(" - getting catalogs from bigquery")
-        
-        if self.extended_categoryIds:
-            str_category = ",".join(f"'{w}'" for w in self.extended_categoryIds)
-        else:
-            str_category = "''"
-
-        if self.payload_supplierIds:
-            str_supplier = ",".join(f"'{w}'" for w in self.payload_supplierIds)
-        else:
-            str_supplier = "''"
+        # get catalogs from the catalog store
        
+        print(" - getting catalogs from the catalog store")
 
-        if self.payload_categoryIds and self.payload_supplierIds:  
-            query = f"SELECT * FROM icecat_data_dataset.catalog WHERE catid in ({str_category}) and supplier_id in ({str_supplier}) order by cast (product_view as int) desc limit {self.max_products}"
-        else:
-            query = f"SELECT * FROM icecat_data_dataset.catalog WHERE catid in ({str_category}) or supplier_id in ({str_supplier}) order by cast (product_view as int) desc limit {self.max_products}"
-        
-        query_job = client.query(query)
-        results = query_job.result() 
+        results = store.select_catalogs(self.extended_categoryIds, self.payload_supplierIds, bool(self.payload_categoryIds and self.payload_supplierIds), self.max_products)
 
-        if  results.total_rows:  
+        if  results:  
             for row in results:
-                self.catalogs.append({
-                    'path' : row['path'],
-                    'limited' : row['limited'],
-                    'highpic' : row['highpic'],
-                    'highpicsize' : row['highpicsize'],
-                    'highpicwidth' : row['highpicwidth'],
-                    'highpicheight' : row['highpicheight'],
-                    'product_id' : row['product_id'],
-                    'updated' : row['updated'],
-                    'quality' : row['quality'],
-                    'prod_id' : row['prod_id'],
-                    'supplier_id' : row['supplier_id'],
-                    'catid' : row['catid'],
-                    'on_market' : row['on_market'],
-                    'model_name' : row['model_name'],
-                    'product_view' : row['product_view'],
-                    'date_added' : row['date_added'],
-                    'country_markets' : row['country_markets'].split(","),
-                })
+                self.catalogs.append(catalog_index.CatalogRow(row))
             self.log.info("Parsed {} products from IceCat catalog".format(str(len(self.catalogs))))   
             print("Parsed {} products from IceCat catalog".format(str(len(self.catalogs))))   
             self.log.info(" ----- catalogs parsed from IceCat catalog")      
@@ -1059,138 +1054,33 @@ class IceCatCatalog(IceCat):
                 if catalog.get('supplier_id') != None:
                     if(catalog['supplier_id'] in supplierIds):
                         categoiresFromProducts.append(catalog['catid'])
-                        self.explode_categories(self.categories, catalog['catid'])
+            self.injectedCategories = self.explode_categories(self.categories, categoiresFromProducts)
         else:
-            for categoryid in self.extended_categoryIds:  
-                self.explode_categories(self.categories, categoryid)
-        
-        self.injectedCategories.reverse()         
+            self.injectedCategories = self.explode_categories(self.categories, self.extended_categoryIds)
 
-        # remove duplication from the injected category list
-        pureCategoriesList = []
-        for i in self.injectedCategories:
-            if i not in pureCategoriesList:
-                pureCategoriesList.append(i)
+        # already de-duplicated, parents before children
+        pureCategoriesList = self.injectedCategories
 
         if (not pureCategoriesList):
             return { "Error": "The category does not exist." }
 
-        InjectedCategories = []
-        parentCategoryIds = {}
-
-        for inJectCategory in pureCategoriesList:
-            data = {"ecn" : inJectCategory['categoryID']}
-            getCategorysResponse = requests.get(url = ENDPPOINT_URL + "/category/"+tenant+"/categories", params = data , headers=self.headers)
-
-            try:
-                category_info = getCategorysResponse.json()
-                id = category_info[0].get('id')   # when the category is already in the tenant, it returns the id of the emporix uuid4
-                InjectedCategories.append({ "categoryID": id, "Name": inJectCategory['Name'], "parentCategoryId": inJectCategory['parentCategoryId'], 'IsRequest': False, 'catId': inJectCategory['categoryID']})
-                parentCategoryIds.update({inJectCategory['categoryID'] : id})
-
-            except Exception as ex:
-                InjectedCategories.append({ "categoryID": inJectCategory['categoryID'], "Name": inJectCategory['Name'], "parentCategoryId": inJectCategory['parentCategoryId'], 'IsRequest': True, 'catId': inJectCategory['categoryID'] })
-        
-
-        print(" -  Finishing to get injected categories")
-        self.log.warning("injected categories")
-        self.log.warning(InjectedCategories)
-
-        self.imported_category_list = []
-        parentCategoryIndex = 0
-
         # assign categories to Emporix tenant
         print(" -  assign categories to Emporix tenant")
 
-        self.assignmentedCategories = {}
-       
-        for categoryInfo in InjectedCategories:
-            if(categoryInfo['parentCategoryId'] == '1'):
-                if(os.environ.get("CATEGORY_API_VERSION") == "v1"):
-                    parentId = os.environ.get("PRODUCT_ROOT_CATEGORY_ID")
-                else:
-                    parentId = 'root'
-            else:
-                parentId = parentCategoryIds.get(categoryInfo['parentCategoryId'])
-
-            if(categoryInfo['IsRequest'] is True):
-                print("    - importing or updating category to the tenant" ,categoryInfo['catId'] )
-                createCategoryBody = { 
-                    "localizedName": {
-                       language_code[0]['short_code'].lower(): categoryInfo['Name']
-                    },
-                    "name": categoryInfo['Name'],
-                    "position": None,
-                    "published": True,
-                    "parentId": parentId ,
-                    'ecn' : [categoryInfo['catId']]
-
-                } 
-                Json_createCategoryBody = json.dumps(createCategoryBody, indent = 4) 
-                self.log.warning(Json_createCategoryBody)
-                
-                createCategoryRequest = requests.post(url = ENDPPOINT_URL + "/category/"+tenant+"/categories?publish=true", data = Json_createCategoryBody, headers=self.headers)
-
-                try:
-                    res = createCategoryRequest.json()   
-                    self.log.warning("   create category response from this tenant")
-                    self.log.warning(res)
-
-                except:
-                    print("You have wrong credential.")
-                    self.log.warning(" - Error. wrong credential or something in requesting create category. ")
-                    return { "Error": "You have wrong credential." }
-
-                
-                if('id' in res):
-                    print("    - created category to the tenant with standard option" ,categoryInfo['catId'] )
-                    self.log.info("  category id {} was created in emporix".format(categoryInfo['catId']))
-                    self.imported_category_list.append(categoryInfo['catId'])
-                    try:
-                        parentCategoryIds.update({  categoryInfo['catId']  : res['id'] })
-                        self.assignmentedCategories[categoryInfo['catId']] = res['id']
-                    except:                     
-                        pass
-                
-                else:
-                    
-                    if('code' in res and res['code'] == 400):
-                        print("  standard create category fail and recall with direct lanaguage EN option")
-                        # Recall in case the request does not support current content-language  
-                        DefaultContentLanguageheader = {"Authorization": "Bearer " + self.access_token, "Content-Type": "application/json", "X-Version": os.environ.get("CATEGORY_API_VERSION") }
-                        defaultCategoryBody = { 
-                            "localizedName": {
-                                "en": categoryInfo['Name']
-                            },
-                            "name": categoryInfo['Name'],
-                            "position": None,
-                            "published": True,
-                            "parentId": parentId ,
-                            'ecn' : [categoryInfo['catId']]
-                        } 
-                        Json_default_createCategoryBody = json.dumps(defaultCategoryBody, indent = 4) 
-
-                        self.log.warning("standard create category fail and recall with direct lanaguage EN option")
-                        self.log.warning(Json_default_createCategoryBody)
-
-                        createCategoryRequest = requests.post(url = ENDPPOINT_URL + "/category/"+tenant+"/categories?publish=true", data = Json_default_createCategoryBody, headers=DefaultContentLanguageheader)
-                        res = createCategoryRequest.json()
-                        self.log.info(res)
-
-                        if('id' in res):
-                            print("    - created category to the tenant with remade language option" ,categoryInfo['catId'] )
-                            self.log.info("  category id {} was created in emporix".format(categoryInfo['catId']))
-                            self.imported_category_list.append(categoryInfo['catId'])
-                            parentCategoryIds.update({  categoryInfo['catId']  : res['id'] })
-                            self.assignmentedCategories[categoryInfo['catId']] = res['id']
-
-            else:
-                print("    - this category is already in the tenant" ,categoryInfo['catId'] )
-                self.log.info(" this category {} is already in the tenant.".format(categoryInfo['catId']))
-                parentCategoryIds.update({  categoryInfo['catId']  : categoryInfo['categoryID'] })
-                self.assignmentedCategories[categoryInfo['catId']] = categoryInfo['categoryID']
+        if(os.environ.get("CATEGORY_API_VERSION") == "v1"):
+            rootId = os.environ.get("PRODUCT_ROOT_CATEGORY_ID")
+        else:
+            rootId = 'root'
+        categorySync = category_sync.TenantCategorySync(ENDPPOINT_URL, tenant, self.headers, language_code[0]['short_code'].lower(), rootId,
+            workers = int(os.environ.get("CATEGORY_SYNC_WORKERS", "8")), log = self.log)
+        InjectedCategories, self.assignmentedCategories, self.imported_category_list, error = categorySync.sync(pureCategoriesList)
+        print(" -  {} categories checked, {} created with {} requests".format(len(InjectedCategories), len(self.imported_category_list), categorySync.requests))
 
-            parentCategoryIndex = parentCategoryIndex + 1
+        self.log.warning("injected categories")
+        self.log.warning(InjectedCategories)
+        if error:
+            print("You have wrong credential.")
+            return { "Error": error }
  
         error = False
         
@@ -1443,7 +1333,9 @@ class IceCatCatalog(IceCat):
                 "number_failed_products" : self.numberOfFailedProducts ,
                 "failed_products_list" :  self.failed_product_list , 
                 "imported_category_list" : self.imported_category_list , 
-                "upload_product_time" : str(upload_time) + "s"
+                "upload_product_time" : str(upload_time) + "s",
+                "product_detail_cache" : self.get_detail_cache_stats(),
+                "mixin_schema_cache" : mixin_schema_cache.get_mixin_schema_cache().get_stats()
 
             }
             self.create_webhook( payload = payload)   
@@ -1456,7 +1348,8 @@ class IceCatCatalog(IceCat):
         if(error):
             return { "Error": message }
         else:
-            return { "Success": "You have imported  {} products successfully!".format(str(self.numberOfProducts))}
+            return { "Success": "You have imported  {} products successfully!".format(str(self.numberOfProducts)), "product_detail_cache" : self.get_detail_cache_stats(),
+                     "mixin_schema_cache" : mixin_schema_cache.get_mixin_schema_cache().get_stats() }
 
     def getTenantCurrencies(self , tenant):
         currencyUrl = ENDPPOINT_URL + "/currency/"+tenant+"/currencies"
@@ -2084,25 +1977,40 @@ class IceCatCatalog(IceCat):
             else:                   # given number if 0.95 eg. 12.95
                 return random.randint(int(min) , int(max)) + 0.95
             
-    def explode_categories(self, category_data, categoryId):
-        for category in category_data:         
-            category_name = None           
-            if(category['ID'] == categoryId):             
-                category_name = category['Name']              
-                if(categoryId == "1"):
-                    pass
-                else:                
-                    self.injectedCategories.append({ "categoryID": categoryId, "Name": category_name, "parentCategoryId": category['ParentID']  })                 
-                    self.explode_categories(category_data, category['ParentID'])
+    def explode_categories(self, category_data, categoryIds):
+        """
+        Return the categories to inject for categoryIds and all their ancestors below the root,
+        de-duplicated and ordered parents first
+        :param category_data: self.categories
+        """
+        return category_tree.CategoryMap(category_data).explode(categoryIds)
       
-    def adding_detail_worker(self ,   catalog ):
-        
+    def adding_detail_worker(self ,   catalog , xml_data = None ):
+        """
+        Add the details of one catalog row, from the detail cache, from xml_data when the XML was just
+        downloaded or else from the product bucket
+        """
         item = catalog
-        xml_file = "gs://" + os.environ.get("GOOGLE_PRODUCT_BUCKET")+ "/"+  os.path.basename(item['path'])
+        cached = self.cached_details.get(item['product_id'])
+        if cached is not None:
+            item.update(cached)
+            self.key_count += 1
+            self.bar.update(self.key_count)
+            return
+
+        xml_file = "gs://" + os.environ.get("GOOGLE_PRODUCT_BUCKET")+ "/"+  bulk_downloader.product_xml_name(os.path.basename(item['path']))
         
         try:
-            product_details = IceCatProductDetails(xml_file=xml_file, keys=self.keys, auth=self.auth, data_dir=self.xml_dir, log=self.log,cleanup_data_files=False)
-            item.update(product_details.get_data())
+            detail_processes = getattr(self, 'detail_processes', None)
+            if detail_processes:
+                # parsed in a worker process, only the details come back
+                details, mixin_errors = detail_processes.submit(parse_product_details, xml_file, xml_data, self.keys).result()
+            else:
+                details, mixin_errors = parse_product_details(xml_file, xml_data, self.keys)
+            item.update(details)
+            # details missing features are parsed again next time, their schema may be readable by then
+            if self.detail_cache and not mixin_errors:
+                self.detail_cache.put_later(item['product_id'], item.get('updated'), details)
             self.key_count += 1
             self.bar.update(self.key_count)
         except Exception as ex:
@@ -2120,22 +2028,51 @@ class IceCatCatalog(IceCat):
         :param keys: List of Ice Cat product detail XML keys to include in the output.  Refer to Basic Usage Example.
         :param connections: Number of simultanious download threads.  Do not go over 100.
         """
-       
+        for item in self.iter_product_details(keys=keys, connections=connections, lang_id=lang_id):
+            pass
+
+    def iter_product_details(self, keys=['ProductDescription'], connections=5, lang_id="EN"):
+        """
+        Download and parse the details of self.catalogs in one pass, yielding every catalog row once its details
+        are added, in completion order. A downloaded XML is parsed from memory by the ADDING_DETAIL_WORKERS threads
+        while the download goes on; XMLs already in the bucket are read from there. When more than
+        DETAIL_PARSE_BACKLOG bodies wait for a worker, further ones are dropped and read back from the bucket.
+        New details go to the detail cache in the background.
+        The mixin schemas of the catalog's categories are loaded before the parsing starts.
+        With DETAIL_PARSE_PROCESSES set above 0 the threads hand the parsing to that many worker processes,
+        which start with those schemas.
+        Arguments as add_product_details_parallel()
+        """
         self.keys = keys
         self.connections = connections
-        baseurl = 'https://data.Icecat.biz/export/freexml/'
-        TYPE = 'Product details'
+        baseurl = self.product_xml_baseurl
         urls = []
         self.xml_dir = self.data_dir + 'product_xml/'
         if not os.path.exists(self.xml_dir):
             os.makedirs(self.xml_dir)
 
+        # products parsed by an earlier import with the same Updated are neither downloaded nor parsed again
+        self.detail_cache = None
+        self.cached_details = {}
+        if os.environ.get("PRODUCT_DETAIL_CACHE", "1") == "1":
+            # regenerated mixin schemas change the version, details mapped with the former ones are not used
+            schema_version = mixin_schema_cache.get_mixin_schema_cache().schema_version()
+            self.detail_cache = product_detail_cache.ProductDetailCache(lang_id, schema_version=schema_version, log=self.log)
+            self.cached_details = self.detail_cache.get_many(self.catalogs)
+            print(" - {} of {} product details from the cache".format(len(self.cached_details), len(self.catalogs)))
+
+        # cached XMLs saved before the catalog's Updated are fetched again
+        updated = {}
+        items = {}
         for item in self.catalogs:
-            urls.append(baseurl + lang_id + '/' +item['product_id']+'.xml')
-
-        self.log.info("Downloading detail data with {} connections".format(self.connections))
-       
-        download = bulk_downloader.FetchURLs(log=self.log, urls=urls, auth=self.auth, connections=self.connections, data_dir=self.xml_dir)
+            if item['product_id'] in self.cached_details:
+                continue
+            url = baseurl + lang_id + '/' +item['product_id']+'.xml'
+            if url not in items:
+                urls.append(url)
+            # a product can be in the catalog under more than one path
+            items.setdefault(url, []).append(item)
+            updated[item['product_id'] + '.xml'] = item.get('updated')
 
         if self.job_mode == 'async':
            
@@ -2147,11 +2084,97 @@ class IceCatCatalog(IceCat):
             self.create_webhook( payload = payload)
 
         self.key_count = 0
-        print("Adding product details:")
-        
-        with progressbar.ProgressBar(maxValue=len(self.catalogs)) as self.bar:     
-            with concurrent.futures.ThreadPoolExecutor(max_workers= int(os.environ.get("ADDING_DETAIL_WORKERS"))) as threads:
-                t_res = threads.map(self.adding_detail_worker , self.catalogs)
+        # the downloader shows the progress
+        self.bar = progressbar.NullBar()
+        done = queue.Queue()
+        lock = Lock()
+        backlog = int(os.environ.get("DETAIL_PARSE_BACKLOG", "1000"))
+        waiting = [0]
+        workers = int(os.environ.get("ADDING_DETAIL_WORKERS"))
+        processes = int(os.environ.get("DETAIL_PARSE_PROCESSES", "0"))
+        self.detail_processes = None
+        self.load_mixin_schemas()
+        if processes > 0:
+            self.detail_processes = detail_process_pool(processes)
+            # a thread waits on its process, keep every process fed
+            workers = max(workers, processes * 2)
+        threads = concurrent.futures.ThreadPoolExecutor(max_workers= workers)
+
+        def parse(item, xml_data):
+            try:
+                self.adding_detail_worker(item, xml_data)
+            finally:
+                if xml_data is not None:
+                    with lock:
+                        waiting[0] -= 1
+                done.put(item)
+
+        def on_result(url, xml_data):
+            for item in items.pop(url, ()):
+                data = xml_data
+                if data is not None:
+                    with lock:
+                        if waiting[0] >= backlog:
+                            data = None
+                        else:
+                            waiting[0] += 1
+                threads.submit(parse, item, data)
+
+        def download():
+            self.log.info("Downloading detail data with {} connections".format(self.connections))
+            try:
+                if os.environ.get("PRODUCT_DOWNLOADER", "async") == "threads":
+                    bulk_downloader.FetchURLs(log=self.log, urls=urls, auth=self.auth, connections=self.connections, data_dir=self.xml_dir,
+                                              updated=updated, on_result=on_result)
+                else:
+                    bulk_downloader.AsyncFetchURLs(log=self.log, urls=urls, auth=self.auth, connections=int(os.environ.get("DOWNLOAD_CONNECTIONS", "100")),
+                                                   updated=updated, revalidate=os.environ.get("PRODUCT_XML_REVALIDATE", "0") == "1", on_result=on_result)
+            finally:
+                # failed downloads: try the bucket, an older copy may be there
+                for url in list(items):
+                    on_result(url, None)
+
+        for item in self.catalogs:
+            if item['product_id'] in self.cached_details:
+                threads.submit(parse, item, None)
+        downloader = Thread(target=download)
+        downloader.start()
+        try:
+            for i in range(len(self.catalogs)):
+                yield done.get()
+        finally:
+            downloader.join()
+            threads.shutdown()
+            if self.detail_processes:
+                self.detail_processes.shutdown()
+                self.detail_processes = None
+            if self.detail_cache:
+                self.detail_cache.close()
+        if self.detail_cache:
+            self.log.info("product detail cache: {}".format(self.detail_cache.get_stats()))
+        self.log.info("mixin schema cache: {}".format(mixin_schema_cache.get_mixin_schema_cache().get_stats()))
+
+    def load_mixin_schemas(self):
+        """
+        Preload the mixin schemas of the categories of self.catalogs into the MixinSchemaCache, so the parsing
+        does not wait on them one by one. Returns the number of schemas loaded.
+        """
+        category_names = { category['ID'] : category['Name'] for category in getattr(self, 'categories', None) or [] }
+        slugs = set()
+        for item in self.catalogs:
+            name = category_names.get(item.get('catid'))
+            if name:
+                slugs.add(mixin_schema_cache.slug(name))
+        loaded = mixin_schema_cache.get_mixin_schema_cache().preload_categories(slugs)
+        print(" - {} mixin schemas loaded for {} categories".format(loaded, len(slugs)))
+        return loaded
+
+    def get_detail_cache_stats(self):
+        """
+        Returns the product detail cache hits, misses, writes and errors of the last add_product_details_parallel()
+        """
+        detail_cache = getattr(self, 'detail_cache', None)
+        return detail_cache.get_stats() if detail_cache else {}
         
     def get_data(self):
         """
@@ -1,10 +1,11 @@
+from app.icecat import blob_store
+from app.icecat import catalog_store
 from dotenv import load_dotenv
 from collections import defaultdict
 from google.cloud import bigquery
 import os
 import requests
 import logging
-import gcsfs
 import os
 import gc
 
@@ -13,7 +14,7 @@ if os.path.isfile('cert/icecat-demo-612ccdfd6436.json'):
     os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = "cert/icecat-demo-612ccdfd6436.json"
 
 g_mixin = defaultdict(list)
-gcs_file_system = gcsfs.GCSFileSystem(project="icecat-demo")
+gcs_file_system = blob_store.get_blob_store()
 '''
 Process only English data
 '''
@@ -34,7 +35,7 @@ class IceCat(object):
     def __init__(self, log=None, FILENAME=None, auth=(os.environ.get("ICECAT_USERNAME"), os.environ.get("ICECAT_PASSWORD")), data_dir='_data/', lang_id='1'):
         
         self.lang_id = lang_id
-        self.gcs_file_system = gcsfs.GCSFileSystem(project="icecat-demo")
+        self.gcs_file_system = blob_store.get_blob_store()
 
         logging.basicConfig(filename='IceCat_Catalogs.log', encoding='utf-8', level=logging.INFO)
         self.log = logging.getLogger()
@@ -159,58 +160,16 @@ class IceCatDatabase(IceCat):
 
     def getNumberOfCatalogs(self, categoryIds, supplierIds ):
         
-        client = bigquery.Client()
+        store = catalog_store.get_catalog_store()
         for category in categoryIds:
-            subCategoryIds = []
-            query = f'with recursive category_tree as ( \
-                SELECT * FROM `icecat-demo.icecat_data_dataset.category`  \
-                where category_id = "{category}" \
-                UNION ALL \
-                SELECT c.* FROM `icecat-demo.icecat_data_dataset.category` as c, category_tree as tree  \
-                where c.parent_cat_id = tree.category_id \
-                ) \
-            select * from category_tree'
-            
-            query_job = client.query(query)
-
-            results = query_job.result() 
-
-            if  results.total_rows:  
-                for row in results:
-                    subCategoryIds.append(row['category_id'])
-
-            self.extended_categoryIds.extend(subCategoryIds)
+            self.extended_categoryIds.extend(store.subcategory_ids(category))
 
         # print(self.extended_categoryIds)
 
-        if self.extended_categoryIds:
-            str_category = ",".join(f"'{w}'" for w in self.extended_categoryIds)
-        else:
-            str_category = "''"
-
-        if supplierIds:
-            str_supplier = ",".join(f"'{w}'" for w in supplierIds)
-        else:
-            str_supplier = "''"
-       
-
-        if self.extended_categoryIds and supplierIds:  
-            query = f"SELECT count(*) FROM icecat_data_dataset.catalog WHERE catid in ({str_category}) and supplier_id in ({str_supplier}) "
-        else:
-            query = f"SELECT count(*) FROM icecat_data_dataset.catalog WHERE catid in ({str_category}) or supplier_id in ({str_supplier}) "
-        
-
-        query_job = client.query(query)
-        results = query_job.result() 
+        number = store.count_catalogs(self.extended_categoryIds, supplierIds, bool(self.extended_categoryIds and supplierIds))
 
-        if  results.total_rows:  
-            for row in results:
-                number = row[0]
-                
-
-            return { "count" : number,  "success": f"There are {number} products matches with given IDs"}
-        else:
-            return {"count" : number,  "notfound": "No matches for these category and supplier IDs"}
+        # count(*) always answers one row, so a zero count is a success like any other
+        return { "count" : number,  "success": f"There are {number} products matches with given IDs"}
             
     def getLanguageFromDB(self):
         client = bigquery.Client()
@@ -0,0 +1,297 @@
+from collections import OrderedDict
+from threading import Lock
+import concurrent.futures
+import functools
+import hashlib
+import json
+import logging
+import os
+import time
+from app.icecat import blob_store
+
+'''
+The mixin schemas IceCatProductDetails.parseMixin maps product features with, shared by the parsing threads
+'''
+
+
+@functools.lru_cache(maxsize=65536)
+def slug(name):
+    """
+    Category, feature group and feature names as used in the schema file names and properties, e.g. Ports & interfaces -> ports_&_interfaces
+    """
+    return name.lower().replace(" ", "_").replace("/", "_").replace(".", "_").replace("(", "_").replace(")", "_")
+
+
+# returned by a converter for a feature that is left out of the mixin
+SKIP = object()
+
+# content hash of every schema written by IceCatMixin.makeMixin, in the schema bucket
+MANIFEST = "_mixin_manifest.json"
+
+# returned by MixinSchemaCache._load for a schema that could not be read, never cached
+_FAILED = object()
+
+
+def _local_value_and_uom(product_feature):
+    localValue = product_feature.get('LocalValue').get('Value')
+    sign = product_feature.get('Feature').get("Measure").get('Signs')
+    if sign == None:
+        uom = ""
+    else:
+        uom = sign.get('Sign').get('#text')
+    if uom == "":
+        presentationValue= product_feature.get('Presentation_Value')
+        uom = presentationValue.split(localValue)[1].strip()
+    return localValue, uom
+
+
+def atomic_uom(product_feature):
+    localValue, uom = _local_value_and_uom(product_feature)
+    return {"value" : float(localValue), "uom" : uom}
+
+
+def range_uom(product_feature):
+    localValue, uom = _local_value_and_uom(product_feature)
+    splitString = localValue.split('-')
+    firstValue = float(splitString[0].strip())
+    if len(splitString) == 2:
+        # a from - to value has never been added to the mixin
+        return SKIP
+    return {"firstValue" : firstValue, "toValue": 1 , "uom" : uom}
+
+
+def string_value(product_feature):
+    return product_feature.get('Presentation_Value')
+
+
+def number_value(product_feature):
+    return int(product_feature.get('Presentation_Value'))
+
+
+def boolean_value(product_feature):
+    return True if product_feature.get('Presentation_Value') == "Y" else False
+
+
+def compile_schema(schema):
+    """
+    Returns { feature name : converter } for the properties of a mixin schema, a converter turning a
+    ProductFeature into its mixin value (or SKIP). Properties of an unknown shape are left out.
+    """
+    converters = {}
+    for name, detail in schema.get('properties', {}).items():
+        try:
+            if detail.get('$ref') != None:
+                converters[name] = atomic_uom if "atomic_uom" in detail['$ref'] else range_uom
+            elif detail['type'][0] == "string":
+                converters[name] = string_value
+            elif detail['type'][0] == "number":
+                converters[name] = number_value
+            else:
+                converters[name] = boolean_value
+        except (KeyError, IndexError, TypeError, AttributeError):
+            pass
+    return converters
+
+
+class MixinSchemaCache(object):
+    """
+    gs://$GOOGLE_BUCKET_NAME/<category>-<feature group>.json schemas by "<category>-<feature group>" key, held
+    as compile_schema() converter tables, least recently used first out once more than max_entries are held.
+    A schema missing from the bucket is remembered for missing_ttl seconds, so it is not looked up again for every
+    feature of every product but is found once makeMixin wrote it. A schema that could not be read is not remembered.
+    Concurrent misses on one key load it once.
+    :param store: blob_store.BlobStore, defaults to get_blob_store()
+    :param bucket: defaults to $GOOGLE_BUCKET_NAME
+    :param max_entries: defaults to $MIXIN_SCHEMA_CACHE_SIZE or 10000
+    :param workers: schemas loaded at the same time by preload()
+    :param missing_ttl: seconds a missing schema is remembered, defaults to $MIXIN_SCHEMA_MISSING_TTL or 60
+    :param log: An optional logging.getLogger() instance
+    """
+
+    def __init__(self, store=None, bucket=None, max_entries=None, workers=32, missing_ttl=None, log=None):
+        self.store = store or blob_store.get_blob_store()
+        self.bucket = bucket or os.environ.get("GOOGLE_BUCKET_NAME")
+        self.max_entries = max_entries or int(os.environ.get("MIXIN_SCHEMA_CACHE_SIZE", "10000"))
+        self.workers = workers
+        self.missing_ttl = float(os.environ.get("MIXIN_SCHEMA_MISSING_TTL", "60")) if missing_ttl is None else missing_ttl
+        self.log = log or logging.getLogger()
+        self.lock = Lock()
+        # key -> converter table, None for a schema that does not exist
+        self.schemas = OrderedDict()
+        # key -> time.monotonic() at which a None entry is looked up again
+        self.missing = {}
+        # key -> Lock held while the key is loaded
+        self.loading = {}
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.load_seconds = 0.0
+        self.evictions = 0
+        self.errors = 0
+
+    def _path(self, key):
+        return "gs://" + self.bucket + "/" + key + ".json"
+
+    def get(self, key):
+        """
+        Returns the compile_schema() converters of "<category>-<feature group>", loading the schema on a miss.
+        Raises KeyError when the bucket has no such schema, or it could not be read (tried again on the next get).
+        """
+        with self.lock:
+            if key in self.schemas and not self._expired(key):
+                self.schemas.move_to_end(key)
+                self.hits += 1
+                schema = self.schemas[key]
+                if schema is None:
+                    raise KeyError(key)
+                return schema
+            self.misses += 1
+            key_lock = self.loading.setdefault(key, Lock())
+        with key_lock:
+            with self.lock:
+                loaded = key in self.schemas and not self._expired(key)
+                schema = self.schemas.get(key)
+            if not loaded:
+                schema = self._load(key)
+                if schema is not _FAILED:
+                    with self.lock:
+                        self._add(key, schema)
+            with self.lock:
+                self.loading.pop(key, None)
+        if schema is None or schema is _FAILED:
+            raise KeyError(key)
+        return schema
+
+    def _expired(self, key):
+        # called with self.lock held, for a key in self.schemas
+        return key in self.missing and time.monotonic() >= self.missing[key]
+
+    def _load(self, key):
+        path = self._path(key)
+        started = time.perf_counter()
+        try:
+            # the schema may have been written by makeMixin since this process last looked
+            self.store.invalidate_cache(path)
+            with self.store.open(path) as f:
+                schema = compile_schema(json.load(f))
+        except FileNotFoundError:
+            schema = None
+        except Exception as ex:
+            self.log.warning("Could not load mixin schema {}: {}".format(path, repr(ex)))
+            with self.lock:
+                self.errors += 1
+            schema = _FAILED
+        with self.lock:
+            self.loads += 1
+            self.load_seconds += time.perf_counter() - started
+        return schema
+
+    def _add(self, key, schema):
+        # called with self.lock held
+        self.schemas[key] = schema
+        self.schemas.move_to_end(key)
+        if schema is None:
+            self.missing[key] = time.monotonic() + self.missing_ttl
+        else:
+            self.missing.pop(key, None)
+        while len(self.schemas) > self.max_entries:
+            evicted, _ = self.schemas.popitem(last=False)
+            self.missing.pop(evicted, None)
+            self.evictions += 1
+
+    def preload(self, keys):
+        """
+        Load the schemas of `keys` not held yet, `workers` at a time. Returns the number loaded.
+        """
+        with self.lock:
+            keys = [key for key in dict.fromkeys(keys) if key not in self.schemas or self._expired(key)]
+        if len(keys) > self.max_entries:
+            self.log.warning("Preloading {} mixin schemas into a cache of {}, raise MIXIN_SCHEMA_CACHE_SIZE".format(len(keys), self.max_entries))
+        with concurrent.futures.ThreadPoolExecutor(max_workers = self.workers) as executor:
+            for key, schema in zip(keys, executor.map(self._load, keys)):
+                if schema is not _FAILED:
+                    with self.lock:
+                        self._add(key, schema)
+        return len(keys)
+
+    def preload_categories(self, category_slugs):
+        """
+        preload() every schema of the categories, found with one listing of the bucket.
+        :param category_slugs: category names as they start the schema file names, e.g. notebooks
+        """
+        prefixes = set(name + "-" for name in category_slugs)
+        if not prefixes:
+            return 0
+        try:
+            paths = self.store.list("gs://" + self.bucket)
+        except FileNotFoundError:
+            return 0
+        keys = []
+        for path in paths:
+            if not path.endswith(".json"):
+                continue
+            key = os.path.basename(path)[:-len(".json")]
+            # <category>-<feature group>, either name can hold a '-' too
+            for i, c in enumerate(key):
+                if c == "-" and key[:i + 1] in prefixes:
+                    keys.append(key)
+                    break
+        return self.preload(keys)
+
+    def schema_version(self):
+        """
+        Returns a short hash of the MANIFEST makeMixin wrote, which changes whenever a schema changed,
+        "none" when there is no manifest
+        """
+        path = "gs://" + self.bucket + "/" + MANIFEST
+        try:
+            self.store.invalidate_cache(path)
+            with self.store.open(path) as f:
+                return hashlib.sha256(f.read()).hexdigest()[:16]
+        except FileNotFoundError:
+            return "none"
+
+    def snapshot(self):
+        """
+        Returns { key : converters } of the schemas held, for update() in another process
+        """
+        with self.lock:
+            return dict(self.schemas)
+
+    def update(self, schemas):
+        with self.lock:
+            for key, schema in schemas.items():
+                self._add(key, schema)
+
+    def clear(self):
+        with self.lock:
+            self.schemas.clear()
+            self.missing.clear()
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                "entries" : len(self.schemas),
+                "hits" : self.hits,
+                "misses" : self.misses,
+                "loads" : self.loads,
+                "load_seconds" : round(self.load_seconds, 3),
+                "evictions" : self.evictions,
+                "errors" : self.errors,
+            }
+
+
+_cache = None
+_cache_lock = Lock()
+
+
+def get_mixin_schema_cache():
+    """
+    Return the process wide MixinSchemaCache
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = MixinSchemaCache()
+    return _cache
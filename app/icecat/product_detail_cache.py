@@ -0,0 +1,140 @@
+from threading import Lock
+import concurrent.futures
+import gzip
+import json
+import logging
+import os
+from app.icecat import blob_store
+
+'''
+Parsed product details of earlier imports, so unchanged products skip the XML download and parse
+'''
+
+# bump when IceCatProductDetails.get_data() changes shape, older entries are then ignored
+CACHE_VERSION = "1"
+
+
+class ProductDetailCache(object):
+    """
+    IceCatProductDetails.get_data() output stored as one gzip compressed JSON object per product:
+    <root>/v<CACHE_VERSION>/<lang_id>[/<schema_version>]/<product_id>-<updated>.json.gz
+    A product whose catalog Updated changed gets a new name, so a lookup never returns stale details, and
+    details mapped with other mixin schemas are under another schema_version.
+    The entries are listed once per import instead of one exists() per product.
+    :param lang_id: language of the import, e.g. EN
+    :param schema_version: MixinSchemaCache.schema_version() of the schemas the details were mapped with
+    :param store: blob_store.BlobStore, defaults to get_blob_store()
+    :param root: defaults to gs://$GOOGLE_PRODUCT_BUCKET/product_details
+    :param workers: entries read at the same time by get_many(), and written by put_later()
+    :param log: An optional logging.getLogger() instance
+    """
+
+    def __init__(self, lang_id, schema_version=None, store=None, root=None, workers=32, log=None):
+        self.store = store or blob_store.get_blob_store()
+        root = root or "gs://" + os.environ.get("GOOGLE_PRODUCT_BUCKET") + "/product_details"
+        self.dir = root.rstrip("/") + "/v" + CACHE_VERSION + "/" + lang_id
+        if schema_version:
+            self.dir += "/" + schema_version
+        self.workers = workers
+        self.log = log or logging.getLogger()
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.errors = 0
+        self.writer = None
+        # product_id -> Updated values with an entry
+        self.entries = {}
+        try:
+            paths = self.store.list(self.dir)
+        except FileNotFoundError:
+            paths = []
+        for path in paths:
+            name = os.path.basename(path)
+            if name.endswith(".json.gz"):
+                product_id, _, updated = name[:-len(".json.gz")].partition("-")
+                self.entries.setdefault(product_id, set()).add(updated)
+
+    def _path(self, product_id, updated):
+        return self.dir + "/" + product_id + "-" + (updated or "") + ".json.gz"
+
+    def __contains__(self, key):
+        product_id, updated = key
+        return (updated or "") in self.entries.get(product_id, ())
+
+    def _read(self, product_id, updated):
+        try:
+            with self.store.open(self._path(product_id, updated)) as f:
+                with gzip.open(f, 'rb') as data:
+                    return json.load(data)
+        except Exception as ex:
+            self.log.warning("Could not read cached details of product {}: {}".format(product_id, repr(ex)))
+            with self.lock:
+                self.errors += 1
+            return None
+
+    def get_many(self, items):
+        """
+        Returns { product_id : details } for the catalog rows with a cached entry, counting hits and misses
+        once per product, not per catalog row
+        :param items: catalog rows with product_id and updated
+        """
+        keys = list(dict.fromkeys((item['product_id'], item.get('updated')) for item in items))
+        found = [key for key in keys if key in self]
+        details = {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers = self.workers) as executor:
+            for (product_id, updated), data in zip(found, executor.map(lambda key: self._read(*key), found)):
+                if data is not None:
+                    details[product_id] = data
+        with self.lock:
+            self.hits += len(details)
+            self.misses += len(set(product_id for product_id, updated in keys)) - len(details)
+        return details
+
+    def put(self, product_id, updated, data):
+        """
+        Save the details of one product and remove its entries for older Updated values
+        """
+        self._write(product_id, updated, json.dumps(data, separators=(",", ":")).encode('utf-8'))
+
+    def put_later(self, product_id, updated, data):
+        """
+        put() in a background thread, the details are serialized before this returns. close() waits for the writes.
+        """
+        encoded = json.dumps(data, separators=(",", ":")).encode('utf-8')
+        with self.lock:
+            if self.writer is None:
+                self.writer = concurrent.futures.ThreadPoolExecutor(max_workers = self.workers)
+        return self.writer.submit(self._write, product_id, updated, encoded)
+
+    def close(self):
+        with self.lock:
+            writer, self.writer = self.writer, None
+        if writer:
+            writer.shutdown(wait = True)
+
+    def _write(self, product_id, updated, encoded):
+        try:
+            self.store.write(self._path(product_id, updated), gzip.compress(encoded, compresslevel=6))
+        except Exception as ex:
+            self.log.warning("Could not cache details of product {}: {}".format(product_id, repr(ex)))
+            with self.lock:
+                self.errors += 1
+            return
+        with self.lock:
+            self.writes += 1
+            superseded = self.entries.get(product_id, set()) - {updated or ""}
+            self.entries[product_id] = {updated or ""}
+        for old in superseded:
+            try:
+                self.store.rm(self._path(product_id, old))
+            except Exception:
+                pass
+
+    def get_stats(self):
+        return {
+            "hits" : self.hits,
+            "misses" : self.misses,
+            "writes" : self.writes,
+            "errors" : self.errors,
+        }
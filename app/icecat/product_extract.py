@@ -0,0 +1,91 @@
+import io
+import xml.etree.cElementTree as ET
+
+'''
+Streaming extraction of the parts of an Icecat product XML that IceCatProductDetails reads
+'''
+
+# children of <Product> used by IceCatProductDetails._parse and parseMixin
+PRODUCT_KEYS = frozenset((
+    'Category', 'CategoryFeatureGroup', 'EANCode', 'EndOfLifeDate', 'BulletPoints', 'GeneratedIntTitle',
+    'ProductDescription', 'ProductFeature', 'ProductGallery', 'ReasonsToBuy', 'ReleaseDate', 'SummaryDescription',
+))
+
+
+def extract_product(source, keys=PRODUCT_KEYS):
+    """
+    Return the <Product> element of an Icecat product XML in the shape of
+    xmltodict.parse(source, attr_prefix='')['ICECAT-interface']['Product'], limited to the Product attributes
+    and the children named in `keys`. Every other child is cleared as soon as it is parsed, so large
+    unused parts of the sheet never build up a tree.
+    :param source: file object or bytes of the XML
+    :param keys: names of the Product children to keep
+    Raises KeyError when there is no ICECAT-interface/Product element, like the xmltodict lookup.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    product = None
+    product_elem = None
+    in_product = False
+    depth = 0
+    # depth of the unused element being skipped, 0 when none
+    skipping = 0
+    for event, elem in ET.iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            depth += 1
+            if depth == 1 and elem.tag != 'ICECAT-interface':
+                raise KeyError('ICECAT-interface')
+            if depth == 2 and elem.tag == 'Product' and product_elem is None:
+                product = dict(elem.attrib)
+                product_elem = elem
+                in_product = True
+            elif depth == 3 and not skipping and not (in_product and elem.tag in keys):
+                skipping = depth
+            continue
+
+        if skipping:
+            elem.clear()
+            if depth == skipping:
+                skipping = 0
+        elif depth == 3:
+            _push(product, elem.tag, _convert(elem))
+        if depth == 3 and in_product:
+            # the only child left in Product, removing it is cheap
+            product_elem.remove(elem)
+        elif depth == 2:
+            in_product = False
+            elem.clear()
+        depth -= 1
+    if product is None:
+        raise KeyError('Product')
+    return product
+
+
+def _push(item, key, value):
+    # a repeated key, or a child named like an attribute, turns into a list in document order
+    if key in item:
+        if isinstance(item[key], list):
+            item[key].append(value)
+        else:
+            item[key] = [item[key], value]
+    else:
+        item[key] = value
+
+
+def _convert(elem):
+    # xmltodict's shape: attributes, then children, then the stripped text as '#text';
+    # an element without attributes and children is its text, or None when empty
+    item = dict(elem.attrib) if elem.attrib else None
+    text = elem.text or ""
+    for child in elem:
+        if item is None:
+            item = {}
+        _push(item, child.tag, _convert(child))
+        if child.tail:
+            text += child.tail
+    text = text.strip()
+    if item is None:
+        return text or None
+    if text:
+        item['#text'] = text
+    return item
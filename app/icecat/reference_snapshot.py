@@ -0,0 +1,144 @@
+from threading import Lock
+import logging
+import os
+import pickle
+import time
+from app.icecat import blob_store
+
+'''
+Parsed Icecat reference lists kept as binary snapshots, so an import does not parse them again
+'''
+
+# bump when the parsed attributes of a reference list change shape, older snapshots are then ignored
+SNAPSHOT_VERSION = "1"
+
+
+class ReferenceSnapshotCache(object):
+    """
+    The SNAPSHOT_ATTRS of a parsed reference list (IceCatSupplierList, IceCatLanguageMapping, ...) by class,
+    language and the version of its source object (GCS generation), in memory and pickled to
+    <root>/v<SNAPSHOT_VERSION>/<module.class>-<lang_id>-<version>.pickle.
+    Within `ttl` seconds of the last check an in memory snapshot is used without asking the bucket for the
+    source's version. Every instance restored from one snapshot shares its objects, they are read only.
+    :param root: defaults to $REFERENCE_SNAPSHOT_DIR or _data/snapshots
+    :param ttl: defaults to $REFERENCE_SNAPSHOT_TTL or 300
+    :param store: blob_store.BlobStore holding the sources, defaults to get_blob_store()
+    :param log: An optional logging.getLogger() instance
+    """
+
+    def __init__(self, root=None, ttl=None, store=None, log=None):
+        root = root or os.environ.get("REFERENCE_SNAPSHOT_DIR", "_data/snapshots")
+        self.dir = os.path.join(root, "v" + SNAPSHOT_VERSION)
+        self.ttl = float(ttl if ttl is not None else os.environ.get("REFERENCE_SNAPSHOT_TTL", "300"))
+        self.store = store or blob_store.get_blob_store()
+        self.log = log or logging.getLogger()
+        self.lock = Lock()
+        # (class, lang_id) -> [version, checked at, { attribute : value }]
+        self.snapshots = {}
+        # (class, lang_id) -> Lock held while it is restored or parsed
+        self.loading = {}
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.parses = 0
+
+    def _path(self, name, lang_id, version):
+        return os.path.join(self.dir, "{}-{}-{}.pickle".format(name, lang_id, version.replace("/", "_")))
+
+    def restore(self, obj, path, lang_id, parse):
+        """
+        Set the SNAPSHOT_ATTRS of `obj` from the snapshot of the current version of `path`,
+        else call parse() (which downloads `path` when missing) and save a snapshot of the result.
+        """
+        name = type(obj).__module__ + "." + type(obj).__name__
+        key = (name, lang_id)
+        with self.lock:
+            snapshot = self.snapshots.get(key)
+            if snapshot and time.time() - snapshot[1] < self.ttl:
+                self.memory_hits += 1
+                obj.__dict__.update(snapshot[2])
+                return
+            key_lock = self.loading.setdefault(key, Lock())
+
+        with key_lock:
+            try:
+                version = self.store.version(path)
+            except FileNotFoundError:
+                version = None
+            with self.lock:
+                snapshot = self.snapshots.get(key)
+                if snapshot and version is not None and snapshot[0] == version:
+                    # another request restored it, or the source is unchanged since the last check
+                    snapshot[1] = time.time()
+                    self.memory_hits += 1
+                    obj.__dict__.update(snapshot[2])
+                    return
+
+            state = self._read(name, lang_id, version) if version is not None else None
+            if state is not None:
+                with self.lock:
+                    self.disk_hits += 1
+            else:
+                parse()
+                if version is None:
+                    version = self.store.version(path)
+                state = { attr : getattr(obj, attr) for attr in obj.SNAPSHOT_ATTRS }
+                with self.lock:
+                    self.parses += 1
+                self._write(name, lang_id, version, state)
+            with self.lock:
+                self.snapshots[key] = [version, time.time(), state]
+            obj.__dict__.update(state)
+
+    def _read(self, name, lang_id, version):
+        try:
+            with open(self._path(name, lang_id, version), 'rb') as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as ex:
+            self.log.warning("Could not read the {} snapshot: {}".format(name, repr(ex)))
+            return None
+
+    def _write(self, name, lang_id, version, state):
+        path = self._path(name, lang_id, version)
+        try:
+            os.makedirs(self.dir, exist_ok=True)
+            # write then rename, a reader never sees half a snapshot
+            with open(path + ".part", 'wb') as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(path + ".part", path)
+        except Exception as ex:
+            self.log.warning("Could not save the {} snapshot: {}".format(name, repr(ex)))
+            return
+        # snapshots of older versions of the source
+        prefix = "{}-{}-".format(name, lang_id)
+        for file_name in os.listdir(self.dir):
+            if file_name.startswith(prefix) and file_name.endswith(".pickle") and os.path.join(self.dir, file_name) != path:
+                try:
+                    os.remove(os.path.join(self.dir, file_name))
+                except OSError:
+                    pass
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                "memory_hits" : self.memory_hits,
+                "disk_hits" : self.disk_hits,
+                "parses" : self.parses,
+            }
+
+
+_cache = None
+_cache_lock = Lock()
+
+
+def get_reference_snapshot_cache():
+    """
+    Return the process wide ReferenceSnapshotCache
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ReferenceSnapshotCache()
+    return _cache
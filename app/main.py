@@ -197,9 +197,9 @@ async def handle_Supplier_Category_Language_Database( authorized: Boolean = Depe
         return JSONResponse(content=json_compatible_item_data)
 
 @app.get('/sync_catalog_index_from_Icecat')
-async def handle_CatalogIndex_Database( authorized: Boolean = Depends(get_current_username)):
+async def handle_CatalogIndex_Database( streaming: bool = True, delta: bool = False, full_index: bool = False, pipelined: bool = False, keep_file: bool = False, bulk: bool = False, loader_workers: int = 0, authorized: Boolean = Depends(get_current_username)):
     if authorized:
-        res = icecat_admin.IceCatDatabase().syncCatalogIndexDatabase()
+        res = icecat_admin.IceCatDatabase().syncCatalogIndexDatabase(streaming = streaming, delta = delta, full_index = full_index, pipelined = pipelined, keep_file = keep_file, bulk = bulk, loader_workers = loader_workers)
         json_compatible_item_data = jsonable_encoder(res)
         return JSONResponse(content=json_compatible_item_data)        
 
@@ -0,0 +1,207 @@
+import random
+import threading
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from xml.sax.saxutils import quoteattr
+
+'''
+Synthetic Icecat product detail XMLs and a local HTTP stand-in for data.icecat.biz/export/freexml/,
+shared by the product download and parse benchmarks.
+'''
+
+FEATURE_GROUPS = ["Display", "Processor", "Memory", "Storage", "Networking", "Ports & interfaces", "Battery", "Weight & dimensions"]
+
+
+def product_xml(product_id, features=40, seed=None, related=0, category="Notebooks"):
+    """
+    Return the bytes of an Icecat like product XML with `features` ProductFeature elements
+    and `related` ProductRelated elements (not read by IceCatProductDetails), in category `category`
+    """
+    rnd = random.Random(seed if seed is not None else int(product_id))
+    groups = "".join(
+        '<CategoryFeatureGroup ID="{0}" No="{1}"><FeatureGroup ID="{2}"><Name ID="{3}" Value={4} langid="1"/></FeatureGroup></CategoryFeatureGroup>'.format(
+            100 + i, i, 200 + i, 300 + i, quoteattr(name)) for i, name in enumerate(FEATURE_GROUPS))
+    feature_xml = []
+    for i in range(features):
+        group = 100 + i % len(FEATURE_GROUPS)
+        if i % 3 == 0:
+            value = str(rnd.randint(1, 512))
+            measure = '<Measure ID="29"><Signs><Sign ID="1" langid="1">GB</Sign></Signs></Measure>'
+            presentation = value + " GB"
+        elif i % 3 == 1:
+            value = rnd.choice(["Y", "N"])
+            measure = '<Measure ID="0"/>'
+            presentation = value
+        else:
+            value = "Feature text {} for product {}".format(i, product_id)
+            measure = '<Measure ID="0"/>'
+            presentation = value
+        feature_xml.append(
+            '<ProductFeature ID="{0}" Localized="0" CategoryFeature_ID="{1}" CategoryFeatureGroup_ID="{2}" No="{3}" '
+            'Presentation_Value={4} Translated="" Mandatory="1" Searchable="0" Value={5}>'
+            '<LocalValue Value={5}>{6}</LocalValue>'
+            '<Feature ID="{7}">{6}<Name ID="{8}" Value={9} langid="1"/></Feature></ProductFeature>'.format(
+                product_id * 100 + i, 5000 + i, group, i, quoteattr(presentation), quoteattr(value), measure,
+                900 + i, 1900 + i, quoteattr("Feature {}".format(i))))
+    pictures = "".join(
+        '<ProductPicture No="{0}" Original="https://images.icecat.biz/img/gallery/{1}_{0}.jpg" Pic="https://images.icecat.biz/img/gallery/{1}_{0}.jpg" Size="{2}"/>'.format(
+            n, product_id, rnd.randint(10000, 90000)) for n in range(1, 6))
+    related_xml = "".join(
+        '<ProductRelated ID="{0}" Category_ID="151" Preferred="0"><Product ID="{1}" Prod_id="PN-{1}" Name="Related product {1}">'
+        '<Supplier ID="1" Name="HP"/><ProductFamily ID="1"/></Product></ProductRelated>'.format(product_id * 1000 + n, product_id + n + 1)
+        for n in range(related))
+    long_summary = "Long summary of product {}: ".format(product_id) + " ".join("word{}".format(rnd.randint(1, 500)) for w in range(60))
+    xml = (
+        '<?xml version="1.0" encoding="UTF-8"?>\n<ICECAT-interface>'
+        '<Product Code="1" ID="{0}" Prod_id="PN-{0}" Title={1} Quality="ICECAT" ReleaseDate="2021-03-01">'
+        '<Category ID="151"><Name ID="1" Value={10} langid="1"/></Category>{2}'
+        '<EANCode EAN="{3}"/><EANCode EAN="{4}"/>'
+        '<ProductDescription ID="{0}" LongDesc={5} ManualPDFURL="" PDFURL="https://objects.icecat.biz/{0}.pdf" WarrantyInfo="2 years" langid="1"/>'
+        '{6}<ProductGallery>{7}</ProductGallery><ReleaseDate>2021-03-01</ReleaseDate>'
+        '<SummaryDescription><ShortSummaryDescription langid="1">Product {0}</ShortSummaryDescription>'
+        '<LongSummaryDescription langid="1">{8}</LongSummaryDescription></SummaryDescription>'
+        '<BulletPoints><BulletPoint langid="1" Value="Fast and light"/><BulletPoint langid="1" Value="Long battery life"/></BulletPoints>'
+        '{9}</Product></ICECAT-interface>\n').format(
+            product_id, quoteattr("Product {}".format(product_id)), groups, 8700000000000 + product_id,
+            8800000000000 + product_id, quoteattr("<p>Description of product {}</p>".format(product_id) * 10),
+            "".join(feature_xml), pictures, long_summary, related_xml, quoteattr(category))
+    return xml.encode('utf-8')
+
+
+def _slug(name):
+    return name.lower().replace(" ", "_").replace("/", "_").replace(".", "_").replace("(", "_").replace(")", "_")
+
+
+def mixin_schemas(features=40, category="Notebooks"):
+    """
+    Return { "<category>-<feature group>" : mixin schema } for the products of product_xml(), the file names
+    IceCatProductDetails.parseMixin loads from gs://$GOOGLE_BUCKET_NAME/<key>.json
+    """
+    schemas = {}
+    for i in range(features):
+        key = _slug(category) + "-" + _slug(FEATURE_GROUPS[i % len(FEATURE_GROUPS)])
+        properties = schemas.setdefault(key, {"type": "object", "properties": {}})["properties"]
+        if i % 3 == 0:
+            properties[_slug("Feature {}".format(i))] = {"$ref": "https://res.cloudinary.com/saas-ag/raw/upload/schemata/atomic_uom.json"}
+        elif i % 3 == 1:
+            properties[_slug("Feature {}".format(i))] = {"type": ["boolean"]}
+        else:
+            properties[_slug("Feature {}".format(i))] = {"type": ["string"]}
+    return schemas
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+class ProductXMLServer(object):
+    """
+    Local stand-in for data.icecat.biz serving /export/freexml/<lang>/<product_id>.xml.
+    Use as a context manager, the base url is in .url.
+    :param latency: seconds slept before every response
+    :param features: ProductFeature elements per product
+    :param capacity: requests served at the same time, more get a 429 (throttling), 0 for no limit
+    :param error_rate: share of the requests answered with a 503
+    :param drop_rate: share of the requests whose connection is closed without a response
+    Products get a Last-Modified of .modified[product_id] (epoch seconds, default .started) and
+    If-Modified-Since requests for unchanged products are answered with a 304.
+    """
+
+    def __init__(self, latency=0.02, features=40, capacity=0, error_rate=0.0, drop_rate=0.0):
+        self.latency = latency
+        self.features = features
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.in_flight = 0
+        self.throttled = 0
+        self.errors = 0
+        self.bytes_sent = 0
+        self.not_modified = 0
+        self.started = int(time.time())
+        self.modified = {}
+        self._cache = {}
+        self._random = random.Random(7)
+
+    def body(self, product_id):
+        data = self._cache.get(product_id)
+        if data is None:
+            data = self._cache.setdefault(product_id, product_xml(product_id, self.features))
+        return data
+
+    def _reply_status(self, handler, status):
+        handler.send_response(status)
+        handler.send_header("Content-Length", "0")
+        handler.end_headers()
+
+    def handle(self, handler):
+        with self.lock:
+            self.requests += 1
+            self.in_flight += 1
+            in_flight = self.in_flight
+            chance = self._random.random()
+        try:
+            if self.capacity and in_flight > self.capacity:
+                with self.lock:
+                    self.throttled += 1
+                return self._reply_status(handler, 429)
+            if chance < self.drop_rate:
+                with self.lock:
+                    self.errors += 1
+                handler.close_connection = True
+                return
+            if chance < self.drop_rate + self.error_rate:
+                with self.lock:
+                    self.errors += 1
+                return self._reply_status(handler, 503)
+            time.sleep(self.latency)
+            self._send_product(handler)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    def _send_product(self, handler):
+        product_id = int(handler.path.rsplit("/", 1)[-1].split(".")[0])
+        modified = self.modified.get(product_id, self.started)
+        since = handler.headers.get("If-Modified-Since")
+        if since and parsedate_to_datetime(since).timestamp() >= modified:
+            with self.lock:
+                self.not_modified += 1
+            return self._reply_status(handler, 304)
+        data = self.body(product_id)
+        handler.send_response(200)
+        handler.send_header("Last-Modified", formatdate(modified, usegmt=True))
+        handler.send_header("Content-Type", "application/xml")
+        handler.send_header("Content-Length", str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
+        with self.lock:
+            self.bytes_sent += len(data)
+
+    def __enter__(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                server.handle(self)
+
+        self.httpd = _Server(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        self.url = "http://127.0.0.1:{}/export/freexml/EN/".format(self.httpd.server_port)
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def urls(self, product_ids):
+        return [self.url + "{}.xml".format(product_id) for product_id in product_ids]
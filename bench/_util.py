@@ -0,0 +1,53 @@
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+'''
+Shared helpers for the offline benchmarks. Run every benchmark from the repository root, e.g.
+    python -m bench.catalog_index
+'''
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def peak_rss_mb():
+    """
+    Peak resident set size of the current process in MB (ru_maxrss is KB on Linux, bytes on macOS)
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        peak = peak / 1024
+    return round(peak / 1024, 1)
+
+
+def run_child(module, *args):
+    """
+    Run `python -m module args...` in a fresh interpreter so every measurement starts from a clean heap.
+    The child prints one JSON line with its results as its last output line.
+    """
+    out = subprocess.run([sys.executable, "-m", module] + [str(a) for a in args], cwd=REPO_ROOT,
+                         check=True, capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def report(result):
+    print(json.dumps(result))
+
+
+class Timer(object):
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = round(time.perf_counter() - self.start, 3)
+
+
+def print_table(rows, columns):
+    widths = [max(len(str(c)), *(len(str(r.get(c, ""))) for r in rows)) for c in columns]
+    print("  ".join(str(c).ljust(w) for c, w in zip(columns, widths)))
+    for row in rows:
+        print("  ".join(str(row.get(c, "")).ljust(w) for c, w in zip(columns, widths)))
@@ -0,0 +1,87 @@
+import argparse
+import gzip
+import os
+import shutil
+import tempfile
+import xml.etree.cElementTree as ET
+from xml.sax.saxutils import quoteattr
+
+from bench import _util
+from bench._product_xml import product_xml
+from bench.explode_categories import make_categories
+
+'''
+The reference list and product XML reads of the import pipeline, offline on a LocalBlobStore:
+CategoriesList.xml.gz through IceCatCategoryMapping, and --products product XMLs read with iterparse,
+with memory mapped versus buffered reads (LocalBlobStore maps files from 1 MB on).
+Also times saving the product XMLs through the store.
+
+    python -m bench.blob_store --products 5000 --categories 100000
+'''
+
+
+def categories_xml(count):
+    rows = []
+    for category in make_categories(count):
+        rows.append('<Category ID="{0}"><Name ID="{0}" Value={1} langid="1"/><Description ID="{0}" Value="" langid="1"/>'
+                    '<ParentCategory ID="{2}"/></Category>'.format(category['ID'], quoteattr(category['Name']), category['ParentID']))
+    return ('<?xml version="1.0" encoding="UTF-8"?>\n<ICECAT-interface><Response><CategoriesList>'
+            + "".join(rows) + '</CategoriesList></Response></ICECAT-interface>\n').encode('utf-8')
+
+
+def read_products(store, paths):
+    features = 0
+    for path in paths:
+        with store.open(path) as f:
+            for event, elem in ET.iterparse(f):
+                if elem.tag == 'ProductFeature':
+                    features += 1
+    return features
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--categories", type=int, default=100000)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="blobs")
+    cwd = os.getcwd()
+    os.environ["BLOB_STORE"] = "local"
+    os.environ["BLOB_STORE_PATH"] = root
+    os.environ["GOOGLE_PRODUCT_BUCKET"] = "products"
+    # imported after the env is set, the icecat modules take the process wide store on import
+    from app.icecat import blob_store
+    from app.icecat import icecat_product
+    store = blob_store.get_blob_store()
+    results = []
+    try:
+        os.chdir(root)
+        data = [product_xml(product_id) for product_id in range(1, args.products + 1)]
+        paths = ["gs://products/{}.xml".format(product_id) for product_id in range(1, args.products + 1)]
+        with _util.Timer() as t:
+            for path, xml in zip(paths, data):
+                store.write(path, xml)
+        size = sum(len(xml) for xml in data)
+        results.append({"step": "save product XMLs", "files": len(paths), "MB": round(size / 1e6, 1), "seconds": t.elapsed,
+                        "MB_per_s": round(size / 1e6 / t.elapsed, 1)})
+
+        store.write("gs://products/CategoriesList.xml.gz", gzip.compress(categories_xml(args.categories)))
+        for read, mmap_min_size in (("buffered", None), ("mmap", 0)):
+            store.mmap_min_size = mmap_min_size
+            with _util.Timer() as t:
+                categories = icecat_product.IceCatCategoryMapping(data_dir=root + "/")
+            results.append({"step": "IceCatCategoryMapping, " + read, "files": 1, "MB": round(os.path.getsize(store.local_path("gs://products/CategoriesList.xml.gz")) / 1e6, 1),
+                            "seconds": t.elapsed, "MB_per_s": "", "items": len(categories.id_map)})
+            with _util.Timer() as t:
+                features = read_products(store, paths)
+            results.append({"step": "iterparse product XMLs, " + read, "files": len(paths), "MB": round(size / 1e6, 1), "seconds": t.elapsed,
+                            "MB_per_s": round(size / 1e6 / t.elapsed, 1), "items": features})
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(root)
+    _util.print_table(results, ["step", "files", "MB", "seconds", "MB_per_s", "items"])
+
+
+if __name__ == "__main__":
+    main()
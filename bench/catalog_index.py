@@ -0,0 +1,72 @@
+import argparse
+import os
+import random
+import tempfile
+from types import SimpleNamespace
+
+from bench import _util
+
+'''
+Compare the recursive IceCatDatabase.pt() parse of files.index.xml with the streaming
+catalog_index.iter_catalog_index() path: wall time and peak RSS while producing 10,000 row chunks.
+
+    python -m bench.catalog_index --rows 500000
+'''
+
+CHUNK_SIZE = 10000
+
+
+def write_index(path, rows):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<ICECAT-interface>\n<files.index Generated="20221001000000">\n')
+        for product_id in range(1, rows + 1):
+            f.write(
+                '<file path="export/freexml.int/EN/{0}.xml" Limited="No" HighPic="https://images.icecat.biz/img/norm/high/{0}.jpg" '
+                'HighPicSize="43275" HighPicWidth="400" HighPicHeight="400" Product_ID="{0}" Updated="2022{1:02d}{2:02d}101010" '
+                'Quality="ICECAT" Prod_ID="PN-{0}" Supplier_id="{3}" Catid="{4}" On_Market="1" Model_Name="Model {0}" '
+                'Product_View="{5}" Date_Added="20120101000000">\n'
+                '<EAN_UPCS><EAN_UPC Value="{6:013d}" IsApproved="1"/></EAN_UPCS>\n'
+                '<Country_Markets><Country_Market Value="NL"/><Country_Market Value="DE"/><Country_Market Value="GB"/></Country_Markets>\n'
+                '</file>\n'.format(product_id, random.randint(1, 12), random.randint(1, 28), random.randint(1, 5000),
+                                   random.randint(1, 7000), random.randint(0, 100000), product_id))
+        f.write('</files.index>\n</ICECAT-interface>\n')
+
+
+def run(mode, path):
+    rows = 0
+    with _util.Timer() as timer:
+        if mode == "streaming":
+            from app.icecat import catalog_index
+            with open(path, 'rb') as f:
+                for chunk in catalog_index.divide_iter_by_chunksize(catalog_index.iter_catalog_index(f), CHUNK_SIZE):
+                    rows += len(chunk)
+        else:
+            from app.icecat.icecat_admin import IceCatDatabase
+            db = IceCatDatabase()
+            db.bar = SimpleNamespace(update=lambda *args: None)
+            catalogs = db.parse_xml(path)['icecat-interface']['files.index']['file']
+            for chunk in db.divide_list_by_chunksize(catalogs, CHUNK_SIZE):
+                rows += len(chunk)
+    _util.report({"mode": mode, "rows": rows, "wall_s": timer.elapsed, "peak_rss_mb": _util.peak_rss_mb()})
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--run", choices=["recursive", "streaming"])
+    parser.add_argument("--file")
+    args = parser.parse_args()
+
+    if args.run:
+        return run(args.run, args.file)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "files.index.xml")
+        write_index(path, args.rows)
+        print(" - generated {} rows, {:.1f} MB".format(args.rows, os.path.getsize(path) / 1024 / 1024))
+        results = [_util.run_child("bench.catalog_index", "--run", mode, "--file", path) for mode in ("recursive", "streaming")]
+    _util.print_table(results, ["mode", "rows", "wall_s", "peak_rss_mb"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import argparse
+import random
+import time
+from types import SimpleNamespace
+
+from app.icecat import catalog_loader
+from bench import _util
+
+'''
+Throughput of catalog_loader.LoaderPool with TempTableChunkLoader against a fake BigQuery client
+that only sleeps for the round trip of each call, for a growing number of workers.
+
+    python -m bench.catalog_loader_pool --chunks 40 --latency-ms 150 --failure-rate 0.05
+'''
+
+
+class FakeBigQueryClient(object):
+    """
+    Stand-in for bigquery.Client: create_table, insert_rows_json, query().result() and delete_table
+    each cost one simulated round trip; insert_rows_json fails at the given rate to exercise retries.
+    """
+
+    def __init__(self, latency_ms, failure_rate=0.0):
+        self.latency = latency_ms / 1000
+        self.failure_rate = failure_rate
+        self.calls = 0
+
+    def _round_trip(self, factor=1):
+        self.calls += 1
+        time.sleep(self.latency * factor * random.uniform(0.8, 1.2))
+
+    def create_table(self, table):
+        self._round_trip()
+        return SimpleNamespace(project=table.project, dataset_id=table.dataset_id, table_id=table.table_id)
+
+    def insert_rows_json(self, table_id, rows):
+        self._round_trip(2)
+        if random.random() < self.failure_rate:
+            return [{"index": 0, "errors": ["simulated failure"]}]
+        return []
+
+    def query(self, query):
+        self._round_trip(4)
+        return SimpleNamespace(result=lambda: [])
+
+    def delete_table(self, table_id, not_found_ok=False):
+        self._round_trip()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=40)
+    parser.add_argument("--latency-ms", type=int, default=150)
+    parser.add_argument("--failure-rate", type=float, default=0.05)
+    parser.add_argument("--workers", default="1,2,4,8,16")
+    args = parser.parse_args()
+
+    rows = [{"product_id": str(i)} for i in range(10000)]
+    results = []
+    for workers in [int(w) for w in args.workers.split(",")]:
+        client = FakeBigQueryClient(args.latency_ms, args.failure_rate)
+        loader = catalog_loader.TempTableChunkLoader(client)
+        pool = catalog_loader.LoaderPool(loader.load, workers=workers, retry_delay=args.latency_ms / 1000)
+        with _util.Timer() as timer:
+            for i in range(args.chunks):
+                pool.put(rows)
+            pool.join()
+        report = pool.report()
+        results.append({"workers": workers, "wall_s": timer.elapsed, "chunks_per_s": round(args.chunks / timer.elapsed, 2),
+                        "merged": report["merged_chunks"], "failed": report["failed_chunks"], "retries": report["retries"]})
+    _util.print_table(results, ["workers", "wall_s", "chunks_per_s", "merged", "failed", "retries"])
+
+
+if __name__ == "__main__":
+    main()
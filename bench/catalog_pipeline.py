@@ -0,0 +1,84 @@
+import argparse
+import os
+import tempfile
+import time
+
+from app.icecat import catalog_index
+from app.icecat import catalog_loader
+from bench import _util
+from bench.catalog_index import write_index
+
+'''
+Sequential download -> parse -> load versus the pipelined catalog sync (StreamBuffer + LoaderPool).
+The download is simulated by a throttled chunk iterator and the BigQuery load by a fixed sleep per chunk,
+so the total should drop from download + parse + load to roughly the slowest of the three.
+
+    python -m bench.catalog_pipeline --rows 200000 --mbps 20 --load-ms 300
+'''
+
+CHUNK_SIZE = 10000
+
+
+def throttled_chunks(path, mbps, chunk_size=64 * 1024):
+    delay = chunk_size / (mbps * 1024 * 1024)
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            time.sleep(delay)
+            yield chunk
+
+
+def fake_load(load_ms):
+    def load(rows):
+        time.sleep(load_ms / 1000)
+        return True
+    return load
+
+
+def sequential(path, mbps, load_ms):
+    local = path + ".download"
+    with open(local, 'wb') as f:
+        for chunk in throttled_chunks(path, mbps):
+            f.write(chunk)
+    load = fake_load(load_ms)
+    with open(local, 'rb') as f:
+        chunks = list(catalog_index.divide_iter_by_chunksize(catalog_index.iter_catalog_index(f), CHUNK_SIZE))
+    for rows in chunks:
+        load(rows)
+    os.remove(local)
+
+
+def pipelined(path, mbps, load_ms):
+    index_file = catalog_index.StreamBuffer(throttled_chunks(path, mbps))
+    loader_pool = catalog_loader.LoaderPool(fake_load(load_ms))
+    for rows in catalog_index.divide_iter_by_chunksize(catalog_index.iter_catalog_index(index_file), CHUNK_SIZE):
+        loader_pool.put(rows)
+    loader_pool.join()
+    index_file.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--mbps", type=float, default=20, help="simulated download speed in MB/s")
+    parser.add_argument("--load-ms", type=int, default=300, help="simulated temp table + MERGE time per chunk")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "files.index.xml")
+        write_index(path, args.rows)
+        size_mb = os.path.getsize(path) / 1024 / 1024
+        chunks = -(-args.rows // CHUNK_SIZE)
+        results = [{"mode": "download only", "wall_s": round(size_mb / args.mbps, 3)},
+                   {"mode": "load only", "wall_s": round(chunks * args.load_ms / 1000, 3)}]
+        for mode in (sequential, pipelined):
+            with _util.Timer() as timer:
+                mode(path, args.mbps, args.load_ms)
+            results.append({"mode": mode.__name__, "wall_s": timer.elapsed})
+    _util.print_table(results, ["mode", "wall_s"])
+
+
+if __name__ == "__main__":
+    main()
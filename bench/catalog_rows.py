@@ -0,0 +1,61 @@
+import argparse
+import random
+import tracemalloc
+
+from app.icecat import catalog_index
+from bench import _util
+
+'''
+Memory of the selected catalog rows held by IceCatCatalog: plain 17 key dicts (as built from the
+BigQuery result before) versus catalog_index.CatalogRow, per 100k rows.
+
+    python -m bench.catalog_rows --rows 100000
+'''
+
+
+def bigquery_rows(rows):
+    # every value is a fresh str, like the values decoded from a BigQuery result page
+    for product_id in range(1, rows + 1):
+        yield {
+            'path': "export/freexml.int/EN/{}.xml".format(product_id), 'limited': "No",
+            'highpic': "https://images.icecat.biz/img/norm/high/{}.jpg".format(product_id),
+            'highpicsize': str(random.randint(10000, 90000)), 'highpicwidth': str(400), 'highpicheight': str(400),
+            'product_id': str(product_id), 'updated': "2022{:02d}{:02d}101010".format(random.randint(1, 12), random.randint(1, 28)),
+            'quality': "ICECAT", 'prod_id': "PN-{}".format(product_id), 'supplier_id': str(random.randint(1, 300)),
+            'catid': str(random.randint(1, 900)), 'on_market': str(1), 'model_name': "Model {}".format(product_id),
+            'product_view': str(random.randint(0, 100000)), 'date_added': "20120101000000",
+            'country_markets': ",".join(random.sample(["NL", "DE", "GB", "FR", "IT", "AT", "CH"], 3)),
+        }
+
+
+def measure(build, rows):
+    tracemalloc.start()
+    catalogs = [build(row) for row in bigquery_rows(rows)]
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del catalogs
+    return current
+
+
+def as_dict(row):
+    row = dict(row)
+    row['country_markets'] = row['country_markets'].split(",")
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100000)
+    args = parser.parse_args()
+
+    results = []
+    for name, build in (("dict", as_dict), ("CatalogRow", catalog_index.CatalogRow)):
+        size = measure(build, args.rows)
+        results.append({"container": name, "rows": args.rows, "mb": round(size / 1024 / 1024, 1),
+                        "mb_per_100k": round(size / args.rows * 100000 / 1024 / 1024, 1),
+                        "bytes_per_row": int(size / args.rows)})
+    _util.print_table(results, ["container", "rows", "mb", "mb_per_100k", "bytes_per_row"])
+
+
+if __name__ == "__main__":
+    main()
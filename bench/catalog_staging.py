@@ -0,0 +1,68 @@
+import argparse
+import json
+import os
+import tempfile
+
+from app.icecat import catalog_index
+from app.icecat import catalog_loader
+from bench import _util
+from bench.catalog_index import write_index
+
+'''
+Offline cost of the two catalog load paths, without BigQuery:
+ - per-chunk: every 10,000 rows are encoded as an insert_rows_json request body
+   (plus create table, MERGE and delete table calls per chunk)
+ - bulk: every row is written once to an NDJSON staging file with the local stand-in writer
+   (plus one upload, one load job, one MERGE and one delete table call)
+
+    python -m bench.catalog_staging --rows 500000
+'''
+
+CHUNK_SIZE = 10000
+
+
+def per_chunk(path, tmp):
+    payload_bytes = 0
+    chunks = 0
+    with open(path, 'rb') as f:
+        for rows in catalog_index.divide_iter_by_chunksize(catalog_index.iter_catalog_index(f), CHUNK_SIZE):
+            # the body google-cloud-bigquery builds for insert_rows_json
+            payload_bytes += len(json.dumps({"rows": [{"json": row} for row in rows]}).encode('utf-8'))
+            chunks += 1
+    return {"api_calls": chunks * 4, "bytes_sent": payload_bytes}
+
+
+def bulk(path, tmp, compress=True):
+    staging = os.path.join(tmp, "catalog.json.gz" if compress else "catalog.json")
+    writer = catalog_loader.NDJSONStagingWriter(open(staging, 'wb'), compress=compress)
+    with open(path, 'rb') as f:
+        for rows in catalog_index.divide_iter_by_chunksize(catalog_index.iter_catalog_index(f), CHUNK_SIZE):
+            writer.write_rows(rows)
+    writer.close()
+    return {"api_calls": 4, "bytes_sent": os.path.getsize(staging)}
+
+
+def bulk_uncompressed(path, tmp):
+    return bulk(path, tmp, compress=False)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200000)
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "files.index.xml")
+        write_index(path, args.rows)
+        for mode in (per_chunk, bulk, bulk_uncompressed):
+            with _util.Timer() as timer:
+                result = mode(path, tmp)
+            result.update({"mode": mode.__name__, "wall_s": timer.elapsed,
+                           "mb_sent": round(result.pop("bytes_sent") / 1024 / 1024, 1)})
+            results.append(result)
+    _util.print_table(results, ["mode", "wall_s", "mb_sent", "api_calls"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import argparse
+import os
+import random
+import tempfile
+
+from app.icecat import catalog_store
+from bench import _util
+from bench.catalog_rows import bigquery_rows
+
+'''
+Latency of the selection queries against catalog_store.SQLiteCatalogStore, populated the way the
+catalog and search index syncs do it (chunks of 10,000 rows). The BigQuery store answers the same
+calls in seconds per query, so only the local store is measured.
+
+    python -m bench.catalog_store --rows 500000
+'''
+
+
+def category_rows(categories):
+    # a 3 level tree: 10 roots, 10 children each, leaves below
+    for category_id in range(1, categories + 1):
+        parent = "1" if category_id <= 10 else str((category_id - 1) // 10)
+        yield {'category_id': str(category_id), 'category_name': "Category {}".format(category_id),
+               'parent_cat_id': parent, 'description': ""}
+
+
+def timed(calls, fn):
+    with _util.Timer() as t:
+        for i in range(calls):
+            result = fn()
+    return round(t.elapsed / calls * 1000, 2), result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--calls", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = catalog_store.SQLiteCatalogStore(os.path.join(tmp, "catalog.sqlite3"))
+        chunk = []
+        with _util.Timer() as populate:
+            store.upsert_categories(list(category_rows(900)))
+            store.upsert_suppliers([{'supplier_id': str(i), 'supplier_name': "Supplier {}".format(i)} for i in range(1, 301)])
+            for row in bigquery_rows(args.rows):
+                chunk.append(row)
+                if len(chunk) == 10000:
+                    store.upsert_catalogs(chunk)
+                    chunk = []
+            store.upsert_catalogs(chunk)
+
+        random.seed(1)
+        root = "5"
+        category_ids = store.subcategory_ids(root)
+        supplier_ids = [str(i) for i in random.sample(range(1, 301), 5)]
+        results = [{"query": "populate ({} rows)".format(args.rows), "ms": int(populate.elapsed * 1000)}]
+        for name, fn in (
+            ("subcategory_ids", lambda: store.subcategory_ids(root)),
+            ("select_catalogs category", lambda: store.select_catalogs(category_ids, [], False, 1000)),
+            ("select_catalogs category and supplier", lambda: store.select_catalogs(category_ids, supplier_ids, True, 1000)),
+            ("count_catalogs category or supplier", lambda: store.count_catalogs(category_ids, supplier_ids, False)),
+            ("suggest_suppliers", lambda: store.suggest_suppliers(category_ids, 100)),
+        ):
+            ms, result = timed(args.calls, fn)
+            results.append({"query": name, "ms": ms, "result": result if isinstance(result, int) else len(result)})
+    _util.print_table(results, ["query", "ms", "result"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import random
+import subprocess
+import tempfile
+import types
+import xml.etree.cElementTree as ET
+from xml.sax.saxutils import quoteattr
+
+from bench import _util
+
+'''
+IceCatCategoryFeatureList.parse_xml over a CategoryFeaturesList.xml.gz, the current parser and with --baseline
+the one of an earlier commit (read with git show), e.g. the former recursive parser with a list scan per Feature
+from before the single pass. Wall time, peak RSS (each in a fresh interpreter) and a hash of the parsed items.
+Uses --file when given, e.g. the real list, else a synthetic one of --categories x --groups x --features.
+Against the recursive parser the hashes differ: it skips a Feature whose children are not parsed yet at its
+start event (an Element without children is false), so its features count runs short and the next features
+get the skipped one's group and type.
+
+    python -m bench.category_features --categories 300 --groups 15 --features 8
+    python -m bench.category_features --baseline $(git rev-parse ":/single iterative pass")~1
+    python -m bench.category_features --file _data/CategoryFeaturesList.xml.gz
+'''
+
+TYPES = ["numerical", "y_n", "range", "dropdown", "alphanumeric"]
+
+
+def write_list(path, categories, groups, features):
+    rnd = random.Random(1)
+    feature_group_id = 0
+    feature_id = 0
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<ICECAT-interface><Response ID="1" Request_ID="1" Status="1"><CategoryFeaturesList Code="1">\n')
+        for category_id in range(1, categories + 1):
+            rows = ['<Category ID="{0}" LowPic="" Score="1" Searchable="1" ThumbPic="" UNCATID="{0}" Visible="1">'
+                    '<Name ID="{0}" Value="Category {0}" langid="1"/><Name ID="{0}" Value="Kategorie {0}" langid="4"/>'.format(category_id)]
+            group_ids = []
+            for n in range(groups):
+                feature_group_id += 1
+                group_ids.append(feature_group_id)
+                rows.append('<CategoryFeatureGroup ID="{0}" No="{1}"><FeatureGroup ID="{2}"><Name ID="{2}" Value={3} langid="1"/>'
+                            '</FeatureGroup></CategoryFeatureGroup>'.format(feature_group_id, n, rnd.randint(1, 300), quoteattr("Group {}".format(n))))
+            for group_id in group_ids:
+                for n in range(features):
+                    feature_id += 1
+                    feature_type = TYPES[feature_id % len(TYPES)]
+                    sign = "GB" if feature_type in ("numerical", "range") and feature_id % 2 else ""
+                    rows.append('<Feature CategoryFeatureGroup_ID="{0}" CategoryFeature_ID="{1}" ID="{2}" LimitDirection="0" Mandatory="0" No="{3}" '
+                                'Searchable="0" Type="{4}" Use_Dropdown_Input="" ValueSorting="0">'
+                                '<Measure ID="29" Sign="{5}"><Signs><Sign ID="1" langid="1">{5}</Sign></Signs></Measure>'
+                                '<Name ID="{2}" Value={6} langid="1"/><Name ID="{2}" Value={7} langid="4"/>'
+                                '<RestrictedValue>Yes</RestrictedValue><RestrictedValue>No</RestrictedValue></Feature>'.format(
+                                    group_id, feature_id, rnd.randint(1, 50000), n, feature_type, sign,
+                                    quoteattr("Feature {} ({})".format(feature_id % 5000, n)), quoteattr("Merkmal {}".format(feature_id))))
+            rows.append('<ParentCategory ID="1"><Names><Name ID="1" langid="1">Root</Name></Names></ParentCategory></Category>\n')
+            f.write("".join(rows))
+        f.write('</CategoryFeaturesList></Response></ICECAT-interface>\n')
+
+
+def run(mode, path, baseline=None):
+    os.environ.setdefault("GOOGLE_BUCKET_NAME", "schemas")
+    from app.icecat import icecat_admin
+    import progressbar
+    parser_class = icecat_admin.IceCatCategoryFeatureList
+    if baseline:
+        # IceCatCategoryFeatureList as it was at the baseline commit, e.g. the former recursive parser
+        module = types.ModuleType("baseline_icecat_admin")
+        module.__file__ = icecat_admin.__file__
+        source = subprocess.run(["git", "show", baseline + ":app/icecat/icecat_admin.py"], check=True, capture_output=True).stdout
+        exec(compile(source, "{}:app/icecat/icecat_admin.py".format(baseline), "exec"), module.__dict__)
+        parser_class = module.IceCatCategoryFeatureList
+    features = parser_class.__new__(parser_class)
+    features.key_count = 0
+    features.bar = progressbar.NullBar()
+    features.log = icecat_admin.logging.getLogger()
+    with _util.Timer() as timer:
+        with gzip.open(path, 'rb') as f:
+            items = features.parse_xml(f, "1")
+    _util.report({"parser": mode, "features": features.key_count, "wall_s": timer.elapsed, "peak_rss_mb": _util.peak_rss_mb(),
+                  "items_sha256": hashlib.sha256(json.dumps(items, sort_keys=True).encode('utf-8')).hexdigest()[:12]})
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--categories", type=int, default=300)
+    parser.add_argument("--groups", type=int, default=15)
+    parser.add_argument("--features", type=int, default=8)
+    parser.add_argument("--baseline", help="git revision whose parser is measured too, e.g. the commit before the single pass")
+    parser.add_argument("--run")
+    parser.add_argument("--file")
+    args = parser.parse_args()
+
+    if args.run:
+        run(args.run, args.file, args.baseline)
+        return
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.abspath(args.file) if args.file else os.path.join(tmp, "CategoryFeaturesList.xml.gz")
+        if not args.file:
+            write_list(path, args.categories, args.groups, args.features)
+        with gzip.open(path, 'rb') as f:
+            size = 0
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                size += len(chunk)
+        print(" - {}: {} MB, {} MB uncompressed".format(os.path.basename(path), round(os.path.getsize(path) / 1e6, 1), round(size / 1e6, 1)))
+        results = []
+        if args.baseline:
+            results.append(_util.run_child("bench.category_features", "--run", args.baseline, "--file", path, "--baseline", args.baseline))
+        results.append(_util.run_child("bench.category_features", "--run", "current", "--file", path))
+    _util.print_table(results, ["parser", "features", "wall_s", "peak_rss_mb", "items_sha256"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+from app.icecat import category_sync
+from app.icecat import category_tree
+from bench import _util
+from bench.explode_categories import make_categories
+
+'''
+Category stage of full_import_staff against a local stand-in of the Emporix category service:
+one GET ?ecn= per category plus one POST per missing category on the main thread (before), versus
+category_sync.TenantCategorySync (paged listing, level by level parallel creation). Every request
+to the stand-in sleeps --latency ms, like a round trip to api.emporix.io.
+
+    python -m bench.category_sync --categories 500 --existing 0.5 --latency 30
+'''
+
+
+class CategoryService(object):
+    def __init__(self, latency):
+        self.latency = latency
+        self.categories = []
+        self.lock = threading.Lock()
+        self.requests = 0
+
+    def handler(self):
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, body):
+                data = json.dumps(body).encode('utf-8')
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                with service.lock:
+                    service.requests += 1
+                time.sleep(service.latency)
+                params = parse_qs(urlparse(self.path).query)
+                if 'ecn' in params:
+                    self._reply([c for c in service.categories if params['ecn'][0] in c['ecn']])
+                else:
+                    page, size = int(params['pageNumber'][0]), int(params['pageSize'][0])
+                    self._reply(service.categories[(page - 1) * size:page * size])
+
+            def do_POST(self):
+                with service.lock:
+                    service.requests += 1
+                time.sleep(service.latency)
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                category = {'id': uuid.uuid4().hex, 'ecn': body['ecn'], 'parentId': body['parentId']}
+                with service.lock:
+                    service.categories.append(category)
+                self._reply({'id': category['id']})
+
+        return Handler
+
+
+def legacy_sync(url, categories, headers):
+    # the former per-category GET and POST loop of full_import_staff
+    parent_ids = {}
+    assignmented = {}
+    for category in categories:
+        try:
+            parent_ids[category['categoryID']] = requests.get(url, params={"ecn": category['categoryID']}, headers=headers).json()[0].get('id')
+            assignmented[category['categoryID']] = parent_ids[category['categoryID']]
+        except Exception:
+            parent_id = 'root' if category['parentCategoryId'] == '1' else parent_ids.get(category['parentCategoryId'])
+            body = {"localizedName": {"en": category['Name']}, "name": category['Name'], "position": None,
+                    "published": True, "parentId": parent_id, 'ecn': [category['categoryID']]}
+            res = requests.post(url + "?publish=true", data=json.dumps(body), headers=headers).json()
+            parent_ids[category['categoryID']] = res['id']
+            assignmented[category['categoryID']] = res['id']
+    return assignmented
+
+
+def run(name, categories, existing, latency, fn):
+    service = CategoryService(latency)
+    for category in existing:
+        service.categories.append({'id': uuid.uuid4().hex, 'ecn': [category['categoryID']], 'parentId': None})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), service.handler())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    endpoint = "http://127.0.0.1:{}".format(server.server_port)
+    try:
+        with _util.Timer() as t:
+            assignmented = fn(endpoint, categories)
+    finally:
+        server.shutdown()
+    parents = {c['id']: c for c in service.categories}
+    orphans = sum(1 for c in service.categories if c['parentId'] not in (None, 'root') and c['parentId'] not in parents)
+    return {"impl": name, "categories": len(assignmented), "requests": service.requests, "seconds": t.elapsed, "orphans": orphans}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--categories", type=int, default=500)
+    parser.add_argument("--existing", type=float, default=0.5, help="share of the categories already in the tenant")
+    parser.add_argument("--latency", type=float, default=30, help="ms per request")
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    tree = make_categories(7000)
+    leaves = [c['ID'] for c in tree if c['ID'] != "1"]
+    random.seed(3)
+    categories = []
+    while len(categories) < args.categories:
+        categories = category_tree.CategoryMap(tree).explode(random.sample(leaves, len(categories) // 3 + 50))
+    categories = categories[:args.categories]
+    existing = [c for c in categories if random.random() < args.existing]
+    headers = {"Content-Type": "application/json", "Content-Language": "en"}
+    latency = args.latency / 1000.0
+
+    def legacy(endpoint, categories):
+        return legacy_sync(endpoint + "/category/t/categories", categories, headers)
+
+    def bulk(endpoint, categories):
+        sync = category_sync.TenantCategorySync(endpoint, "t", headers, "en", "root", workers=args.workers)
+        return sync.sync(categories)[1]
+
+    _util.print_table([run("per category GET + POST", categories, existing, latency, legacy),
+                       run("TenantCategorySync", categories, existing, latency, bulk)],
+                      ["impl", "categories", "requests", "seconds", "orphans"])
+
+
+if __name__ == "__main__":
+    main()
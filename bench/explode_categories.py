@@ -0,0 +1,87 @@
+import argparse
+import random
+
+from app.icecat import category_tree
+from bench import _util
+
+'''
+Categories to inject for a supplier import: the former recursive list scan of explode_categories()
+plus the O(n^2) de-duplication in full_import_staff, versus category_tree.CategoryMap, on a
+synthetic Icecat sized tree (~7,000 categories) and one category per imported product.
+
+    python -m bench.explode_categories --categories 7000 --products 10000
+'''
+
+
+def make_categories(count, depth=5, seed=1):
+    # Icecat shape: root "1", a few hundred first level categories, most products on level 3-5 leaves
+    random.seed(seed)
+    categories = [{'ID': "1", 'Name': "Root", 'ParentID': "1", 'ParentName': "", 'description': ""}]
+    levels = [["1"]]
+    per_level = max(2, int(round(count ** (1.0 / depth))))
+    next_id = 2
+    while next_id <= count:
+        for level in range(1, depth + 1):
+            if next_id > count:
+                break
+            if len(levels) <= level:
+                levels.append([])
+            parent = random.choice(levels[level - 1])
+            for i in range(per_level if level < depth else per_level * 2):
+                if next_id > count:
+                    break
+                categories.append({'ID': str(next_id), 'Name': "Category {}".format(next_id), 'ParentID': parent,
+                                   'ParentName': "", 'description': ""})
+                levels[level].append(str(next_id))
+                next_id += 1
+    random.shuffle(categories)
+    return categories
+
+
+def legacy_explode(categories, category_ids):
+    injected = []
+
+    def explode_categories(category_data, categoryId):
+        for category in category_data:
+            if category['ID'] == categoryId:
+                if categoryId == "1":
+                    pass
+                else:
+                    injected.append({"categoryID": categoryId, "Name": category['Name'], "parentCategoryId": category['ParentID']})
+                    explode_categories(category_data, category['ParentID'])
+
+    for category_id in category_ids:
+        explode_categories(categories, category_id)
+    injected.reverse()
+    pure = []
+    for i in injected:
+        if i not in pure:
+            pure.append(i)
+    return pure
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--categories", type=int, default=7000)
+    parser.add_argument("--products", type=int, default=10000)
+    args = parser.parse_args()
+
+    categories = make_categories(args.categories)
+    leaves = [c['ID'] for c in categories if c['ID'] != "1"]
+    random.seed(2)
+    product_categories = [random.choice(leaves) for i in range(args.products)]
+
+    with _util.Timer() as legacy_time:
+        legacy = legacy_explode(categories, product_categories)
+    with _util.Timer() as map_time:
+        exploded = category_tree.CategoryMap(categories).explode(product_categories)
+
+    assert exploded == legacy, "CategoryMap.explode differs from explode_categories"
+    _util.print_table([
+        {"impl": "explode_categories (list scan)", "categories": len(legacy), "seconds": legacy_time.elapsed},
+        {"impl": "CategoryMap.explode", "categories": len(exploded), "seconds": map_time.elapsed},
+    ], ["impl", "categories", "seconds"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from bench import _util
+from bench.explode_categories import make_categories
+
+'''
+IceCatMixin.makeMixin over a synthetic category feature list (--categories categories, --groups feature groups,
+--per-category groups with features each) on a LocalBlobStore with --latency ms per schema write:
+the former category x feature group loop with one write at a time, versus the pairs of CategoryFeaturesList
+uploaded concurrently, a rerun with nothing changed and a rerun after --changed percent of the schemas changed.
+
+    python -m bench.make_mixin --categories 1000 --groups 300 --per-category 8 --latency 10
+'''
+
+
+class FeatureGroups(object):
+    def __init__(self, count):
+        self.id_map = [{'id': str(n), 'name': "Feature group {}".format(n)} for n in range(1, count + 1)]
+
+
+def legacy_make_mixin(mixin, store):
+    # the former makeMixin loop, reference lists already parsed
+    makeCount = 0
+    for category in mixin.category:
+        category_id = category['ID']
+        category_name_desciption = category['Name']
+        category_name = category_name_desciption.lower().replace(" ", "_").replace("/", "_").replace(".", "_").replace("(", "_").replace(")", "_")
+        for feature in mixin.features.id_map:
+            description = "Mixin schema for "  + feature['name'].lower() + " of Category : "  +category_name_desciption
+            schema_name = feature['name'].lower().replace(" ", "_").replace("/", "_").replace(".", "_").replace("(", "_").replace(")", "_")
+            feature_id = feature['id']
+            if mixin.categoryfeatures.get(category_id) != None and mixin.categoryfeatures.get(category_id) != {}:
+                if mixin.categoryfeatures.get(category_id).get(feature_id) != None and mixin.categoryfeatures.get(category_id).get(feature_id) != {}:
+                    json_schema = {
+                        "$schema": "http://json-schema.org/draft-04/schema#",
+                        "type": "object",
+                        "description": description,
+                        "properties": mixin.categoryfeatures.get(category_id).get(feature_id)
+                    }
+                    with store.open("gs://" + os.environ.get("GOOGLE_BUCKET_NAME")+ "/"+ category_name + "-" + schema_name +".json", 'w') as f:
+                        json.dump(json_schema, f , indent = 4)
+                        makeCount += 1
+    return makeCount
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--categories", type=int, default=1000)
+    parser.add_argument("--groups", type=int, default=300)
+    parser.add_argument("--per-category", type=int, default=8)
+    parser.add_argument("--features", type=int, default=10, help="features per schema")
+    parser.add_argument("--latency", type=float, default=10, help="ms per schema write")
+    parser.add_argument("--changed", type=float, default=1, help="percent of the schemas changed before the last run")
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="blobs")
+    cwd = os.getcwd()
+    os.environ["BLOB_STORE"] = "local"
+    os.environ["BLOB_STORE_PATH"] = root
+    os.environ["GOOGLE_PRODUCT_BUCKET"] = "products"
+    os.environ["GOOGLE_BUCKET_NAME"] = "schemas"
+    # imported after the env is set, the icecat modules take the process wide store on import
+    from app.icecat import blob_store
+    from app.icecat import icecat_admin
+    store = blob_store.get_blob_store()
+    writes = [0]
+    store_write = store.write
+    store_open = store.open
+
+    def slow_write(path, data):
+        if os.path.basename(path) not in (icecat_admin.IceCatMixin.MANIFEST, icecat_admin.IceCatMixin.LOCK):
+            writes[0] += 1
+            time.sleep(args.latency / 1000.0)
+        store_write(path, data)
+
+    def slow_open(path, mode='rb'):
+        if 'w' in mode:
+            writes[0] += 1
+            time.sleep(args.latency / 1000.0)
+        return store_open(path, mode)
+    store.write = slow_write
+    store.open = slow_open
+
+    rnd = random.Random(1)
+    categories = make_categories(args.categories)
+    categoryfeatures = {}
+    for category in categories:
+        categoryfeatures[category['ID']] = {}
+        for group in rnd.sample(range(1, args.groups + 1), args.per_category):
+            categoryfeatures[category['ID']][str(group)] = {
+                "feature_{}".format(n): {"type": ["string", "null"], "description": "Feature {}".format(n)} for n in range(args.features)}
+
+    def new_mixin():
+        mixin = icecat_admin.IceCatMixin()
+        mixin.category = categories
+        mixin.features = FeatureGroups(args.groups)
+        mixin.categoryfeatures = categoryfeatures
+        return mixin
+
+    results = []
+    try:
+        os.chdir(root)
+        writes[0] = 0
+        with _util.Timer() as t:
+            count = legacy_make_mixin(new_mixin(), store)
+        results.append({"run": "category x feature group loop (before)", "schemas": count, "written": writes[0], "seconds": t.elapsed})
+        before = {name: open(os.path.join(root, "schemas", name), 'rb').read() for name in os.listdir(os.path.join(root, "schemas"))}
+        shutil.rmtree(os.path.join(root, "schemas"))
+
+        for run in ("first run", "rerun, nothing changed", "rerun, {}% changed".format(args.changed)):
+            if "% changed" in run:
+                for category in rnd.sample(categories, max(1, int(len(categories) * args.changed / 100))):
+                    group = next(iter(categoryfeatures[category['ID']].values()))
+                    group["feature_0"]["description"] += " (updated)"
+            writes[0] = 0
+            with _util.Timer() as t:
+                res = new_mixin().makeMixin()
+            results.append({"run": run, "schemas": res["unchanged"] + res["failed"] + writes[0], "written": writes[0], "seconds": t.elapsed})
+            if run == "first run":
+                after = {name: open(os.path.join(root, "schemas", name), 'rb').read() for name in os.listdir(os.path.join(root, "schemas"))
+                         if name != icecat_admin.IceCatMixin.MANIFEST}
+                results[-1]["same_files"] = before == after
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(root)
+    _util.print_table(results, ["run", "schemas", "written", "seconds", "same_files"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import argparse
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+from app.icecat import product_extract
+from bench import _util
+from bench._product_xml import mixin_schemas, product_xml
+
+'''
+The mixin stage of IceCatProductDetails._parse (feature group names, then parseMixin per ProductFeature) over
+already extracted products: the former name normalizing and schema branching for every feature versus the
+memoized slug and the compile_schema() converter tables. Checks that both build the same mixins.
+
+    python -m bench.mixin_features --products 2000 --features 200
+'''
+
+
+def legacy_mixin(details, schemas):
+    # the former _parse feature group loop and parseMixin, schemas already loaded
+    details.category_feature_matching_list = {}
+    details.metadata_mixin = {}
+    details.mixin = {}
+    details.feature_id_list = []
+    for category_feature_group in details.product_dict.get('CategoryFeatureGroup'):
+        details.category_feature_matching_list.update({category_feature_group['ID'] : category_feature_group.get('FeatureGroup').get('Name').get('Value').lower().replace(" ", "_").replace("/", "_").replace(".", "_").replace("(", "_").replace(")", "_")})
+    for product_feature in details.product_dict.get("ProductFeature"):
+        category_name = details.product_dict.get('Category').get("Name").get("Value").lower().replace(" ", "_").replace("/", "_").replace(".", "_").replace("(", "_").replace(")", "_")
+        category_featurename = details.category_feature_matching_list[product_feature.get('CategoryFeatureGroup_ID')]
+        json_url = "https://storage.googleapis.com/" + os.environ.get("GOOGLE_BUCKET_NAME")+ "/" + category_name + "-"  + category_featurename + ".json"
+        try:
+            mixin_schema = schemas[category_name + "-" + category_featurename]
+            if details.metadata_mixin.get(category_featurename) == None:
+                details.metadata_mixin.update({category_featurename : json_url })
+                details.mixin.update({category_featurename : {}})
+            Feature_elem = product_feature.get('Feature')
+            details.feature_id_list.append(Feature_elem.get('ID'))
+            nameElem = Feature_elem.get("Name")
+            featurename = nameElem.get('Value').lower().replace(" ", "_").replace("/", "_").replace(".", "_").replace("(", "_").replace(")", "_")
+            if details.mixin[category_featurename].get(featurename) == None:
+                feature_schema_detail = mixin_schema['properties'][featurename]
+                if feature_schema_detail.get('$ref') != None:
+                    ref = feature_schema_detail['$ref']
+                    localValue = product_feature.get('LocalValue').get('Value')
+                    sign = product_feature.get('Feature').get("Measure").get('Signs')
+                    if sign == None:
+                        uom = ""
+                    else:
+                        uom = sign.get('Sign').get('#text')
+                    if uom == "":
+                        presentationValue= product_feature.get('Presentation_Value')
+                        uom = presentationValue.split(localValue)[1].strip()
+                    if "atomic_uom" in ref:
+                        details.mixin[category_featurename].update({featurename : {"value" : float(localValue), "uom" : uom}})
+                    else:
+                        splitString = localValue.split('-')
+                        if len(splitString) != 2:
+                            details.mixin[category_featurename].update({featurename : {"firstValue" : float(splitString[0].strip()), "toValue": 1 , "uom" : uom}})
+                else:
+                    if feature_schema_detail['type'][0] == "string":
+                        details.mixin[category_featurename].update({featurename : product_feature.get('Presentation_Value')})
+                    elif feature_schema_detail['type'][0] == "number":
+                        details.mixin[category_featurename].update({featurename : int(product_feature.get('Presentation_Value'))})
+                    else:
+                        details.mixin[category_featurename].update({featurename : True if product_feature.get('Presentation_Value') == "Y" else False})
+        except Exception as ex:
+            details.log.error(repr(ex))
+    return details.mixin
+
+
+def compiled_mixin(details, icecat_product, mixin_schema_cache):
+    # the feature part of IceCatProductDetails._parse
+    details.category_feature_matching_list = {}
+    details.metadata_mixin = {}
+    details.mixin = {}
+    details.feature_id_list = []
+    details.converters = {}
+    for category_feature_group in details.product_dict.get('CategoryFeatureGroup'):
+        details.category_feature_matching_list.update({category_feature_group['ID'] : mixin_schema_cache.slug(category_feature_group.get('FeatureGroup').get('Name').get('Value'))})
+    details.category_name = mixin_schema_cache.slug(details.product_dict.get('Category').get("Name").get("Value"))
+    for product_feature in details.product_dict.get("ProductFeature"):
+        details.parseMixin(product_feature)
+    return details.mixin
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--features", type=int, default=200)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="blobs")
+    cwd = os.getcwd()
+    os.environ["BLOB_STORE"] = "local"
+    os.environ["BLOB_STORE_PATH"] = root
+    os.environ["GOOGLE_PRODUCT_BUCKET"] = "products"
+    os.environ["GOOGLE_BUCKET_NAME"] = "schemas"
+    # imported after the env is set, the icecat modules take the process wide store on import
+    from app.icecat import blob_store
+    from app.icecat import icecat_product
+    from app.icecat import mixin_schema_cache
+    store = blob_store.get_blob_store()
+    results = []
+    try:
+        os.chdir(root)
+        schemas = mixin_schemas(args.features)
+        for key, schema in schemas.items():
+            store.write("gs://schemas/" + key + ".json", json.dumps(schema).encode('utf-8'))
+        mixin_schema_cache.get_mixin_schema_cache().preload(schemas)
+        products = [product_extract.extract_product(product_xml(i, args.features)) for i in range(1, args.products + 1)]
+        details = icecat_product.IceCatProductDetails.__new__(icecat_product.IceCatProductDetails)
+        details.log = logging.getLogger()
+
+        runs = {}
+        for name, mixin in (("before", lambda: legacy_mixin(details, schemas)),
+                            ("compiled", lambda: compiled_mixin(details, icecat_product, mixin_schema_cache))):
+            runs[name] = []
+            with _util.Timer() as t:
+                for product_dict in products:
+                    details.product_dict = product_dict
+                    runs[name].append(mixin())
+            results.append({"parseMixin": name, "products": args.products, "features": args.features * args.products, "seconds": t.elapsed,
+                            "us_per_feature": round(t.elapsed / (args.features * args.products) * 1e6, 2)})
+        for row in results:
+            row["same_mixins"] = runs[row["parseMixin"]] == runs["before"]
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(root)
+    _util.print_table(results, ["parseMixin", "products", "features", "seconds", "us_per_feature", "same_mixins"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import argparse
+import concurrent.futures
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+from bench import _util
+from bench._product_xml import mixin_schemas, product_xml
+
+'''
+Mixin schema lookups of the product detail parsing, --threads at a time, over --categories categories of
+8 feature groups each, with --latency ms per schema read like a bucket round trip:
+the former unlocked g_mixin dict (each thread loads what it misses, duplicates included), the MixinSchemaCache
+loading on demand, after preload_categories, and with a max_entries below the working set (LRU evictions).
+
+    python -m bench.mixin_schema_cache --products 4000 --categories 100 --latency 20
+'''
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=4000)
+    parser.add_argument("--categories", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=20, help="ms per schema read")
+    parser.add_argument("--threads", type=int, default=8, help="ADDING_DETAIL_WORKERS")
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="blobs")
+    cwd = os.getcwd()
+    os.environ["BLOB_STORE"] = "local"
+    os.environ["BLOB_STORE_PATH"] = root
+    os.environ["GOOGLE_PRODUCT_BUCKET"] = "products"
+    os.environ["GOOGLE_BUCKET_NAME"] = "schemas"
+    # imported after the env is set, the icecat modules take the process wide store on import
+    from app.icecat import blob_store
+    from app.icecat import icecat_product
+    from app.icecat import mixin_schema_cache
+    store = blob_store.get_blob_store()
+    reads = [0]
+    store_open = store.open
+
+    def slow_open(path, mode='rb'):
+        if 'r' in mode and path.startswith("gs://schemas/"):
+            reads[0] += 1
+            time.sleep(args.latency / 1000.0)
+        return store_open(path, mode)
+    store.open = slow_open
+
+    categories = ["Category {}".format(n) for n in range(args.categories)]
+    results = []
+    try:
+        os.chdir(root)
+        for category in categories:
+            for key, schema in mixin_schemas(category=category).items():
+                store.write("gs://schemas/" + key + ".json", json.dumps(schema).encode('utf-8'))
+        data = [product_xml(product_id, category=categories[product_id % len(categories)]) for product_id in range(1, args.products + 1)]
+
+        def parse_all():
+            with concurrent.futures.ThreadPoolExecutor(max_workers=args.threads) as executor:
+                return list(executor.map(lambda xml: icecat_product.parse_product_details(None, xml, []), data))
+
+        def legacy_get(self, key):
+            # the former parseMixin lookup: no lock, every thread missing a key reads it
+            schema = legacy.get(key)
+            if schema is None:
+                with self.store.open(self._path(key)) as f:
+                    schema = mixin_schema_cache.compile_schema(json.load(f))
+                legacy[key] = schema
+            return schema
+
+        expected = None
+        for name, max_entries, preload in (("g_mixin dict (before)", None, False), ("cache, on demand", None, False),
+                                           ("cache, preload_categories", None, True),
+                                           ("cache, preload, max_entries=" + str(args.categories * 4), args.categories * 4, True)):
+            cache = mixin_schema_cache.MixinSchemaCache(max_entries=max_entries)
+            if name.startswith("g_mixin"):
+                legacy = {}
+                cache.get = legacy_get.__get__(cache)
+            mixin_schema_cache._cache = cache
+            reads[0] = 0
+            with _util.Timer() as t:
+                if preload:
+                    cache.preload_categories(category.lower().replace(" ", "_") for category in categories)
+                preloaded = time.perf_counter() - t.start
+                details = parse_all()
+            if expected is None:
+                expected = details
+            stats = cache.get_stats()
+            results.append({"lookup": name, "schema_reads": reads[0], "preload_seconds": round(preloaded, 3) if preload else "",
+                            "seconds": t.elapsed, "hits": stats["hits"], "misses": stats["misses"], "evictions": stats["evictions"],
+                            "same_output": details == expected})
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(root)
+    _util.print_table(results, ["lookup", "schema_reads", "preload_seconds", "seconds", "hits", "misses", "evictions", "same_output"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+import argparse
+import gzip
+import json
+import os
+import random
+import shutil
+import tempfile
+
+from bench import _util
+from bench._product_xml import mixin_schemas, product_xml
+
+'''
+The detail stage of add_product_details_parallel for --products products on a LocalBlobStore:
+a first import parses every product XML with IceCatProductDetails and fills the ProductDetailCache,
+a second import with --changed of the products updated reads the others from the cache.
+
+    python -m bench.product_detail_cache --products 5000 --changed 0.05
+'''
+
+
+def import_details(icecat_product, cache, catalogs):
+    # adding_detail_worker without the progress bar and the threads
+    cached = cache.get_many(catalogs)
+    for item in catalogs:
+        if item['product_id'] in cached:
+            item.update(cached[item['product_id']])
+            continue
+        details = icecat_product.IceCatProductDetails(xml_file="gs://products/{}.xml.gz".format(item['product_id']), keys=[], cleanup_data_files=False)
+        item.update(details.get_data())
+        cache.put(item['product_id'], item['updated'], details.get_data())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--changed", type=float, default=0.05, help="share of the products updated before the second import")
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="blobs")
+    cwd = os.getcwd()
+    os.environ["BLOB_STORE"] = "local"
+    os.environ["BLOB_STORE_PATH"] = root
+    os.environ["GOOGLE_PRODUCT_BUCKET"] = "products"
+    os.environ["GOOGLE_BUCKET_NAME"] = "schemas"
+    # imported after the env is set, the icecat modules take the process wide store on import
+    from app.icecat import blob_store
+    from app.icecat import icecat_product
+    from app.icecat import product_detail_cache
+    store = blob_store.get_blob_store()
+    results = []
+    try:
+        os.chdir(root)
+        for key, schema in mixin_schemas().items():
+            store.write("gs://schemas/" + key + ".json", json.dumps(schema).encode('utf-8'))
+        product_ids = [str(product_id) for product_id in range(1, args.products + 1)]
+        for product_id in product_ids:
+            store.write("gs://products/{}.xml.gz".format(product_id), gzip.compress(product_xml(int(product_id)), compresslevel=6))
+
+        random.seed(11)
+        changed = set(random.sample(product_ids, int(args.products * args.changed)))
+        first = None
+        for name, updated in (("first import", "20230101000000"), ("second import, {} changed".format(len(changed)), "20240101000000")):
+            catalogs = [{'product_id': product_id, 'updated': updated if product_id in changed else "20230101000000"} for product_id in product_ids]
+            cache = product_detail_cache.ProductDetailCache("EN")
+            with _util.Timer() as t:
+                import_details(icecat_product, cache, catalogs)
+            stats = cache.get_stats()
+            results.append(dict(stats, run=name, seconds=t.elapsed))
+            if first is None:
+                first = catalogs
+            else:
+                same = sum(1 for a, b in zip(first, catalogs) if dict(a, updated=None) == dict(b, updated=None))
+                results[-1]["same_details"] = same
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(root)
+    _util.print_table(results, ["run", "hits", "misses", "writes", "errors", "seconds", "same_details"])
+
+
+if __name__ == "__main__":
+    main()
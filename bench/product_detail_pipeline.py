@@ -0,0 +1,111 @@
+import argparse
+import concurrent.futures
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+from bench import _util
+from bench._product_xml import ProductXMLServer, mixin_schemas
+
+'''
+The product detail stage of an import against a local stand-in of data.icecat.biz, with a LocalBlobStore
+for the buckets: download everything, then read every XML back from the bucket and parse it (before),
+versus IceCatCatalog.iter_product_details, which parses each body from memory as it arrives.
+Reports the bucket reads, the time to the first enriched row and the total time.
+
+    python -m bench.product_detail_pipeline --products 3000 --latency 20
+'''
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=3000)
+    parser.add_argument("--latency", type=float, default=20, help="ms per response")
+    parser.add_argument("--workers", type=int, default=8, help="ADDING_DETAIL_WORKERS")
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="blobs")
+    cwd = os.getcwd()
+    os.environ["BLOB_STORE"] = "local"
+    os.environ["BLOB_STORE_PATH"] = root
+    os.environ["GOOGLE_PRODUCT_BUCKET"] = "products"
+    os.environ["GOOGLE_BUCKET_NAME"] = "schemas"
+    os.environ["ADDING_DETAIL_WORKERS"] = str(args.workers)
+    os.environ["PRODUCT_DETAIL_CACHE"] = "0"
+    # imported after the env is set, the icecat modules take the process wide store on import
+    from app.icecat import blob_store
+    from app.icecat import bulk_downloader
+    from app.icecat import icecat_product
+    store = blob_store.get_blob_store()
+    reads = [0]
+    store_open = store.open
+
+    def counting_open(path, mode='rb'):
+        if 'r' in mode and path.startswith("gs://products/"):
+            reads[0] += 1
+        return store_open(path, mode)
+    store.open = counting_open
+
+    def new_catalog(base_url):
+        catalog = icecat_product.IceCatCatalog.__new__(icecat_product.IceCatCatalog)
+        catalog.catalogs = [{'product_id': str(product_id), 'path': "export/freexml.int/EN/{}.xml".format(product_id), 'updated': ""}
+                            for product_id in range(1, args.products + 1)]
+        catalog.data_dir = root + "/"
+        catalog.auth = None
+        catalog.log = logging.getLogger()
+        catalog.job_mode = 'sync'
+        catalog.product_xml_baseurl = base_url
+        return catalog
+
+    def two_phase(catalog, started):
+        # the former add_product_details_parallel: download to the bucket, then parse from the bucket
+        catalog.keys = []
+        catalog.xml_dir = root + "/"
+        catalog.detail_cache = None
+        catalog.cached_details = {}
+        catalog.key_count = 0
+        catalog.bar = icecat_product.progressbar.NullBar()
+        urls = [catalog.product_xml_baseurl + "EN/" + item['product_id'] + ".xml" for item in catalog.catalogs]
+        bulk_downloader.AsyncFetchURLs(urls=urls, auth=None, connections=100)
+        done = []
+
+        def worker(item):
+            catalog.adding_detail_worker(item)
+            done.append(time.perf_counter() - started)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=args.workers) as threads:
+            threads.map(worker, catalog.catalogs)
+        return min(done)
+
+    results = []
+    try:
+        os.chdir(root)
+        for key, schema in mixin_schemas().items():
+            store.write("gs://schemas/" + key + ".json", json.dumps(schema).encode('utf-8'))
+        with ProductXMLServer(latency=args.latency / 1000.0) as server:
+            base_url = server.url[:-len("EN/")]
+            for name in ("download, then parse from bucket", "fused download and parse"):
+                shutil.rmtree(os.path.join(root, "products"), ignore_errors=True)
+                reads[0] = 0
+                catalog = new_catalog(base_url)
+                with _util.Timer() as t:
+                    if name.startswith("fused"):
+                        first = None
+                        for item in catalog.iter_product_details(keys=[], lang_id="EN"):
+                            if first is None:
+                                first = time.perf_counter() - t.start
+                    else:
+                        first = two_phase(catalog, t.start)
+                parsed = sum(1 for item in catalog.catalogs if 'mixins' in item)
+                results.append({"pipeline": name, "products": len(catalog.catalogs), "parsed": parsed, "bucket_reads": reads[0],
+                                "first_row_seconds": round(first, 3), "seconds": t.elapsed})
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(root)
+    _util.print_table(results, ["pipeline", "products", "parsed", "bucket_reads", "first_row_seconds", "seconds"])
+
+
+if __name__ == "__main__":
+    main()
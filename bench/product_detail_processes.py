@@ -0,0 +1,85 @@
+import argparse
+import concurrent.futures
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+from bench import _util
+from bench._product_xml import mixin_schemas, product_xml
+
+'''
+Product detail parsing throughput of the ADDING_DETAIL_WORKERS threads alone versus the threads handing the
+XMLs to 1, 2, 4, ... DETAIL_PARSE_PROCESSES worker processes, the way adding_detail_worker does, over product
+XML bytes held in memory. The schemas come from a LocalBlobStore through IceCatCatalog.load_mixin_schemas, so
+the workers never read one. The speedup is bounded by the cores of the machine (printed first).
+
+    python -m bench.product_detail_processes --products 4000 --features 40 --processes 1 2 4 8
+'''
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=4000)
+    parser.add_argument("--features", type=int, default=40)
+    parser.add_argument("--threads", type=int, default=8, help="ADDING_DETAIL_WORKERS")
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="blobs")
+    cwd = os.getcwd()
+    os.environ["BLOB_STORE"] = "local"
+    os.environ["BLOB_STORE_PATH"] = root
+    os.environ["GOOGLE_PRODUCT_BUCKET"] = "products"
+    os.environ["GOOGLE_BUCKET_NAME"] = "schemas"
+    # imported after the env is set, the icecat modules take the process wide store on import
+    from app.icecat import blob_store
+    from app.icecat import icecat_product
+    store = blob_store.get_blob_store()
+    print(" - {} cores".format(os.cpu_count()))
+
+    results = []
+    try:
+        os.chdir(root)
+        for key, schema in mixin_schemas(args.features).items():
+            store.write("gs://schemas/" + key + ".json", json.dumps(schema).encode('utf-8'))
+        data = [product_xml(product_id, features=args.features) for product_id in range(1, args.products + 1)]
+        catalog = icecat_product.IceCatCatalog.__new__(icecat_product.IceCatCatalog)
+        catalog.catalogs = [{'product_id': str(product_id), 'catid': "151"} for product_id in range(1, args.products + 1)]
+        catalog.categories = [{'ID': "151", 'Name': "Notebooks", 'ParentID': "1"}]
+        catalog.log = logging.getLogger()
+        catalog.load_mixin_schemas()
+
+        def run(threads, pool):
+            def parse(xml_data):
+                if pool:
+                    return pool.submit(icecat_product.parse_product_details, None, xml_data, []).result()
+                return icecat_product.parse_product_details(None, xml_data, [])
+            with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as executor:
+                return list(executor.map(parse, data))
+
+        with _util.Timer() as t:
+            expected = run(args.threads, None)
+        baseline = t.elapsed
+        results.append({"mode": "threads", "threads": args.threads, "processes": 0, "seconds": t.elapsed,
+                        "products_per_s": round(args.products / t.elapsed), "speedup": 1.0, "same_output": True})
+        for processes in args.processes:
+            pool = icecat_product.detail_process_pool(processes)
+            try:
+                threads = max(args.threads, processes * 2)
+                with _util.Timer() as t:
+                    details = run(threads, pool)
+            finally:
+                pool.shutdown()
+            results.append({"mode": "processes", "threads": threads, "processes": processes, "seconds": t.elapsed,
+                            "products_per_s": round(args.products / t.elapsed), "speedup": round(baseline / t.elapsed, 2),
+                            "same_output": details == expected})
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(root)
+    _util.print_table(results, ["mode", "threads", "processes", "seconds", "products_per_s", "speedup", "same_output"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import argparse
+import os
+import shutil
+import tempfile
+
+from app.icecat import blob_store
+from app.icecat import bulk_downloader
+from bench import _util
+from bench._product_xml import ProductXMLServer
+
+'''
+Product XML download: thread per connection FetchURLs versus the asyncio AsyncFetchURLs, against a
+local stand-in of data.icecat.biz (--latency ms per response) with a local directory as target.
+FetchURLs only writes to gs:// paths, so it gets a LocalBlobStore over the target.
+
+    python -m bench.product_download --products 5000 --latency 50
+'''
+
+
+def local_store(target):
+    # FetchURLs saves to gs://$GOOGLE_PRODUCT_BUCKET, served from the target directory by a LocalBlobStore
+    os.environ["GOOGLE_PRODUCT_BUCKET"] = os.path.basename(target)
+    return blob_store.LocalBlobStore(os.path.dirname(target))
+
+
+def run_fetch_urls(urls, target, connections):
+    with _util.Timer() as t:
+        download = bulk_downloader.FetchURLs(urls=urls, data_dir=target, auth=None, connections=connections, store=local_store(target))
+    return t.elapsed, download.get_count()
+
+
+def run_async(urls, target, connections):
+    with _util.Timer() as t:
+        download = bulk_downloader.AsyncFetchURLs(urls=urls, target_dir=target, connections=connections)
+    return t.elapsed, download.get_count()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=50, help="ms per response")
+    args = parser.parse_args()
+
+    results = []
+    with ProductXMLServer(latency=args.latency / 1000.0) as server:
+        urls = server.urls(range(1, args.products + 1))
+        for name, run, connections in (
+            ("FetchURLs", run_fetch_urls, 5),
+            ("FetchURLs", run_fetch_urls, 50),
+            ("AsyncFetchURLs", run_async, 50),
+            ("AsyncFetchURLs", run_async, 200),
+        ):
+            target = tempfile.mkdtemp(prefix="product_xml")
+            try:
+                seconds, count = run(urls, target, connections)
+                # second run over the same target: every file is present and skipped
+                skip_seconds, skip_count = run(urls, target, connections)
+            finally:
+                shutil.rmtree(target)
+            results.append({"impl": name, "connections": connections, "fetched": count, "seconds": seconds,
+                            "urls_per_s": int(count / seconds), "rerun_skip_seconds": skip_seconds})
+    _util.print_table(results, ["impl", "connections", "fetched", "seconds", "urls_per_s", "rerun_skip_seconds"])
+
+
+if __name__ == "__main__":
+    main()
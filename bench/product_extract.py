@@ -0,0 +1,120 @@
+import argparse
+import gzip
+import json
+import os
+import shutil
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+import xmltodict
+
+from app.icecat import product_extract
+from bench import _util
+from bench._product_xml import mixin_schemas, product_xml
+
+'''
+Parsing product XMLs with xmltodict (before) versus product_extract.extract_product: per product parse time
+and peak allocation (tracemalloc), and a check that IceCatProductDetails.get_data() is identical with both.
+Runs over a directory of real product XMLs (.xml or .xml.gz) with --corpus, else over synthetic
+products with --features ProductFeature and --related ProductRelated elements each.
+
+    python -m bench.product_extract --products 500 --features 40 400 --related 100
+    python -m bench.product_extract --corpus _data/product_xml
+'''
+
+
+def xmltodict_product(source):
+    # the former IceCatProductDetails._parse
+    return xmltodict.parse(source, attr_prefix='')['ICECAT-interface']['Product']
+
+
+def load_corpus(path):
+    corpus = []
+    for name in sorted(os.listdir(path)):
+        with open(os.path.join(path, name), 'rb') as f:
+            data = f.read()
+        if name.endswith(".gz"):
+            data = gzip.decompress(data)
+        if name.endswith((".xml", ".xml.gz")):
+            corpus.append((name, data))
+    return corpus
+
+
+def measure(parse, corpus):
+    seconds = []
+    peaks = []
+    for name, data in corpus:
+        start = time.perf_counter()
+        parse(data)
+        seconds.append(time.perf_counter() - start)
+    for name, data in corpus:
+        tracemalloc.start()
+        parse(data)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return statistics.mean(seconds) * 1000, statistics.mean(peaks) / 1024, max(peaks) / 1024
+
+
+def details(icecat_product, corpus, parse):
+    product_extract_function = product_extract.extract_product
+    product_extract.extract_product = parse
+    try:
+        out = []
+        for name, data in corpus:
+            try:
+                out.append(icecat_product.IceCatProductDetails(xml_file=name, xml_data=data, keys=[], cleanup_data_files=False).get_data())
+            except Exception as ex:
+                out.append(repr(ex))
+        return out
+    finally:
+        product_extract.extract_product = product_extract_function
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=500)
+    parser.add_argument("--features", type=int, nargs="+", default=[40, 400])
+    parser.add_argument("--related", type=int, default=100, help="ProductRelated elements per synthetic product")
+    parser.add_argument("--corpus", help="directory of real product XMLs")
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="blobs")
+    cwd = os.getcwd()
+    os.environ["BLOB_STORE"] = "local"
+    os.environ["BLOB_STORE_PATH"] = root
+    os.environ["GOOGLE_BUCKET_NAME"] = "schemas"
+    if args.corpus:
+        args.corpus = os.path.abspath(args.corpus)
+    # imported after the env is set, the icecat modules take the process wide store on import
+    from app.icecat import blob_store
+    from app.icecat import icecat_product
+    store = blob_store.get_blob_store()
+    results = []
+    try:
+        os.chdir(root)
+        if args.corpus:
+            corpora = [("corpus " + os.path.basename(args.corpus), load_corpus(args.corpus))]
+        else:
+            corpora = []
+            for features in args.features:
+                for key, schema in mixin_schemas(features).items():
+                    store.write("gs://schemas/" + key + ".json", json.dumps(schema).encode('utf-8'))
+                corpora.append(("{} features".format(features),
+                                [(str(i), product_xml(i, features, related=args.related)) for i in range(1, args.products + 1)]))
+        for label, corpus in corpora:
+            kb = sum(len(data) for name, data in corpus) / len(corpus) / 1024
+            identical = details(icecat_product, corpus, xmltodict_product) == details(icecat_product, corpus, product_extract.extract_product)
+            for name, parse in (("xmltodict", xmltodict_product), ("extract_product", product_extract.extract_product)):
+                ms, peak_kb, max_peak_kb = measure(parse, corpus)
+                results.append({"products": label, "xml_kb": round(kb, 1), "parser": name, "ms_per_product": round(ms, 3),
+                                "peak_kb": round(peak_kb, 1), "max_peak_kb": round(max_peak_kb, 1), "identical": identical})
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(root)
+    _util.print_table(results, ["products", "xml_kb", "parser", "ms_per_product", "peak_kb", "max_peak_kb", "identical"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import argparse
+import concurrent.futures
+import os
+import shutil
+import tempfile
+import time
+
+from app.icecat import blob_store
+from app.icecat import bulk_downloader
+from bench import _util
+
+'''
+Finding the already cached product XMLs before a download: one exists() call per URL (FetchURLs before)
+versus one listing of the target in ProductXMLManifest, and a run from a local manifest file.
+The target is a local directory behind a file system that sleeps like GCS metadata calls do:
+--exists-latency ms per exists(), --page-latency ms per 1000 listed objects.
+
+    python -m bench.product_manifest --products 50000 --cached 0.8
+'''
+
+
+class SlowFileSystem(blob_store.LocalBlobStore):
+    def __init__(self, exists_latency, page_latency):
+        blob_store.LocalBlobStore.__init__(self)
+        self.exists_latency = exists_latency
+        self.page_latency = page_latency
+        self.calls = 0
+
+    def exists(self, path):
+        self.calls += 1
+        time.sleep(self.exists_latency)
+        return os.path.exists(path)
+
+    def list(self, path, detail=False):
+        infos = blob_store.LocalBlobStore.list(self, path, detail)
+        pages = len(infos) // 1000 + 1
+        self.calls += pages
+        time.sleep(self.page_latency * pages)
+        return infos
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=50000)
+    parser.add_argument("--cached", type=float, default=0.8, help="share of the products already in the target")
+    parser.add_argument("--exists-latency", type=float, default=20)
+    parser.add_argument("--page-latency", type=float, default=80)
+    parser.add_argument("--threads", type=int, default=5, help="FetchURLs connections doing the exists() calls")
+    args = parser.parse_args()
+
+    target = tempfile.mkdtemp(prefix="product_xml")
+    manifest = os.path.join(tempfile.mkdtemp(prefix="manifest"), "manifest.txt")
+    try:
+        names = ["{}.xml".format(product_id) for product_id in range(1, args.products + 1)]
+        for name in names[:int(args.products * args.cached)]:
+            open(os.path.join(target, name), 'wb').close()
+
+        results = []
+        fs = SlowFileSystem(args.exists_latency / 1000.0, args.page_latency / 1000.0)
+        with _util.Timer() as t:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=args.threads) as executor:
+                missing = sum(1 for exists in executor.map(fs.exists, (os.path.join(target, n) for n in names)) if not exists)
+        results.append({"check": "exists() per URL, {} threads".format(args.threads), "calls": fs.calls, "missing": missing, "seconds": t.elapsed})
+
+        for name, manifest_file in (("one listing of the target", None), ("listing + write manifest", manifest), ("manifest file", manifest)):
+            fs = SlowFileSystem(args.exists_latency / 1000.0, args.page_latency / 1000.0)
+            with _util.Timer() as t:
+                cached = bulk_downloader.ProductXMLManifest(fs, target, manifest_file)
+                missing = sum(1 for n in names if n not in cached)
+            cached.close()
+            results.append({"check": name, "calls": fs.calls, "missing": missing, "seconds": t.elapsed})
+    finally:
+        shutil.rmtree(target)
+        shutil.rmtree(os.path.dirname(manifest))
+    _util.print_table(results, ["check", "calls", "missing", "seconds"])
+
+
+if __name__ == "__main__":
+    main()
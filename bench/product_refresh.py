@@ -0,0 +1,80 @@
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from app.icecat import bulk_downloader
+from bench import _util
+from bench._product_xml import ProductXMLServer
+
+'''
+Refreshing a cached set of product XMLs after --changed of the products were updated in Icecat.
+Before, a cached file was never fetched again, so changed products kept their old details.
+Compares a full re-download with the catalog Updated check (only the stale files are fetched)
+and with If-Modified-Since revalidation (one request per product, only changed ones transfer a body).
+
+    python -m bench.product_refresh --products 5000 --changed 0.05
+'''
+
+
+def icecat_updated(epoch):
+    return time.strftime("%Y%m%d%H%M%S", time.gmtime(epoch))
+
+
+def run(server, urls, target, **kwargs):
+    requests, sent = server.requests, server.bytes_sent
+    with _util.Timer() as t:
+        download = bulk_downloader.AsyncFetchURLs(urls=urls, target_dir=target, connections=100, **kwargs)
+    metrics = download.get_metrics()
+    return {"requests": server.requests - requests, "MB": round((server.bytes_sent - sent) / 1e6, 1),
+            "fetched": metrics["fetched"], "stale": metrics["stale"], "not_modified": metrics["not_modified"],
+            "seconds": t.elapsed}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--changed", type=float, default=0.05, help="share of the products updated since the last run")
+    parser.add_argument("--latency", type=float, default=20, help="ms per response")
+    args = parser.parse_args()
+
+    product_ids = list(range(1, args.products + 1))
+    results = []
+    with ProductXMLServer(latency=args.latency / 1000.0) as server:
+        urls = server.urls(product_ids)
+        for name in ("re-download everything", "catalog Updated", "If-Modified-Since"):
+            target = tempfile.mkdtemp(prefix="product_xml")
+            try:
+                # cache everything a day ago, then let some products change after that
+                server.modified.clear()
+                run(server, urls, target)
+                day_ago = time.time() - 86400
+                for file_name in os.listdir(target):
+                    os.utime(os.path.join(target, file_name), (day_ago, day_ago))
+                random.seed(5)
+                changed = set(random.sample(product_ids, int(args.products * args.changed)))
+                updated = {}
+                for product_id in product_ids:
+                    modified = int(time.time()) - 60 if product_id in changed else int(day_ago) - 86400
+                    server.modified[product_id] = modified
+                    updated["{}.xml".format(product_id)] = icecat_updated(modified)
+
+                if name == "re-download everything":
+                    shutil.rmtree(target)
+                    row = run(server, urls, target)
+                elif name == "catalog Updated":
+                    row = run(server, urls, target, updated=updated)
+                else:
+                    row = run(server, urls, target, revalidate=True)
+                row["refresh"] = name
+                row["changed"] = len(changed)
+                results.append(row)
+            finally:
+                shutil.rmtree(target, ignore_errors=True)
+    _util.print_table(results, ["refresh", "changed", "requests", "MB", "fetched", "stale", "not_modified", "seconds"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import argparse
+import shutil
+import tempfile
+
+from app.icecat import bulk_downloader
+from bench import _util
+from bench._product_xml import ProductXMLServer
+from bench.product_download import local_store
+
+'''
+Product XML download against a local stand-in that throttles: more than --capacity requests in flight
+get a 429, --error-rate of the requests a 503 and --drop-rate a closed connection. Compares FetchURLs,
+AsyncFetchURLs pinned to a fixed concurrency and AsyncFetchURLs with the AIMD limiter, and checks
+that every URL ends up fetched or reported as failed.
+
+    python -m bench.product_throttle --products 3000 --capacity 40
+'''
+
+
+def run_fetch_urls(urls, target, connections):
+    with _util.Timer() as t:
+        download = bulk_downloader.FetchURLs(urls=urls, data_dir=target, auth=None, connections=connections, store=local_store(target))
+    return t.elapsed, {"fetched": download.get_count(), "failed": len(download.failed_urls), "retries": sum(download.attempts.values()),
+                       "peak_connections": connections, "peak_urls_per_s": ""}
+
+
+def run_async(urls, target, connections, min_connections):
+    with _util.Timer() as t:
+        download = bulk_downloader.AsyncFetchURLs(urls=urls, target_dir=target, connections=connections, min_connections=min_connections)
+    return t.elapsed, download.get_metrics()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=3000)
+    parser.add_argument("--latency", type=float, default=50, help="ms per response")
+    parser.add_argument("--capacity", type=int, default=40)
+    parser.add_argument("--error-rate", type=float, default=0.02)
+    parser.add_argument("--drop-rate", type=float, default=0.01)
+    args = parser.parse_args()
+
+    results = []
+    for name, run in (
+        ("FetchURLs 50 threads", lambda urls, target: run_fetch_urls(urls, target, 50)),
+        ("AsyncFetchURLs fixed 200", lambda urls, target: run_async(urls, target, 200, 200)),
+        ("AsyncFetchURLs AIMD 1..200", lambda urls, target: run_async(urls, target, 200, 1)),
+    ):
+        with ProductXMLServer(latency=args.latency / 1000.0, capacity=args.capacity, error_rate=args.error_rate,
+                              drop_rate=args.drop_rate) as server:
+            urls = server.urls(range(1, args.products + 1))
+            target = tempfile.mkdtemp(prefix="product_xml")
+            try:
+                seconds, metrics = run(urls, target)
+            finally:
+                shutil.rmtree(target)
+            results.append({"impl": name, "fetched": metrics['fetched'], "failed": metrics['failed'],
+                            "lost": len(urls) - metrics['fetched'] - metrics['failed'], "requests": server.requests,
+                            "429s": server.throttled, "retries": metrics['retries'], "seconds": seconds,
+                            "urls_per_s": int(metrics['fetched'] / seconds), "peak_urls_per_s": metrics['peak_urls_per_s'],
+                            "peak_connections": metrics['peak_connections']})
+    _util.print_table(results, ["impl", "fetched", "failed", "lost", "requests", "429s", "retries", "seconds",
+                                "urls_per_s", "peak_urls_per_s", "peak_connections"])
+
+
+if __name__ == "__main__":
+    main()
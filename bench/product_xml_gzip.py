@@ -0,0 +1,65 @@
+import argparse
+import json
+import os
+import shutil
+import tempfile
+
+from bench import _util
+from bench._product_xml import mixin_schemas, product_xml
+
+'''
+Product XMLs saved as they are versus gzip compressed (PRODUCT_XML_COMPRESSION): bytes written to
+and read back from the product bucket, and IceCatProductDetails parse time for --products products,
+with a LocalBlobStore standing in for the buckets.
+
+    python -m bench.product_xml_gzip --products 10000
+'''
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=10000)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="blobs")
+    cwd = os.getcwd()
+    os.environ["BLOB_STORE"] = "local"
+    os.environ["BLOB_STORE_PATH"] = root
+    os.environ["GOOGLE_PRODUCT_BUCKET"] = "products"
+    os.environ["GOOGLE_BUCKET_NAME"] = "schemas"
+    # imported after the env is set, the icecat modules take the process wide store on import
+    from app.icecat import blob_store
+    from app.icecat import bulk_downloader
+    from app.icecat import icecat_product
+    store = blob_store.get_blob_store()
+    results = []
+    try:
+        os.chdir(root)
+        for key, schema in mixin_schemas().items():
+            store.write("gs://schemas/" + key + ".json", json.dumps(schema).encode('utf-8'))
+        data = [product_xml(product_id) for product_id in range(1, args.products + 1)]
+        for compression in ("none", "gzip"):
+            paths = ["gs://products/" + bulk_downloader.product_xml_name("{}.xml".format(product_id), compression)
+                     for product_id in range(1, args.products + 1)]
+            with _util.Timer() as write:
+                for path, xml in zip(paths, data):
+                    if compression == "gzip":
+                        xml = bulk_downloader.gzip.compress(xml, compresslevel=6)
+                    store.write(path, xml)
+            stored = sum(os.path.getsize(store.local_path(path)) for path in paths)
+            with _util.Timer() as parse:
+                features = 0
+                for path in paths:
+                    details = icecat_product.IceCatProductDetails(xml_file=path, keys=[], cleanup_data_files=False)
+                    features += len(details.feature_id_list)
+            results.append({"compression": compression, "products": len(paths), "MB_downloaded": round(sum(len(x) for x in data) / 1e6, 1),
+                            "MB_stored": round(stored / 1e6, 1), "write_seconds": write.elapsed,
+                            "parse_seconds": parse.elapsed, "features": features})
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(root)
+    _util.print_table(results, ["compression", "products", "MB_downloaded", "MB_stored", "write_seconds", "parse_seconds", "features"])
+
+
+if __name__ == "__main__":
+    main()
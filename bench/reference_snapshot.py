@@ -0,0 +1,100 @@
+import argparse
+import gzip
+import os
+import shutil
+import tempfile
+import time
+from xml.sax.saxutils import quoteattr
+
+from bench import _util
+from bench.blob_store import categories_xml
+
+'''
+Startup of an import's reference lists (LanguageList, FeatureLogosList, SuppliersList and CategoriesList)
+on a LocalBlobStore: parsed from XML (cold, no snapshot), restored from the pickled snapshots by a new
+process, from the in memory snapshots of a warm process, and parsed again after a source list is replaced.
+
+    python -m bench.reference_snapshot --suppliers 30000 --logos 5000 --categories 10000
+'''
+
+
+def languages_xml(count):
+    rows = "".join('<Language Code="lang{0}" ID="{0}" ShortCode="L{0}"><Name ID="{0}" Value="Language {0}" langid="1"/></Language>'.format(n)
+                   for n in range(1, count + 1))
+    return ('<?xml version="1.0" encoding="UTF-8"?>\n<ICECAT-interface><Response><LanguageList>' + rows
+            + '</LanguageList></Response></ICECAT-interface>\n').encode('utf-8')
+
+
+def suppliers_xml(count):
+    rows = "".join('<Supplier ID="{0}" LogoHighPic="" LogoLowPic="" LogoOriginal="https://images.icecat.biz/img/brand/{0}.jpg" Name={1} Sponsor="0">'
+                   '<Names><Name ID="{0}" Value={1} langid="1"/></Names></Supplier>'.format(n, quoteattr("Supplier {}".format(n)))
+                   for n in range(1, count + 1))
+    return ('<?xml version="1.0" encoding="UTF-8"?>\n<ICECAT-interface><Response><SuppliersList>' + rows
+            + '</SuppliersList></Response></ICECAT-interface>\n').encode('utf-8')
+
+
+def feature_logos_xml(count):
+    rows = "".join('<FeatureLogo ID="{0}" Feature_ID="{1}" LogoPic="https://images.icecat.biz/img/logo/{0}.png">'
+                   '<Descriptions><Description ID="{0}" langid="1">Logo {0}</Description></Descriptions>'
+                   '<FeatureLogoCategories><FeatureLogoCategory catid="{2}"/><FeatureLogoCategory catid="{3}"/></FeatureLogoCategories>'
+                   '<FeatureLogoFeatures><FeatureLogoFeature ID="{1}"><FeatureLogoValues><FeatureLogoValue>Y</FeatureLogoValue></FeatureLogoValues>'
+                   '</FeatureLogoFeature></FeatureLogoFeatures></FeatureLogo>'.format(n, 1000 + n, n % 500, n % 700)
+                   for n in range(1, count + 1))
+    return ('<?xml version="1.0" encoding="UTF-8"?>\n<ICECAT-interface><Response><FeatureLogosList>' + rows
+            + '</FeatureLogosList></Response></ICECAT-interface>\n').encode('utf-8')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--suppliers", type=int, default=30000)
+    parser.add_argument("--logos", type=int, default=5000)
+    parser.add_argument("--categories", type=int, default=10000)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="blobs")
+    cwd = os.getcwd()
+    os.environ["BLOB_STORE"] = "local"
+    os.environ["BLOB_STORE_PATH"] = root
+    os.environ["GOOGLE_PRODUCT_BUCKET"] = "products"
+    # imported after the env is set, the icecat modules take the process wide store on import
+    from app.icecat import blob_store
+    from app.icecat import icecat_product
+    from app.icecat import reference_snapshot
+    store = blob_store.get_blob_store()
+    lists = [(icecat_product.IceCatLanguageMapping, languages_xml(60)),
+             (icecat_product.IceCatFeatureLogosList, feature_logos_xml(args.logos)),
+             (icecat_product.IceCatSupplierList, suppliers_xml(args.suppliers)),
+             (icecat_product.IceCatCategoryMapping, categories_xml(args.categories))]
+
+    def startup():
+        # what IceCatCatalog._parse constructs, plus the categories
+        return [len(mapping(data_dir=root + "/", lang_id="1").id_map) for mapping, data in lists]
+
+    results = []
+    try:
+        os.chdir(root)
+        for mapping, data in lists:
+            store.write("gs://products/" + mapping.FILENAME, gzip.compress(data))
+        snapshot_dir = os.path.join(root, "snapshots")
+        for run in ("cold, parse XML", "new process, pickled snapshot", "warm process, in memory", "SuppliersList replaced"):
+            if run.startswith("cold") or run.startswith("new process"):
+                # a new process starts with an empty in memory cache
+                reference_snapshot._cache = reference_snapshot.ReferenceSnapshotCache(root=snapshot_dir)
+            if run.startswith("SuppliersList"):
+                store.write("gs://products/SuppliersList.xml.gz", gzip.compress(suppliers_xml(args.suppliers + 1)))
+                # the replaced source is noticed once the ttl ran out
+                reference_snapshot._cache.ttl = 0
+            started = time.perf_counter()
+            sizes = startup()
+            ms = (time.perf_counter() - started) * 1000
+            stats = reference_snapshot._cache.get_stats()
+            results.append({"startup": run, "items": sum(sizes), "ms": round(ms, 2), "memory_hits": stats["memory_hits"],
+                            "disk_hits": stats["disk_hits"], "parses": stats["parses"]})
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(root)
+    _util.print_table(results, ["startup", "items", "ms", "memory_hits", "disk_hits", "parses"])
+
+
+if __name__ == "__main__":
+    main()
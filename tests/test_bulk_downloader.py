@@ -0,0 +1,206 @@
+import asyncio
+import os
+import threading
+
+import pytest
+
+from app.icecat import blob_store
+from app.icecat import bulk_downloader
+
+'''
+bulk_downloader.FetchURLs against a fake requests session and a LocalBlobStore,
+the ProductXMLManifest of a download target and the AIMDLimiter of AsyncFetchURLs
+'''
+
+
+class FakeResponse(object):
+    def __init__(self, status_code, content=b""):
+        self.status_code = status_code
+        self.content = content
+
+
+class FakeSession(object):
+    """
+    requests.Session answering every URL with the status in `statuses` (200 by default)
+    """
+    statuses = {}
+
+    def __init__(self):
+        self.auth = None
+
+    def get(self, url):
+        return FakeResponse(self.statuses.get(url, 200), b"<ICECAT-interface/>")
+
+
+class FailingBlobStore(blob_store.LocalBlobStore):
+    def __init__(self, root, fail):
+        super().__init__(root)
+        self.fail = fail
+
+    def write(self, path, data):
+        if any(path.endswith(name) for name in self.fail):
+            raise ConnectionError("connection reset")
+        super().write(path, data)
+
+
+@pytest.fixture(autouse=True)
+def session(monkeypatch):
+    monkeypatch.setenv("GOOGLE_PRODUCT_BUCKET", "products")
+    monkeypatch.setattr(bulk_downloader.requests, "Session", FakeSession)
+    FakeSession.statuses = {}
+
+
+def fetch(timeout=10, **kwargs):
+    # FetchURLs downloads in its constructor, a dead worker would make it wait forever
+    result = {}
+    thread = threading.Thread(target=lambda: result.update(fetcher=bulk_downloader.FetchURLs(connections=2, retries=0, compression="none", **kwargs)))
+    thread.daemon = True
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "FetchURLs did not finish"
+    return result['fetcher']
+
+
+URLS = ["https://data.icecat.biz/export/freexml/EN/{}.xml".format(n) for n in range(1, 7)]
+
+
+def test_fetch(tmp_path):
+    store = blob_store.LocalBlobStore(str(tmp_path))
+    fetcher = fetch(urls=URLS, store=store)
+    assert fetcher.get_count() == 6
+    assert fetcher.failed_urls == []
+    assert store.exists("gs://products/3.xml")
+
+
+def test_failed_write_and_callback_do_not_stop_the_download(tmp_path):
+    store = FailingBlobStore(str(tmp_path), fail=["/2.xml"])
+
+    def on_result(url, data):
+        if url.endswith("/4.xml"):
+            raise ValueError("parser queue closed")
+
+    fetcher = fetch(urls=URLS, store=store, on_result=on_result)
+    assert sorted(fetcher.failed_urls) == [URLS[1], URLS[3]]
+    assert fetcher.get_count() == 4
+
+
+def test_bad_status(tmp_path):
+    FakeSession.statuses = {URLS[0]: 404, URLS[1]: 503}
+    fetcher = fetch(urls=URLS, store=blob_store.LocalBlobStore(str(tmp_path)))
+    assert sorted(fetcher.failed_urls) == URLS[:2]
+    assert fetcher.get_count() == 4
+
+
+def test_manifest_lists_the_target_once(tmp_path):
+    store = blob_store.LocalBlobStore(str(tmp_path))
+    store.write("gs://products/1.xml", b"<ICECAT-interface/>")
+    os.makedirs(store.local_path("gs://products/staging"))
+    manifest_file = str(tmp_path / "manifest.tsv")
+    manifest = bulk_downloader.ProductXMLManifest(store, "gs://products", manifest=manifest_file)
+    assert "1.xml" in manifest
+    assert "staging" not in manifest
+    manifest.add("2.xml", saved=1614600000)
+    manifest.close()
+
+    # the next run reads the manifest file, not the target
+    store.rm("gs://products/1.xml")
+    manifest = bulk_downloader.ProductXMLManifest(store, "gs://products", manifest=manifest_file)
+    assert len(manifest) == 2
+    assert manifest.saved_time("2.xml") == 1614600000
+    manifest.close()
+
+
+def test_manifest_of_a_missing_target(tmp_path):
+    manifest = bulk_downloader.ProductXMLManifest(blob_store.LocalBlobStore(str(tmp_path)), "gs://products")
+    assert len(manifest) == 0
+    assert not manifest.is_fresh("1.xml")
+
+
+def test_manifest_is_fresh(tmp_path):
+    # 1.xml saved 2021-03-01 12:00:00 UTC, 2.xml listed by an older manifest without save times
+    manifest_file = tmp_path / "manifest.tsv"
+    manifest_file.write_text("1.xml\t1614600000\n2.xml\n")
+    manifest = bulk_downloader.ProductXMLManifest(blob_store.LocalBlobStore(str(tmp_path)), "gs://products", manifest=str(manifest_file))
+    assert manifest.is_fresh("1.xml")
+    assert manifest.is_fresh("1.xml", "20210301115959")
+    assert manifest.is_fresh("1.xml", "20210301120000")
+    assert not manifest.is_fresh("1.xml", "20210301120001")
+    # unknown save time or Updated format, the file is kept
+    assert manifest.is_fresh("2.xml", "20210301120001")
+    assert manifest.is_fresh("1.xml", "2021-03-01")
+    assert not manifest.is_fresh("3.xml")
+    manifest.close()
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_limiter_slow_start_up_to_maximum():
+    limiter = bulk_downloader.AIMDLimiter(2, maximum=5)
+    for _ in range(10):
+        limiter.on_success(0.1)
+    assert limiter.limit == 5
+
+
+def test_limiter_cuts_on_429_then_grows_additively():
+    async def throttled():
+        limiter = bulk_downloader.AIMDLimiter(10)
+        limiter.on_success(0.1)
+        limiter.on_throttle()
+        assert limiter.limit == pytest.approx(11 * 0.7)
+        limit = limiter.limit
+        limiter.on_success(0.1)
+        assert limiter.limit == pytest.approx(limit + 1 / limit)
+        return limiter
+
+    assert run(throttled()).decreases == 1
+
+
+def test_limiter_burst_counts_once():
+    async def burst():
+        limiter = bulk_downloader.AIMDLimiter(10)
+        limiter.on_success(60.0)
+        for _ in range(5):
+            limiter.on_throttle()
+        return limiter
+
+    limiter = run(burst())
+    assert limiter.decreases == 1
+    assert limiter.limit == pytest.approx(11 * 0.7)
+
+
+def test_limiter_ignores_a_few_server_errors():
+    async def errors():
+        limiter = bulk_downloader.AIMDLimiter(10, error_threshold=0.1)
+        for _ in range(19):
+            limiter.on_success(0.1)
+        limiter.on_throttle(explicit=False)
+        assert limiter.decreases == 0
+        limiter.on_throttle(explicit=False)
+        limiter.on_throttle(explicit=False)
+        return limiter
+
+    assert run(errors()).decreases == 1
+
+
+def test_limiter_holds_while_latency_is_high():
+    limiter = bulk_downloader.AIMDLimiter(10)
+    limiter.on_success(0.1)
+    limiter.on_success(0.5)
+    assert limiter.limit == 11
+
+
+def test_limiter_bounds_in_flight():
+    async def in_flight():
+        limiter = bulk_downloader.AIMDLimiter(2)
+        await limiter.acquire()
+        await limiter.acquire()
+        third = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0.01)
+        assert not third.done()
+        await limiter.release()
+        await asyncio.wait_for(third, 1)
+        return limiter.in_flight
+
+    assert run(in_flight()) == 2
@@ -0,0 +1,96 @@
+import threading
+
+import pytest
+
+from app.icecat import catalog_index
+
+'''
+HighWaterMark filtering of a delta catalog index, StreamBuffer and the streaming index parser
+'''
+
+INDEX = b'''<?xml version="1.0" encoding="UTF-8"?>
+<ICECAT-interface>
+  <files.index Generated="20210302000000">
+    <file path="export/freexml.int/EN/1.xml" Product_ID="1" Updated="20210228120000" Quality="ICECAT" Supplier_id="1" Prod_ID="A" Catid="151" On_Market="1" Model_Name="One" Product_View="10" HighPic="" HighPicSize="0" HighPicWidth="0" HighPicHeight="0" Date_Added="20200101000000">
+      <Country_Markets><Country_Market Value="DE"/><Country_Market Value="NL"/></Country_Markets>
+    </file>
+    <file path="export/freexml.int/EN/2.xml" Product_ID="2" Updated="20210301120000" Quality="ICECAT" Supplier_id="1" Prod_ID="B" Catid="151" On_Market="1" Model_Name="Two" Product_View="20" HighPic="" HighPicSize="0" HighPicWidth="0" HighPicHeight="0" Date_Added="20200101000000"/>
+    <file path="" Product_ID="3" Updated="20210301130000"/>
+    <file path="export/freexml.int/EN/4.xml" Product_ID="4" Updated="20210301080000" Quality="ICECAT" Supplier_id="2" Prod_ID="D" Catid="152" On_Market="0" Model_Name="Four" Product_View="5" HighPic="" HighPicSize="0" HighPicWidth="0" HighPicHeight="0" Date_Added="20200101000000">
+      <Country_Markets><Country_Market Value="BE"/></Country_Markets>
+    </file>
+  </files.index>
+</ICECAT-interface>'''
+
+
+def chunked(data, size):
+    return (data[i:i + size] for i in range(0, len(data), size))
+
+
+def test_high_water_mark_keeps_rows_newer_than_the_previous_mark():
+    high_water_mark = catalog_index.HighWaterMark("20210301000000")
+    rows = list(high_water_mark.filter(catalog_index.iter_catalog_index(catalog_index.StreamBuffer(chunked(INDEX, 100)))))
+    assert [row['product_id'] for row in rows] == ["2", "4"]
+    assert high_water_mark.skipped == 1
+    assert high_water_mark.previous == "20210301000000"
+    # the row without a path never reaches the filter and does not move the mark
+    assert high_water_mark.mark == "20210301120000"
+
+
+def test_high_water_mark_without_previous_sync():
+    high_water_mark = catalog_index.HighWaterMark(None)
+    assert len(list(high_water_mark.filter(catalog_index.iter_catalog_index(catalog_index.StreamBuffer(chunked(INDEX, 100)))))) == 3
+    assert high_water_mark.skipped == 0
+    assert high_water_mark.mark == "20210301120000"
+
+
+def test_high_water_mark_of_an_unchanged_index_skips_everything():
+    high_water_mark = catalog_index.HighWaterMark("20210301120000")
+    assert list(high_water_mark.filter(catalog_index.iter_catalog_index(catalog_index.StreamBuffer(chunked(INDEX, 100))))) == []
+    assert high_water_mark.skipped == 3
+    assert high_water_mark.mark == "20210301120000"
+
+
+@pytest.mark.parametrize("size", [1, 7, 4096])
+def test_stream_buffer_parses_like_the_file(tmp_path, size):
+    path = tmp_path / "files.index.xml"
+    path.write_bytes(INDEX)
+    buffer = catalog_index.StreamBuffer(chunked(INDEX, size), copy_path=str(tmp_path / "copy.xml"), max_chunks=2)
+    assert list(catalog_index.iter_catalog_index(buffer)) == list(catalog_index.iter_catalog_index(str(path)))
+    assert buffer.bytes_read == len(INDEX)
+    buffer.close()
+    assert (tmp_path / "copy.xml").read_bytes() == INDEX
+
+
+def test_stream_buffer_raises_download_errors():
+    def chunks():
+        yield INDEX[:200]
+        raise ConnectionError("connection reset")
+
+    buffer = catalog_index.StreamBuffer(chunks())
+    assert buffer.read(100) == INDEX[:100]
+    with pytest.raises(ConnectionError):
+        buffer.read()
+
+
+def test_stream_buffer_close_releases_the_download():
+    # the parser gave up after the first chunk, the download thread must not stay blocked on the full queue
+    buffer = catalog_index.StreamBuffer(chunked(INDEX, 1), max_chunks=1)
+    buffer.read(1)
+    closed = threading.Thread(target=buffer.close)
+    closed.start()
+    closed.join(5)
+    assert not closed.is_alive()
+    assert not buffer.thread.is_alive()
+
+
+def test_divide_iter_by_chunksize():
+    assert list(catalog_index.divide_iter_by_chunksize(iter(range(5)), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(catalog_index.divide_iter_by_chunksize([], 2)) == []
+
+
+def test_catalog_row():
+    row = next(catalog_index.iter_catalog_index(catalog_index.StreamBuffer(chunked(INDEX, 100))))
+    assert row['country_markets'] == "DE,NL"
+    assert row['model_name'] == "One"
+    assert set(row) == set(catalog_index.CATALOG_FIELDS)
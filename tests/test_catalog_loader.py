@@ -0,0 +1,202 @@
+import threading
+
+import pytest
+
+from app.icecat import blob_store
+from app.icecat import catalog_loader
+
+'''
+LoaderPool retries and failure report, and the catalog loaders against a fake BigQuery client
+'''
+
+
+def rows(count, start=0):
+    return [{"product_id": str(n), "path": "export/freexml.int/EN/{}.xml".format(n)} for n in range(start, start + count)]
+
+
+class FlakyLoad(object):
+    """
+    Load callable failing the first `failures[chunk]` attempts of a chunk, recognized by its first product_id,
+    with a False result or with an exception
+    """
+
+    def __init__(self, failures=None, raises=False):
+        self.failures = dict(failures or {})
+        self.raises = raises
+        self.attempts = {}
+        self.merged = []
+        self.lock = threading.Lock()
+
+    def __call__(self, chunk):
+        key = chunk[0]['product_id']
+        with self.lock:
+            self.attempts[key] = self.attempts.get(key, 0) + 1
+            if self.failures.get(key, 0):
+                self.failures[key] -= 1
+                if self.raises:
+                    raise ConnectionError("connection reset")
+                return False
+            self.merged.append(key)
+            return True
+
+
+@pytest.mark.parametrize("raises", [False, True])
+def test_failing_chunk_is_retried(raises):
+    load = FlakyLoad({"10": 2}, raises=raises)
+    pool = catalog_loader.LoaderPool(load, workers=2, retries=2, retry_delay=0)
+    for start in (0, 10, 20):
+        pool.put(rows(10, start))
+    assert pool.join() == 0
+    assert load.attempts == {"0": 1, "10": 3, "20": 1}
+    assert sorted(load.merged) == ["0", "10", "20"]
+    assert pool.report() == {"chunks": 3, "merged_chunks": 3, "merged_rows": 30, "failed_chunks": 0, "failed_rows": 0,
+                             "retries": 2, "failures": []}
+
+
+def test_chunk_failing_every_attempt_is_reported():
+    load = FlakyLoad({"10": 5}, raises=True)
+    pool = catalog_loader.LoaderPool(load, workers=2, retries=2, retry_delay=0)
+    pool.put(rows(10, 0))
+    pool.put(rows(5, 10))
+    assert pool.join() == 1
+    assert load.attempts["10"] == 3
+    report = pool.report()
+    assert report["merged_rows"] == 10
+    assert report["failed_rows"] == 5
+    assert report["failures"] == [{"chunk": 2, "rows": 5, "error": "ConnectionError('connection reset')"}]
+
+
+def test_load_without_retries():
+    load = FlakyLoad({"0": 1})
+    pool = catalog_loader.LoaderPool(load, retries=0, retry_delay=0)
+    pool.put(rows(3))
+    assert pool.join() == 1
+    assert load.attempts == {"0": 1}
+    assert pool.report()["failures"][0]["error"] == "load returned a failure"
+
+
+def test_parser_blocks_at_depth():
+    loading, release = threading.Event(), threading.Event()
+
+    def load(chunk):
+        loading.set()
+        return release.wait()
+
+    pool = catalog_loader.LoaderPool(load, workers=1, depth=1, retry_delay=0)
+    # one chunk loading, one waiting, the third put blocks until the worker is free again
+    pool.put(rows(1))
+    assert loading.wait(5)
+    pool.put(rows(1, 1))
+    blocked = threading.Thread(target=pool.put, args=(rows(1, 2),))
+    blocked.start()
+    blocked.join(0.2)
+    assert blocked.is_alive()
+    release.set()
+    blocked.join(5)
+    assert pool.join() == 0
+    assert pool.report()["merged_chunks"] == 3
+
+
+class FakeJob(object):
+    def __init__(self, errors=None):
+        self.errors = errors
+
+    def result(self):
+        return self
+
+
+class FakeTable(object):
+    def __init__(self, table_id):
+        self.project, self.dataset_id, self.table_id = table_id.split(".")
+
+
+class FakeClient(object):
+    """
+    bigquery.Client() keeping the temp tables, the number of MERGE queries and the load job sources
+    """
+
+    def __init__(self, insert_errors=None, load_errors=None):
+        self.insert_errors = insert_errors or []
+        self.load_errors = load_errors
+        self.tables = {}
+        self.merges = 0
+        self.loaded_uris = []
+
+    def create_table(self, table):
+        self.tables[table.table_id] = []
+        return FakeTable(catalog_loader.DATASET + "." + table.table_id)
+
+    def insert_rows_json(self, table_id, rows):
+        if self.insert_errors:
+            return self.insert_errors
+        self.tables[table_id.split(".")[-1]].extend(rows)
+        return []
+
+    def load_table_from_uri(self, uri, table_id, job_config=None):
+        self.loaded_uris.append(uri)
+        self.tables[table_id.split(".")[-1]] = []
+        return FakeJob(self.load_errors)
+
+    def query(self, query):
+        self.merges += 1
+        return FakeJob()
+
+    def delete_table(self, table_id, not_found_ok=False):
+        self.tables.pop(table_id.split(".")[-1], None)
+
+
+def test_temp_table_loader_drops_its_table():
+    client = FakeClient()
+    assert catalog_loader.TempTableChunkLoader(client).load(rows(3))
+    assert client.merges == 1
+    assert client.tables == {}
+
+    client = FakeClient(insert_errors=[{"index": 0, "errors": ["invalid"]}])
+    assert not catalog_loader.TempTableChunkLoader(client).load(rows(3))
+    assert client.merges == 0
+    assert client.tables == {}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return blob_store.LocalBlobStore(str(tmp_path))
+
+
+STAGING_URI = "gs://products/staging/catalog-1.json.gz"
+
+
+def test_batch_loader_merges_once_and_hands_out_the_staged_rows(store):
+    client = FakeClient()
+    loader = catalog_loader.BatchLoadJobLoader(client, store, STAGING_URI)
+    pool = catalog_loader.LoaderPool(loader.load, workers=1, retries=0)
+    pool.put(rows(3))
+    pool.put(rows(2, 3))
+    assert pool.join() == 0
+    merged = []
+    assert loader.finish(on_merged=merged.extend)
+    assert client.merges == 1
+    assert client.loaded_uris == [STAGING_URI]
+    assert merged == rows(5)
+    assert not store.exists(STAGING_URI)
+
+
+def test_batch_loader_failed_load_job(store):
+    client = FakeClient(load_errors=[{"message": "invalid row"}])
+    loader = catalog_loader.BatchLoadJobLoader(client, store, STAGING_URI)
+    loader.load(rows(3))
+    merged = []
+    assert not loader.finish(on_merged=merged.extend)
+    assert client.merges == 0
+    assert merged == []
+    assert not store.exists(STAGING_URI)
+    assert client.tables == {}
+
+
+def test_batch_loader_discard(store):
+    client = FakeClient()
+    loader = catalog_loader.BatchLoadJobLoader(client, store, STAGING_URI)
+    loader.load(rows(3))
+    loader.discard()
+    loader.discard()
+    assert not store.exists(STAGING_URI)
+    assert client.loaded_uris == []
@@ -0,0 +1,41 @@
+import pytest
+
+from app.icecat import catalog_index
+from app.icecat import catalog_store
+from app.icecat import icecat_search
+
+'''
+SQLiteCatalogStore, its delta sync mark, and the catalog queries of IceCatDatabase answered from it
+'''
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setenv("CATALOG_STORE", "sqlite")
+    monkeypatch.setenv("CATALOG_STORE_PATH", str(tmp_path / "catalog.sqlite3"))
+    store = catalog_store.get_catalog_store()
+    store.upsert_categories([{"category_id": "151", "category_name": "Notebooks", "parent_cat_id": "1", "description": ""}])
+    return store
+
+
+def test_number_of_catalogs_without_matches(store):
+    # a zero count answers like the BigQuery count(*) did
+    assert icecat_search.IceCatDatabase().getNumberOfCatalogs(["151"], []) == {
+        "count": 0, "success": "There are 0 products matches with given IDs"}
+
+
+def test_high_water_mark_persists(store):
+    assert store.high_water_mark() == ""
+    store.save_high_water_mark("daily.index.xml", "20210301120000", 2)
+    store.save_high_water_mark("files.index.xml", "20210228120000", 3)
+    # read back by the next sync, from a new connection
+    assert catalog_store.SQLiteCatalogStore(store.path).high_water_mark() == "20210301120000"
+
+
+def test_delta_rows_after_a_persisted_mark(store):
+    store.save_high_water_mark("daily.index.xml", "20210301000000", 1)
+    high_water_mark = catalog_index.HighWaterMark(store.high_water_mark())
+    rows = [{"product_id": "1", "updated": "20210228120000"}, {"product_id": "2", "updated": "20210301120000"}]
+    assert [row['product_id'] for row in high_water_mark.filter(rows)] == ["2"]
+    store.save_high_water_mark("daily.index.xml", high_water_mark.mark, 1)
+    assert list(catalog_index.HighWaterMark(store.high_water_mark()).filter(rows)) == []
@@ -0,0 +1,119 @@
+import io
+import logging
+
+import progressbar
+import pytest
+
+from app.icecat import icecat_admin
+
+'''
+IceCatCategoryFeatureList.parse_xml over a small CategoryFeaturesList
+'''
+
+CATEGORY_FEATURES = b'''<?xml version="1.0" encoding="UTF-8"?>
+<ICECAT-interface>
+  <Response ID="1" Request_ID="1" Status="1">
+    <CategoryFeaturesList Code="1">
+      <Category ID="151" Searchable="1" UNCATID="43211503" Visible="1">
+        <Name ID="1" Value="Notebooks" langid="1"/>
+        <CategoryFeatureGroup ID="10" No="1"><FeatureGroup ID="100"><Name ID="5" Value="Storage" langid="1"/></FeatureGroup></CategoryFeatureGroup>
+        <CategoryFeatureGroup ID="11" No="2"><FeatureGroup ID="101"><Name ID="6" Value="Display" langid="1"/></FeatureGroup></CategoryFeatureGroup>
+        <Feature CategoryFeatureGroup_ID="10" CategoryFeature_ID="1000" ID="1" Mandatory="0" No="1" Searchable="1" Type="numerical">
+          <Measure ID="29" Sign="GB"><Signs><Sign ID="1" langid="1"><![CDATA[GB]]></Sign><Sign ID="2" langid="4">GB</Sign></Signs></Measure>
+          <Name ID="11" Value="Total storage capacity" langid="1"/>
+          <Name ID="12" Value="Gesamtspeicherkapazitaet" langid="4"/>
+        </Feature>
+        <Feature CategoryFeatureGroup_ID="11" CategoryFeature_ID="1001" ID="2" Mandatory="0" No="2" Searchable="0" Type="numerical">
+          <Measure ID="0" Sign=""><Signs/></Measure>
+          <Name ID="13" Value="Number of colours" langid="1"/>
+        </Feature>
+        <Feature CategoryFeatureGroup_ID="11" CategoryFeature_ID="1002" ID="3" Mandatory="0" No="3" Searchable="0" Type="y_n">
+          <Measure ID="0" Sign=""/>
+          <Name ID="14" Value="Touchscreen" langid="1"/>
+          <RestrictedValue>Y</RestrictedValue><RestrictedValue>N</RestrictedValue>
+        </Feature>
+        <Feature CategoryFeatureGroup_ID="11" CategoryFeature_ID="1003" ID="4" Mandatory="0" No="4" Searchable="0" Type="range">
+          <Measure ID="30" Sign="Hz"><Signs><Sign ID="3" langid="1">Hz</Sign></Signs></Measure>
+          <Name ID="15" Value="Refresh rate (range)" langid="1"/>
+        </Feature>
+        <Feature CategoryFeatureGroup_ID="11" CategoryFeature_ID="1004" ID="5" Mandatory="0" No="5" Searchable="0" Type="dropdown">
+          <Measure ID="0" Sign=""/>
+          <Name ID="16" Value="Touchscreen" langid="1"/>
+        </Feature>
+        <ParentCategory ID="1"><Names><Name ID="7" langid="1">Computers</Name></Names></ParentCategory>
+      </Category>
+      <Category ID="152" Searchable="1" UNCATID="43211507" Visible="1">
+        <Name ID="2" Value="Tablets" langid="1"/>
+        <CategoryFeatureGroup ID="12" No="1"><FeatureGroup ID="100"><Name ID="5" Value="Storage" langid="1"/></FeatureGroup></CategoryFeatureGroup>
+        <Feature CategoryFeatureGroup_ID="12" CategoryFeature_ID="1005" ID="6" Mandatory="0" No="1" Searchable="0" Type="alphanumeric">
+          <Measure ID="0" Sign=""/>
+          <Name ID="17" Value="Storage media" langid="1"/>
+        </Feature>
+      </Category>
+    </CategoryFeaturesList>
+  </Response>
+</ICECAT-interface>'''
+
+EXPECTED = {
+    "151": {
+        "100": {
+            "total_storage_capacity": {"$ref": "https://storage.googleapis.com/schemas/atomic_uom.v3", "description": "Total storage capacity"},
+        },
+        "101": {
+            "number_of_colours": {"type": ["number", "null"], "description": "Number of colours"},
+            # the first feature of a name keeps it
+            "touchscreen": {"type": ["boolean", "null"], "default": False, "description": "Touchscreen"},
+            "refresh_rate__range_": {"$ref": "https://storage.googleapis.com/schemas/range_uom.v3", "description": "Refresh rate (range)"},
+        },
+    },
+    "152": {
+        "100": {
+            "storage_media": {"type": ["string", "null"], "description": "Storage media"},
+        },
+    },
+}
+
+
+class ChunkedReader(object):
+    """
+    File object handing out at most `size` bytes per read, so iterparse sees elements before their children
+    """
+
+    def __init__(self, data, size):
+        self.f = io.BytesIO(data)
+        self.size = size
+
+    def read(self, size=-1):
+        return self.f.read(self.size if size < 0 else min(size, self.size))
+
+
+def parse(source, lang_id="1"):
+    features = icecat_admin.IceCatCategoryFeatureList.__new__(icecat_admin.IceCatCategoryFeatureList)
+    features.key_count = 0
+    features.bar = progressbar.NullBar()
+    features.log = logging.getLogger()
+    items = features.parse_xml(source, lang_id)
+    return features, items
+
+
+@pytest.fixture(autouse=True)
+def bucket(monkeypatch):
+    monkeypatch.setenv("GOOGLE_BUCKET_NAME", "schemas")
+
+
+@pytest.mark.parametrize("size", [1, 7, 64, 1 << 16])
+def test_items(size):
+    features, items = parse(ChunkedReader(CATEGORY_FEATURES, size))
+    assert items == EXPECTED
+    assert features.key_count == 6
+
+
+def test_category_feature_group_resolved_through_dict():
+    features, items = parse(io.BytesIO(CATEGORY_FEATURES))
+    assert features.categoryfeaturegroup_matching_list == {"10": "100", "11": "101", "12": "100"}
+
+
+def test_other_language():
+    features, items = parse(io.BytesIO(CATEGORY_FEATURES), lang_id="4")
+    assert items == {"151": {"100": {"gesamtspeicherkapazitaet": {
+        "$ref": "https://storage.googleapis.com/schemas/atomic_uom.v3", "description": "Gesamtspeicherkapazitaet"}}, "101": {}}, "152": {"100": {}}}
@@ -0,0 +1,121 @@
+import json
+
+import pytest
+
+from app.icecat import category_sync
+
+'''
+TenantCategorySync against a fake Emporix category API
+'''
+
+
+class FakeResponse(object):
+    def __init__(self, body, status_code=200):
+        self.body = body
+        self.status_code = status_code
+        self.text = json.dumps(body)
+
+    def json(self):
+        return self.body
+
+
+class FakeTenant(object):
+    """
+    GET /categories and POST /categories of one tenant, pageSize capped at `max_page_size`
+    """
+
+    def __init__(self, categories=(), max_page_size=200):
+        self.categories = list(categories)
+        self.max_page_size = max_page_size
+        self.created = []
+
+    def get(self, url, params, headers):
+        if "ecn" in params:
+            return FakeResponse([category for category in self.categories if params["ecn"] in category['ecn']])
+        size = min(params["pageSize"], self.max_page_size)
+        start = (params["pageNumber"] - 1) * size
+        return FakeResponse(self.categories[start:start + size])
+
+    def post(self, url, data, headers):
+        body = json.loads(data)
+        category = {"id": "e{}".format(len(self.categories) + 1), "ecn": body['ecn'], "parentId": body['parentId']}
+        self.categories.append(category)
+        self.created.append(category)
+        return FakeResponse({"id": category['id']})
+
+
+@pytest.fixture
+def tenant(monkeypatch):
+    tenant = FakeTenant()
+    monkeypatch.setattr(category_sync.requests, "get", tenant.get)
+    monkeypatch.setattr(category_sync.requests, "post", tenant.post)
+    return tenant
+
+
+def sync(**kwargs):
+    return category_sync.TenantCategorySync("https://api.emporix.io", "tenant", {"Content-Language": "de"}, "de", "root", **kwargs)
+
+
+def existing(count):
+    return [{"id": "e{}".format(n), "ecn": [str(n)]} for n in range(1, count + 1)]
+
+
+def test_fetch_existing_pages_past_a_capped_page_size(tenant):
+    tenant.categories = existing(250)
+    tenant.max_page_size = 100
+    found = sync(page_size=200).fetch_existing()
+    assert len(found) == 250
+    assert found["250"] == "e250"
+
+
+def test_fetch_existing_stops_when_pages_repeat(tenant, monkeypatch):
+    # a tenant ignoring pageNumber answers the first page again
+    tenant.categories = existing(3)
+    monkeypatch.setattr(category_sync.requests, "get", lambda url, params, headers: FakeResponse(tenant.categories))
+    syncer = sync(page_size=2)
+    assert syncer.fetch_existing() == {"1": "e1", "2": "e2", "3": "e3"}
+    assert syncer.requests == 2
+
+
+def test_fetch_existing_error(tenant, monkeypatch):
+    monkeypatch.setattr(category_sync.requests, "get", lambda url, params, headers: FakeResponse({"message": "forbidden"}, 403))
+    assert sync().fetch_existing() is None
+
+
+CATEGORIES = [
+    {"categoryID": "10", "Name": "Computers", "parentCategoryId": "1"},
+    {"categoryID": "151", "Name": "Notebooks", "parentCategoryId": "10"},
+    {"categoryID": "152", "Name": "Tablets", "parentCategoryId": "10"},
+]
+
+
+def test_sync_creates_only_missing_categories_parents_first(tenant):
+    tenant.categories = existing(3) + [{"id": "computers", "ecn": ["10"]}]
+    tenant.max_page_size = 2
+    injected, assignmented, imported, error = sync(page_size=200).sync(CATEGORIES)
+    assert error is None
+    assert imported == ["151", "152"]
+    assert [category['ecn'] for category in tenant.created] == [["151"], ["152"]]
+    # the children hang below the category that was already in the tenant
+    assert {category['parentId'] for category in tenant.created} == {"computers"}
+    assert assignmented == {"10": "computers", "151": tenant.created[0]['id'], "152": tenant.created[1]['id']}
+    assert [category['IsRequest'] for category in injected] == [False, True, True]
+
+
+def test_second_sync_creates_nothing(tenant):
+    sync().sync(CATEGORIES)
+    assert [category['ecn'] for category in tenant.created] == [["10"], ["151"], ["152"]]
+    assert tenant.created[0]['parentId'] == "root"
+    injected, assignmented, imported, error = sync().sync(CATEGORIES)
+    assert imported == []
+    assert len(tenant.created) == 3
+
+
+def test_sync_falls_back_to_lookup_when_listing_fails(tenant, monkeypatch):
+    tenant.categories = [{"id": "computers", "ecn": ["10"]}]
+    get = tenant.get
+    monkeypatch.setattr(category_sync.requests, "get",
+                        lambda url, params, headers: get(url, params, headers) if "ecn" in params else FakeResponse({}, 500))
+    injected, assignmented, imported, error = sync().sync(CATEGORIES)
+    assert assignmented["10"] == "computers"
+    assert imported == ["151", "152"]
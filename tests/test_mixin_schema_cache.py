@@ -0,0 +1,173 @@
+import json
+
+import pytest
+
+from app.icecat import blob_store
+from app.icecat import mixin_schema_cache
+
+'''
+MixinSchemaCache over a LocalBlobStore, and the compile_schema() converters against the former parseMixin branches
+'''
+
+SCHEMA = {"properties": {"weight": {"type": ["number"]}}}
+
+
+class FlakyBlobStore(blob_store.LocalBlobStore):
+    """
+    LocalBlobStore whose next `failures` reads raise like a dropped bucket connection
+    """
+
+    def __init__(self, root):
+        super().__init__(root)
+        self.failures = 0
+        self.reads = 0
+
+    def open(self, path, mode='rb'):
+        if 'r' in mode:
+            self.reads += 1
+            if self.failures:
+                self.failures -= 1
+                raise ConnectionError("connection reset")
+        return super().open(path, mode)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return FlakyBlobStore(str(tmp_path))
+
+
+def write_schema(store, key, schema=SCHEMA):
+    store.write("gs://schemas/" + key + ".json", json.dumps(schema).encode('utf-8'))
+
+
+def test_get_loads_once(store):
+    write_schema(store, "notebooks-weight")
+    cache = mixin_schema_cache.MixinSchemaCache(store=store, bucket="schemas")
+    assert cache.get("notebooks-weight") == {"weight": mixin_schema_cache.number_value}
+    assert cache.get("notebooks-weight") is cache.get("notebooks-weight")
+    assert store.reads == 1
+    assert cache.get_stats()["hits"] == 2
+
+
+def test_missing_schema_is_remembered_for_missing_ttl(store, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(mixin_schema_cache.time, "monotonic", lambda: now[0])
+    cache = mixin_schema_cache.MixinSchemaCache(store=store, bucket="schemas", missing_ttl=60)
+    with pytest.raises(KeyError):
+        cache.get("notebooks-weight")
+    # written by makeMixin on another instance
+    write_schema(store, "notebooks-weight")
+    with pytest.raises(KeyError):
+        cache.get("notebooks-weight")
+    # looked up once, the second get is answered from the cache
+    assert store.reads == 1
+    now[0] += 61
+    assert cache.get("notebooks-weight") == {"weight": mixin_schema_cache.number_value}
+
+
+def test_read_error_is_not_cached(store):
+    write_schema(store, "notebooks-weight")
+    store.failures = 1
+    cache = mixin_schema_cache.MixinSchemaCache(store=store, bucket="schemas")
+    with pytest.raises(KeyError):
+        cache.get("notebooks-weight")
+    assert "notebooks-weight" not in cache.snapshot()
+    assert cache.get("notebooks-weight") == {"weight": mixin_schema_cache.number_value}
+    assert store.reads == 2
+    assert cache.get_stats()["errors"] == 1
+
+
+def test_preload_skips_read_errors(store):
+    write_schema(store, "notebooks-weight")
+    write_schema(store, "notebooks-display")
+    store.failures = 1
+    cache = mixin_schema_cache.MixinSchemaCache(store=store, bucket="schemas", workers=1)
+    cache.preload_categories(["notebooks"])
+    assert len(cache.snapshot()) == 1
+    cache.preload_categories(["notebooks"])
+    assert len(cache.snapshot()) == 2
+
+
+def test_least_recently_used_out(store):
+    for key in ("a-x", "b-x", "c-x"):
+        write_schema(store, key)
+    cache = mixin_schema_cache.MixinSchemaCache(store=store, bucket="schemas", max_entries=2)
+    cache.get("a-x")
+    cache.get("b-x")
+    cache.get("a-x")
+    cache.get("c-x")
+    assert list(cache.snapshot()) == ["a-x", "c-x"]
+    assert cache.get_stats()["evictions"] == 1
+
+
+def legacy_value(feature_schema_detail, product_feature):
+    # the former parseMixin branches, SKIP where they left the feature out of the mixin
+    if feature_schema_detail.get('$ref') != None:
+        ref = feature_schema_detail['$ref']
+        localValue = product_feature.get('LocalValue').get('Value')
+        sign = product_feature.get('Feature').get("Measure").get('Signs')
+        if sign == None:
+            uom = ""
+        else:
+            uom = sign.get('Sign').get('#text')
+        if uom == "":
+            presentationValue= product_feature.get('Presentation_Value')
+            uom = presentationValue.split(localValue)[1].strip()
+        if "atomic_uom" in ref:
+            return {"value" : float(localValue), "uom" : uom}
+        splitString = localValue.split('-')
+        if len(splitString) != 2:
+            return {"firstValue" : float(splitString[0].strip()), "toValue": 1 , "uom" : uom}
+        return mixin_schema_cache.SKIP
+    if feature_schema_detail['type'][0] == "string":
+        return product_feature.get('Presentation_Value')
+    elif feature_schema_detail['type'][0] == "number":
+        return int(product_feature.get('Presentation_Value'))
+    return True if product_feature.get('Presentation_Value') == "Y" else False
+
+
+def product_feature(presentation, local=None, sign=None):
+    measure = {"ID": "29", "Signs": {"Sign": {"ID": "1", "langid": "1", "#text": sign}}} if sign is not None else {"ID": "0"}
+    return {"Presentation_Value": presentation, "LocalValue": {"Value": local if local is not None else presentation},
+            "Feature": {"ID": "1", "Measure": measure, "Name": {"ID": "2", "Value": "Feature"}}}
+
+
+ATOMIC = {"$ref": "#/definitions/atomic_uom"}
+RANGE = {"$ref": "#/definitions/range_uom"}
+
+
+@pytest.mark.parametrize("detail, feature", [
+    (ATOMIC, product_feature("512 GB", "512", "GB")),
+    (ATOMIC, product_feature("15.6 \"", "15.6", "")),
+    (ATOMIC, product_feature("2.1 kg", "2.1")),
+    (RANGE, product_feature("100 - 240 V", "100 - 240", "V")),
+    (RANGE, product_feature("45 W", "45", "W")),
+    (RANGE, product_feature("45 W", "45")),
+    ({"type": ["string", "null"]}, product_feature("Intel Core i7")),
+    ({"type": ["number"]}, product_feature("16")),
+    ({"type": ["boolean"]}, product_feature("Y")),
+    ({"type": ["boolean"]}, product_feature("N")),
+])
+def test_compiled_converters_match_parse_mixin(detail, feature):
+    converters = mixin_schema_cache.compile_schema({"properties": {"feature": detail}})
+    assert converters["feature"](feature) == legacy_value(detail, feature)
+
+
+@pytest.mark.parametrize("detail, feature", [
+    ({"type": ["number"]}, product_feature("16.5")),
+    (ATOMIC, product_feature("n/a")),
+    (ATOMIC, product_feature("2 kg", "3")),
+])
+def test_compiled_converters_raise_like_parse_mixin(detail, feature):
+    converters = mixin_schema_cache.compile_schema({"properties": {"feature": detail}})
+    with pytest.raises(Exception) as legacy:
+        legacy_value(detail, feature)
+    with pytest.raises(legacy.type):
+        converters["feature"](feature)
+
+
+def test_compile_schema_leaves_out_unknown_properties():
+    converters = mixin_schema_cache.compile_schema({"properties": {
+        "weight": {"type": ["number"]}, "empty": {}, "no_type": {"type": []}, "other": {"type": ["object"]}}})
+    assert converters == {"weight": mixin_schema_cache.number_value, "other": mixin_schema_cache.boolean_value}
+    assert mixin_schema_cache.compile_schema({}) == {}
@@ -0,0 +1,79 @@
+import json
+
+import pytest
+
+from app.icecat import blob_store
+from app.icecat import icecat_product
+from app.icecat import mixin_schema_cache
+from app.icecat import product_detail_cache
+from bench._product_xml import mixin_schemas, product_xml
+
+'''
+ProductDetailCache over a LocalBlobStore, which parsed details adding_detail_worker may cache, and the detail_process_pool() workers
+'''
+
+
+@pytest.fixture
+def store(tmp_path):
+    return blob_store.LocalBlobStore(str(tmp_path))
+
+
+@pytest.fixture
+def schema_cache(store, monkeypatch):
+    monkeypatch.setenv("GOOGLE_BUCKET_NAME", "schemas")
+    cache = mixin_schema_cache.MixinSchemaCache(store=store, bucket="schemas")
+    monkeypatch.setattr(mixin_schema_cache, "_cache", cache)
+    return cache
+
+
+def test_get_many_counts_products_not_rows(store):
+    cache = product_detail_cache.ProductDetailCache("EN", store=store, root="gs://products/product_details")
+    cache.put("1", "20210301", {"eans": ["1"]})
+    cache = product_detail_cache.ProductDetailCache("EN", store=store, root="gs://products/product_details")
+    # a product can be in the catalog under more than one path
+    rows = [{"product_id": "1", "updated": "20210301", "path": "a/1.xml"}, {"product_id": "1", "updated": "20210301", "path": "b/1.xml"},
+            {"product_id": "2", "updated": "20210301", "path": "a/2.xml"}, {"product_id": "2", "updated": "20210301", "path": "b/2.xml"}]
+    assert cache.get_many(rows) == {"1": {"eans": ["1"]}}
+    assert cache.get_stats()["hits"] == 1
+    assert cache.get_stats()["misses"] == 1
+
+
+def test_schema_version_separates_entries(store):
+    cache = product_detail_cache.ProductDetailCache("EN", schema_version="a", store=store, root="gs://products/product_details")
+    cache.put("1", "20210301", {"eans": ["1"]})
+    rows = [{"product_id": "1", "updated": "20210301"}]
+    assert product_detail_cache.ProductDetailCache("EN", schema_version="a", store=store, root="gs://products/product_details").get_many(rows)
+    assert not product_detail_cache.ProductDetailCache("EN", schema_version="b", store=store, root="gs://products/product_details").get_many(rows)
+
+
+def test_schema_version_follows_the_manifest(store, schema_cache):
+    assert schema_cache.schema_version() == "none"
+    store.write("gs://schemas/" + mixin_schema_cache.MANIFEST, json.dumps({"gs://schemas/a-b.json": "1"}).encode('utf-8'))
+    first = schema_cache.schema_version()
+    store.write("gs://schemas/" + mixin_schema_cache.MANIFEST, json.dumps({"gs://schemas/a-b.json": "2"}).encode('utf-8'))
+    assert first != schema_cache.schema_version() != "none"
+
+
+def test_parse_counts_mixin_errors(store, schema_cache):
+    details, mixin_errors = icecat_product.parse_product_details(None, product_xml(1, features=8), [])
+    # no schema in the bucket yet, every feature failed and the details must not be cached
+    assert mixin_errors == 8
+    assert details["mixins"] == {}
+
+    for key, schema in mixin_schemas(8).items():
+        store.write("gs://schemas/" + key + ".json", json.dumps(schema).encode('utf-8'))
+    schema_cache.clear()
+    details, mixin_errors = icecat_product.parse_product_details(None, product_xml(1, features=8), [])
+    assert mixin_errors == 0
+    assert details["mixins"]
+
+
+@pytest.mark.parametrize("start_method", ["forkserver", "spawn"])
+def test_detail_process_pool_starts_every_worker(start_method):
+    # a task finding no idle worker starts one more, the pool is handed out with all of them running
+    pool = icecat_product.detail_process_pool(3, start_method)
+    try:
+        assert len(pool._processes) == 3
+        assert all(process.is_alive() for process in pool._processes.values())
+    finally:
+        pool.shutdown()
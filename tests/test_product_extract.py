@@ -0,0 +1,95 @@
+import io
+import json
+import xml.etree.cElementTree as ET
+
+import pytest
+import xmltodict
+
+from app.icecat.product_extract import PRODUCT_KEYS, extract_product
+
+'''
+extract_product() against the xmltodict parse IceCatProductDetails used before, limited to PRODUCT_KEYS
+'''
+
+PRODUCT = b'''<?xml version="1.0" encoding="UTF-8"?>
+<ICECAT-interface>
+  <Product ID="42" Prod_id="PN-42" ReleaseDate="2021-03-01" Title="Notebook &amp; bag">
+    <Category ID="151"><Name ID="1" Value="Notebooks" langid="1"/></Category>
+    <EANCode EAN="0001"/>
+    <ProductRelated ID="1"><Product ID="7" Prod_id="PN-7"/></ProductRelated>
+    <EANCode EAN="0002"/>
+    <ReleaseDate>2021-04-01</ReleaseDate>
+    <SummaryDescription>
+      <ShortSummaryDescription langid="1"><![CDATA[Short <b>summary</b> & more]]></ShortSummaryDescription>
+      <LongSummaryDescription langid="1">Long <b>bold</b> middle <i>it</i> tail</LongSummaryDescription>
+    </SummaryDescription>
+    <ReasonsToBuy>
+      <ReasonToBuy ID="1" Value="Fast"><![CDATA[one]]> and <![CDATA[two]]></ReasonToBuy>
+      <ReasonToBuy ID="2" Value="Light"/>
+    </ReasonsToBuy>
+    <EANCode EAN="0003"/>
+    <EndOfLifeDate><Date Value="2030-01-01"/></EndOfLifeDate>
+    <GeneratedIntTitle/>
+    <ProductDescription ID="9" LongDesc="Long&#10;text" langid="1"/>
+    <ProductMultimediaObject><MultimediaObject ID="5" URL="https://objects.icecat.biz/5.pdf"/></ProductMultimediaObject>
+  </Product>
+</ICECAT-interface>'''
+
+
+def xmltodict_product(xml):
+    product = xmltodict.parse(xml, attr_prefix='')['ICECAT-interface']['Product']
+    attributes = ET.fromstring(xml).find('Product').attrib
+    return {key: value for key, value in product.items() if key in PRODUCT_KEYS or key in attributes}
+
+
+def assert_same(xml):
+    # compared as JSON too, so the key order IceCatProductDetails sees is the same
+    extracted = extract_product(xml)
+    expected = xmltodict_product(xml)
+    assert extracted == expected
+    assert json.dumps(extracted) == json.dumps(expected)
+
+
+def test_product_matches_xmltodict():
+    assert_same(PRODUCT)
+
+
+def test_cdata_and_mixed_content():
+    product = extract_product(PRODUCT)
+    assert product['SummaryDescription']['ShortSummaryDescription']['#text'] == "Short <b>summary</b> & more"
+    assert product['SummaryDescription']['LongSummaryDescription'] == {"langid": "1", "b": "bold", "i": "it", "#text": "Long  middle  tail"}
+    assert product['ReasonsToBuy']['ReasonToBuy'][0]['#text'] == "one and two"
+
+
+def test_release_date_attribute_and_child():
+    assert extract_product(PRODUCT)['ReleaseDate'] == ["2021-03-01", "2021-04-01"]
+
+
+def test_repeated_ean_code():
+    assert extract_product(PRODUCT)['EANCode'] == [{"EAN": "0001"}, {"EAN": "0002"}, {"EAN": "0003"}]
+    single = PRODUCT.replace(b'<EANCode EAN="0002"/>', b'').replace(b'<EANCode EAN="0003"/>', b'')
+    assert extract_product(single)['EANCode'] == {"EAN": "0001"}
+    assert_same(single)
+
+
+def test_unused_children_are_left_out():
+    product = extract_product(PRODUCT)
+    assert 'ProductRelated' not in product
+    assert 'ProductMultimediaObject' not in product
+
+
+def test_keys():
+    assert extract_product(PRODUCT, keys={'EANCode'}) == {
+        "ID": "42", "Prod_id": "PN-42", "ReleaseDate": "2021-03-01", "Title": "Notebook & bag",
+        "EANCode": [{"EAN": "0001"}, {"EAN": "0002"}, {"EAN": "0003"}]}
+
+
+def test_file_object():
+    assert extract_product(io.BytesIO(PRODUCT)) == extract_product(PRODUCT)
+
+
+def test_missing_product():
+    with pytest.raises(KeyError):
+        extract_product(b'<ICECAT-interface><Product_Error/></ICECAT-interface>')
+    with pytest.raises(KeyError):
+        extract_product(b'<Other><Product ID="1"/></Other>')